@@ -0,0 +1,10 @@
+from django.conf import settings
+
+def face_capture(request):
+    """Client-side frame capture settings used by the facial recognition pages"""
+    return {
+        'upload_max_side': settings.FACE_UPLOAD_MAX_SIDE,
+        'upload_jpeg_quality': settings.FACE_UPLOAD_JPEG_QUALITY,
+        'roi_fast_path': settings.FACE_ROI_FAST_PATH,
+        'roi_padding': settings.FACE_ROI_PADDING,
+    }
@@ -0,0 +1,69 @@
+"""
+Django management command to build the approximate nearest-neighbour face index.
+"""
+
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from facial_recognition.ann_index import IVFIndex, INDEX_FILENAME, benchmark_index
+from facial_recognition.embedding_index import EmbeddingIndex, normalize
+from facial_recognition.embedding_store import EmbeddingStore
+from facial_recognition.registry import get_setting, DEFAULT_DB_PATH
+
+class Command(BaseCommand):
+    help = 'Builds (or rebuilds) the IVF index used for large-scale face identification'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-path', default=None, help='Face database directory (defaults to FACE_DB_PATH)')
+        parser.add_argument('--lists', type=int, default=None, help='Number of IVF lists (default: sqrt of the number of faces)')
+        parser.add_argument('--probe', type=int, default=8, help='Default number of lists scanned per query')
+        parser.add_argument('--iterations', type=int, default=20, help='Number of k-means iterations')
+        parser.add_argument('--report', action='store_true', help='Print a recall/latency report after building')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries used for the report')
+        parser.add_argument('--noise', type=float, default=0.3, help='Relative noise added to stored faces to simulate new captures')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours used for recall@k in the report')
+
+    def handle(self, *args, **options):
+        db_path = options['db_path'] or get_setting('FACE_DB_PATH', DEFAULT_DB_PATH)
+        store = EmbeddingStore(db_path)
+        if len(store) == 0:
+            raise CommandError(f'No face embeddings found in {db_path}')
+
+        exact_index = EmbeddingIndex()
+        for user_id, embedding in store.items():
+            exact_index.set(user_id, embedding)
+
+        start = time.perf_counter()
+        ann_index = IVFIndex.build(exact_index, n_lists=options['lists'],
+                                   n_probe=options['probe'], n_iter=options['iterations'])
+        build_seconds = time.perf_counter() - start
+
+        index_path = os.path.join(db_path, INDEX_FILENAME)
+        ann_index.save(index_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built IVF index with {ann_index.n_lists} lists over {len(ann_index)} faces '
+            f'in {build_seconds:.2f}s: {index_path}'
+        ))
+        self.stdout.write('Running workers switch to the new index before their next lookup.')
+
+        if options['report']:
+            self._report(ann_index, exact_index, options)
+
+    def _report(self, ann_index, exact_index, options):
+        rng = np.random.default_rng(0)
+        matrix = exact_index.matrix
+        rows = rng.choice(matrix.shape[0], min(options['queries'], matrix.shape[0]), replace=False)
+
+        # Perturb stored faces so queries behave like fresh captures of enrolled voters
+        noise = rng.normal(size=(rows.size, matrix.shape[1])).astype(np.float32)
+        queries = normalize(matrix[rows] + options['noise'] * normalize(noise))
+
+        self.stdout.write(f"\nRecall@{options['k']} and mean latency per query ({rows.size} queries):")
+        self.stdout.write(f"{'n_probe':>8} {'recall':>8} {'ann ms':>8} {'exact ms':>9}")
+        for result in benchmark_index(ann_index, exact_index, queries, k=options['k']):
+            self.stdout.write(
+                f"{result['n_probe']:>8} {result['recall']:>8.3f} {result['ann_ms']:>8.3f} {result['exact_ms']:>9.3f}"
+            )
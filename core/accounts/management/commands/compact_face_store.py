@@ -0,0 +1,35 @@
+"""
+Django management command to compact the face embedding store.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+from facial_recognition.embedding_store import EmbeddingStore
+from facial_recognition.face_database import TEMPLATES_DIRNAME
+from facial_recognition.registry import get_setting, DEFAULT_DB_PATH
+
+class Command(BaseCommand):
+    help = 'Rewrites the face embedding store without superseded and deleted rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-path', default=None, help='Face database directory (defaults to FACE_DB_PATH)')
+
+    def handle(self, *args, **options):
+        db_path = options['db_path'] or get_setting('FACE_DB_PATH', DEFAULT_DB_PATH)
+
+        # Compact the centroid store and the per-user template store
+        stores = [('Face store', EmbeddingStore(db_path))]
+        templates_path = os.path.join(db_path, TEMPLATES_DIRNAME)
+        if os.path.exists(templates_path):
+            stores.append(('Template store', EmbeddingStore(templates_path,
+                                                            dtype=get_setting('FACE_TEMPLATE_DTYPE', 'float16'))))
+
+        for name, store in stores:
+            self.stdout.write(f'{name} at {store.db_path}: {len(store)} users, {store.dead_rows} dead rows')
+
+            dropped = store.compact()
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Compacted {name.lower()} to generation {store.generation} ({dropped} dead rows removed).'
+            ))
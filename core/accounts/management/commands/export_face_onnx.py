@@ -0,0 +1,86 @@
+"""
+Django management command to export the face embedding model to ONNX for the onnx backend.
+"""
+
+import glob
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from facial_recognition.registry import get_setting, DEFAULT_ONNX_MODEL_PATH
+
+class Command(BaseCommand):
+    help = 'Exports InceptionResNetV1 to ONNX (optionally int8-quantized) and checks it against PyTorch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Model path to write (defaults to FACE_ONNX_MODEL_PATH)')
+        parser.add_argument('--no-quantize', action='store_true', help='Keep fp32 weights instead of quantizing to int8')
+        parser.add_argument('--opset', type=int, default=13, help='ONNX opset version')
+        parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime intra-op threads for the check (defaults to FACE_ONNX_THREADS)')
+        parser.add_argument('--samples', type=int, default=32, help='Maximum number of faces used for the parity check')
+        parser.add_argument('--images', nargs='*', default=None,
+                            help='Face photos for the parity check (defaults to the candidate photos in MEDIA_ROOT)')
+        parser.add_argument('--tolerance', type=float, default=0.99, help='Minimum cosine similarity to the PyTorch embeddings')
+
+    def handle(self, *args, **options):
+        try:
+            from facial_recognition.onnx_face_recognition import (
+                compare_with_torch, create_session, export_model, load_face_samples, quantize_model,
+                standardized_sample,
+            )
+        except ImportError as e:
+            raise CommandError(f'ONNX export needs torch, facenet_pytorch, onnx and onnxruntime: {e}')
+
+        output = options['output'] or get_setting('FACE_ONNX_MODEL_PATH', DEFAULT_ONNX_MODEL_PATH)
+        threads = options['threads'] or get_setting('FACE_ONNX_THREADS', None)
+
+        # The model is written next to the live one and only moved into place once it passes the parity
+        # check, so the onnx backend never loads a model that drifts from PyTorch
+        staging_path = f'{os.path.splitext(output)[0]}.staging.onnx'
+
+        # Export fp32 first; quantization reads it and writes the final model
+        fp32_path = staging_path if options['no_quantize'] else f'{os.path.splitext(output)[0]}.fp32.onnx'
+        torch_model = export_model(fp32_path, opset=options['opset'])
+        self.stdout.write(f'Exported fp32 model: {fp32_path}')
+
+        if not options['no_quantize']:
+            quantize_model(fp32_path, staging_path)
+            self.stdout.write(f'Quantized model to int8: {staging_path}')
+
+        # Real faces, aligned and standardized exactly as at inference time
+        images = options['images']
+        if images is None:
+            images = sorted(glob.glob(os.path.join(settings.MEDIA_ROOT, 'candidate_photos', '*')))
+        faces = load_face_samples(images, limit=options['samples'])
+        if len(faces) == 0:
+            self.stdout.write(self.style.WARNING(
+                'No faces found in the sample images; checking on standardized random images instead'
+            ))
+            faces = standardized_sample(options['samples'])
+
+        candidates = [('fp32', fp32_path)]
+        if not options['no_quantize']:
+            candidates.append(('int8', staging_path))
+
+        self.stdout.write(f"\nParity and latency against PyTorch ({len(faces)} faces):")
+        self.stdout.write(f"{'model':>6} {'batch':>6} {'min cos':>8} {'mean cos':>9} {'torch ms':>9} {'onnx ms':>8}")
+        worst = 1.0
+        for label, path in candidates:
+            session = create_session(path, threads)
+            for batch_size in (1, 8):
+                result = compare_with_torch(torch_model, session, faces, batch_size=batch_size)
+                worst = min(worst, result['min_cosine'])
+                self.stdout.write(
+                    f"{label:>6} {batch_size:>6} {result['min_cosine']:>8.4f} {result['mean_cosine']:>9.4f} "
+                    f"{result['torch_ms']:>9.2f} {result['onnx_ms']:>8.2f}"
+                )
+
+        if worst < options['tolerance']:
+            os.remove(staging_path)
+            raise CommandError(
+                f"Embeddings drift from PyTorch (min cosine {worst:.4f} < {options['tolerance']}); "
+                f"{output} was left unchanged. Keep FACE_BACKEND on the PyTorch backend or export with --no-quantize"
+            )
+
+        os.replace(staging_path, output)
+        self.stdout.write(self.style.SUCCESS(f"\nModel is within tolerance. Set FACE_BACKEND=onnx to use {output}."))
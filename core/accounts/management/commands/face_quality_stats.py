@@ -0,0 +1,30 @@
+"""
+Django management command to report how many frames the quality gate rejected before face detection.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+from facial_recognition.quality import read_stats, quality_stats_path
+
+class Command(BaseCommand):
+    help = 'Reports the frames rejected by the face quality gate (and the inference runs saved) across all workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the counters after reporting them')
+
+    def handle(self, *args, **options):
+        path = quality_stats_path()
+        stats = read_stats(path)
+
+        self.stdout.write(f"Frames checked:  {stats['checked']}")
+        self.stdout.write(
+            f"Frames rejected: {stats['rejected']} ({stats['rejected_fraction']:.1%}), "
+            f"each one a detection and embedding run saved"
+        )
+        for reason, count in sorted(stats['rejections'].items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  {reason:<14} {count}")
+
+        if options['reset'] and os.path.exists(path):
+            os.remove(path)
+            self.stdout.write(self.style.SUCCESS(f'Cleared {path}'))
@@ -0,0 +1,47 @@
+"""
+Django management command to compare compact embedding formats with float32.
+"""
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from facial_recognition.embedding_index import normalize
+from facial_recognition.embedding_store import EmbeddingStore
+from facial_recognition.quantization import SUPPORTED_DTYPES, drift_report
+from facial_recognition.registry import get_setting, DEFAULT_DB_PATH
+
+class Command(BaseCommand):
+    help = 'Reports similarity drift, ranking agreement, size and speed of float16/int8 face embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-path', default=None, help='Face database directory (defaults to FACE_DB_PATH)')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+        parser.add_argument('--noise', type=float, default=0.3, help='Relative noise added to stored faces to simulate new captures')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours used for recall@k')
+
+    def handle(self, *args, **options):
+        db_path = options['db_path'] or get_setting('FACE_DB_PATH', DEFAULT_DB_PATH)
+        store = EmbeddingStore(db_path)
+        if len(store) == 0:
+            raise CommandError(f'No face embeddings found in {db_path}')
+
+        matrix = normalize(np.stack([embedding for _, embedding in store.items()]))
+
+        # Perturb stored faces so queries behave like fresh captures of enrolled voters
+        rng = np.random.default_rng(0)
+        rows = rng.choice(matrix.shape[0], min(options['queries'], matrix.shape[0]), replace=False)
+        noise = rng.normal(size=(rows.size, matrix.shape[1])).astype(np.float32)
+        queries = normalize(matrix[rows] + options['noise'] * normalize(noise))
+
+        self.stdout.write(f"{matrix.shape[0]} faces of dimension {matrix.shape[1]}, {rows.size} queries\n")
+        self.stdout.write(
+            f"{'dtype':>8} {'bytes/face':>10} {'max err':>9} {'mean err':>9} {'top-1':>7} "
+            f"{'recall@' + str(options['k']):>9} {'ms/query':>9}"
+        )
+        for result in drift_report(matrix, queries, SUPPORTED_DTYPES, k=options['k']):
+            self.stdout.write(
+                f"{result['dtype']:>8} {result['bytes_per_vector']:>10} {result['max_error']:>9.5f} "
+                f"{result['mean_error']:>9.5f} {result['top1_agreement']:>7.3f} {result['recall']:>9.3f} "
+                f"{result['ms_per_query']:>9.3f}"
+            )
+
+        self.stdout.write('\nSet FACE_EMBEDDING_DTYPE to the smallest format whose drift is acceptable.')
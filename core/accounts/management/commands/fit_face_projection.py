@@ -0,0 +1,41 @@
+"""
+Django management command to fit a PCA projection on the enrolled face embeddings.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from facial_recognition.embedding_index import normalize
+from facial_recognition.embedding_store import EmbeddingStore
+from facial_recognition.face_database import fit_projection
+from facial_recognition.registry import get_setting, DEFAULT_DB_PATH
+
+class Command(BaseCommand):
+    help = 'Fits a PCA projection on the enrolled face embeddings and projects the face database with it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-path', default=None, help='Face database directory (defaults to FACE_DB_PATH)')
+        parser.add_argument('--dim', type=int, default=None, help='Output dimension (defaults to FACE_PROJECTION_DIM)')
+        parser.add_argument('--whiten', action='store_true', help='Scale each component to unit variance')
+
+    def handle(self, *args, **options):
+        db_path = options['db_path'] or get_setting('FACE_DB_PATH', DEFAULT_DB_PATH)
+        dim = options['dim'] or get_setting('FACE_PROJECTION_DIM', 256)
+
+        # Keep the raw vectors for the explained-variance report; the store is rewritten below
+        raw = EmbeddingStore(db_path)
+        raw_matrix = [normalize(embedding) for _, embedding in raw.items()]
+
+        try:
+            projection, samples = fit_projection(db_path, dim, whiten=options['whiten'],
+                                                 template_dtype=get_setting('FACE_TEMPLATE_DTYPE', 'float16'))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fitted projection {projection.version} ({projection.input_dim} -> {projection.output_dim}) '
+            f'on {samples} embeddings; kept {projection.explained_variance(raw_matrix):.1%} of the variance '
+            f'of the stored vectors.'
+        ))
+        self.stdout.write(
+            'The face database was rewritten with projected vectors and any IVF index was removed. '
+            'Restart the face workers (and rerun build_face_index if it is used).'
+        )
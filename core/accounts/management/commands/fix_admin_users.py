@@ -5,7 +5,7 @@ Django management command to fix admin users by ensuring they are not voters.
 from django.core.management.base import BaseCommand
 from accounts.models import User
 from voting.models import VotingVoter, Vote
-import os
+from facial_recognition import get_recognizer
 
 class Command(BaseCommand):
     help = 'Fixes admin users by ensuring they are not voters'
@@ -24,6 +24,11 @@ class Command(BaseCommand):
             # Set is_voter to False
             admin.is_voter = False
             
+            # Remove facial recognition data from the shared face database
+            if admin.has_face_data and admin.voter_id:
+                if get_recognizer().remove_face(admin.voter_id):
+                    self.stdout.write(f'Removed facial recognition data for voter ID {admin.voter_id}')
+
             # Clear facial recognition data
             admin.has_face_data = False
             admin.face_samples_count = 0
@@ -49,12 +54,4 @@ class Command(BaseCommand):
                 votes.delete()
                 self.stdout.write(f'Removed {count} votes cast by admin.')
             
-            # Remove facial recognition data file if it exists
-            face_db_path = os.path.join('media', 'facial_recognition', 'face_db')
-            if os.path.exists(face_db_path):
-                face_file = os.path.join(face_db_path, f"{admin.username}.npy")
-                if os.path.exists(face_file):
-                    os.remove(face_file)
-                    self.stdout.write(f'Removed facial recognition data file: {face_file}')
-            
             self.stdout.write(self.style.SUCCESS(f'Admin user {admin.username} fixed successfully.'))
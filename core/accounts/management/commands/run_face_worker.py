@@ -0,0 +1,38 @@
+"""
+Django management command to run the face inference server.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from facial_recognition.registry import create_local_recognizer, get_setting, get_worker_authkey
+from facial_recognition.worker import FaceWorkerServer
+
+class Command(BaseCommand):
+    help = 'Runs the face inference server that owns the face models and database for all web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None, help='Unix socket path (defaults to FACE_WORKER_SOCKET)')
+        parser.add_argument('--concurrency', type=int, default=1, help='Maximum number of inference calls running at once')
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or get_setting('FACE_WORKER_SOCKET', None)
+        if not socket_path:
+            raise CommandError('No socket path given. Use --socket or set FACE_WORKER_SOCKET.')
+
+        self.stdout.write('Loading facial recognition models...')
+        recognizer = create_local_recognizer()
+        info = recognizer.get_info()
+        self.stdout.write(f"Using {info['backend']} with {info['registered_faces']} registered faces")
+
+        server = FaceWorkerServer(recognizer, socket_path, get_worker_authkey(),
+                                  concurrency=options['concurrency'])
+
+        self.stdout.write(self.style.SUCCESS(f'Face worker listening on {socket_path}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Shutting down face worker...')
+        finally:
+            server.stop()
+            close = getattr(recognizer, 'close', None)
+            if callable(close):
+                close()
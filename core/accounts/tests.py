@@ -1,3 +1,315 @@
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from PIL import Image
+import io
+import numpy as np
+import shutil
+import tempfile
 
-# Create your tests here.
+from accounts.models import User
+from facial_recognition.pipeline import FaceAnalysis
+from facial_recognition.quality import get_quality_gate, shutdown_quality_gate
+from voting.forms import VotingVoterForm
+from voting.models import Voting, VotingVoter
+
+FACE = {'box': [200, 120, 200, 240], 'confidence': 0.99, 'keypoints': {}}
+
+def camera_frame(name='frame.jpg', size=(480, 640)):
+    """A sharp, well-lit JPEG frame that passes the quality gate"""
+    ys, xs = np.indices(size)
+    board = (((ys // 40 + xs // 40) % 2) * 200 + 30).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(np.dstack([board] * 3)).save(buffer, format='JPEG', quality=95)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+class StubRecognizer:
+    """Recognizer returning canned results, recording how it was called"""
+    using_advanced = True
+    threshold = 0.6
+
+    def __init__(self, identify_result=None, similarities=()):
+        self.identify_result = identify_result
+        self.identify_calls = []
+        self.similarities = list(similarities)
+        self.analyzed = 0
+        self.embedded_crops = []
+
+    def match_similarity(self):
+        return self.threshold
+
+    def embed_face_crop(self, crop, box):
+        self.embedded_crops.append(box)
+        return np.ones(8, dtype=np.float32)
+
+    def analyze_face(self, img_array):
+        self.analyzed += 1
+        return FaceAnalysis(faces=[FACE], largest_face=FACE, face_tensor=None, embedding=np.ones(8, dtype=np.float32))
+
+    def verify_embedding(self, claimed_id, embedding):
+        similarity = self.similarities.pop(0)
+        return similarity >= self.threshold, similarity
+
+    def identify_embedding(self, embedding, **kwargs):
+        self.identify_calls.append(kwargs)
+        # Like the real recognizer, never match outside the given candidates
+        candidate_ids = kwargs.get('candidate_ids')
+        if candidate_ids is not None and self.identify_result['user_id'] not in candidate_ids:
+            return {'user_id': None, 'confidence': 0.0, 'margin': 0.0, 'reason': 'no_match', 'candidates': []}
+        # ...or below the minimum similarity
+        if self.identify_result['confidence'] < kwargs.get('min_similarity', 0.0):
+            return {**self.identify_result, 'user_id': None, 'reason': 'no_match'}
+        return self.identify_result
+
+class FaceViewTestCase(TestCase):
+    """Keeps the quality gate's stats file in a temporary face database"""
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.face_db_override = override_settings(FACE_DB_PATH=self.db_path)
+        self.face_db_override.enable()
+        shutdown_quality_gate()
+
+    def tearDown(self):
+        shutdown_quality_gate()
+        self.face_db_override.disable()
+        shutil.rmtree(self.db_path)
+
+class IdentifyVoterFaceTest(FaceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.voter = User.objects.create_user('voter', voter_id='1234', first_name='Asha', has_face_data=True)
+
+    def identify(self, recognizer, **data):
+        with patch('accounts.views.get_recognizer', return_value=recognizer):
+            return self.client.post(reverse('identify_voter_face'), {'image_data': camera_frame(), **data}).json()
+
+    def test_confident_match_logs_the_voter_in(self):
+        recognizer = StubRecognizer({'user_id': '1234', 'confidence': 0.9, 'margin': 0.3, 'reason': None, 'candidates': []})
+
+        response = self.identify(recognizer)
+
+        self.assertTrue(response['success'])
+        self.assertEqual(response['redirect_url'], reverse('home'))
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.voter.pk)
+        self.assertIsNone(recognizer.identify_calls[0]['candidate_ids'])
+
+    @override_settings(FACE_IDENTIFY_MIN_SIMILARITY=0.0)
+    def test_match_below_the_verification_gate_is_refused(self):
+        # Passes this recognizer's 0.6 threshold, but not the 0.7 a claimed-ID verification needs
+        recognizer = StubRecognizer({'user_id': '1234', 'confidence': 0.65, 'margin': 0.3, 'reason': None, 'candidates': []})
+
+        response = self.identify(recognizer)
+
+        self.assertFalse(response['success'])
+        self.assertTrue(response['fallback'])
+        self.assertEqual(response['reason'], 'no_match')
+        self.assertEqual(recognizer.identify_calls[0]['min_similarity'], 0.7)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_match_below_the_identification_floor_is_refused(self):
+        recognizer = StubRecognizer({'user_id': '1234', 'confidence': 0.8, 'margin': 0.3, 'reason': None, 'candidates': []})
+
+        with self.settings(FACE_IDENTIFY_MIN_SIMILARITY=0.85):
+            response = self.identify(recognizer)
+
+        self.assertFalse(response['success'])
+        self.assertEqual(response['reason'], 'no_match')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_ambiguous_match_falls_back_to_id_entry(self):
+        recognizer = StubRecognizer({'user_id': None, 'confidence': 0.9, 'margin': 0.01, 'reason': 'ambiguous', 'candidates': []})
+
+        response = self.identify(recognizer)
+
+        self.assertFalse(response['success'])
+        self.assertTrue(response['fallback'])
+        self.assertEqual(response['reason'], 'ambiguous')
+        self.assertEqual(response['redirect_url'], reverse('login'))
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_shortlist_is_logged_but_not_returned(self):
+        candidates = [('1234', 0.9, 0.0), ('5678', 0.6, 0.3)]
+        recognizer = StubRecognizer({'user_id': '1234', 'confidence': 0.9, 'margin': 0.3, 'reason': None, 'candidates': candidates})
+
+        with self.assertLogs('accounts.views', level='INFO') as logs:
+            response = self.identify(recognizer)
+
+        self.assertTrue(response['success'])
+        self.assertNotIn('candidates', response)
+        self.assertIn('1234=0.900(-0.000), 5678=0.600(-0.300)', '\n'.join(logs.output))
+
+    def test_unknown_voting_is_a_json_error(self):
+        recognizer = StubRecognizer({'user_id': '1234', 'confidence': 0.9, 'margin': 0.3, 'reason': None, 'candidates': []})
+
+        for voting_id in ('999', 'not-a-pk'):
+            with patch('accounts.views.get_recognizer', return_value=recognizer):
+                response = self.client.post(reverse('identify_voter_face'), {'image_data': camera_frame(), 'voting_id': voting_id})
+
+            self.assertEqual(response.status_code, 404)
+            self.assertFalse(response.json()['success'])
+        self.assertEqual(recognizer.identify_calls, [])
+
+class VotingScopedIdentifyTest(FaceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.voter = User.objects.create_user('voter', voter_id='1234', has_face_data=True)
+        self.other = User.objects.create_user('other', voter_id='5678', has_face_data=True)
+        self.voting = Voting.objects.create(
+            title="Test Voting",
+            description="Test Description",
+            start_time=timezone.now() - timezone.timedelta(days=1),
+            end_time=timezone.now() + timezone.timedelta(days=1)
+        )
+        VotingVoter.objects.create(voting=self.voting, voter=self.voter)
+
+    def identify(self, recognizer):
+        with patch('accounts.views.get_recognizer', return_value=recognizer):
+            return self.client.post(reverse('identify_voter_face'), {
+                'image_data': camera_frame(),
+                'voting_id': self.voting.pk
+            }).json()
+
+    def test_search_is_limited_to_the_voting_roll(self):
+        recognizer = StubRecognizer({'user_id': '1234', 'confidence': 0.9, 'margin': 0.3, 'reason': None, 'candidates': []})
+
+        response = self.identify(recognizer)
+
+        self.assertTrue(response['success'])
+        self.assertEqual(response['redirect_url'], reverse('voting_detail', kwargs={'pk': self.voting.pk}))
+        self.assertEqual(recognizer.identify_calls[0]['candidate_ids'], ['1234'])
+        self.assertIn(f'voting-{self.voting.pk}-', recognizer.identify_calls[0]['subset_key'])
+
+    def test_voter_off_the_roll_is_not_identified(self):
+        recognizer = StubRecognizer({'user_id': '5678', 'confidence': 0.9, 'margin': 0.3, 'reason': None, 'candidates': []})
+
+        response = self.identify(recognizer)
+
+        self.assertFalse(response['success'])
+        self.assertTrue(response['fallback'])
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_changing_the_roll_changes_the_scope(self):
+        recognizer = StubRecognizer({'user_id': '5678', 'confidence': 0.9, 'margin': 0.3, 'reason': None, 'candidates': []})
+        self.identify(recognizer)
+
+        form = VotingVoterForm({'voters': [self.voter.pk, self.other.pk]}, instance=self.voting)
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        self.assertTrue(self.identify(recognizer)['success'])
+        first, second = recognizer.identify_calls
+        self.assertEqual(sorted(second['candidate_ids']), ['1234', '5678'])
+        self.assertNotEqual(first['subset_key'], second['subset_key'])
+
+@override_settings(FACE_STREAM_MIN_FRAMES=2, FACE_STREAM_MAX_FRAMES=5, FACE_STREAM_STRONG_MARGIN=0.1)
+class StreamVerifyVoterFaceTest(FaceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.voter = User.objects.create_user('voter', voter_id='1234', has_face_data=True)
+        session = self.client.session
+        session['voter_id_for_face_auth'] = '1234'
+        session.save()
+
+    def send_frames(self, recognizer, count):
+        """Upload frames like the login page: the first one starts the attempt"""
+        responses = []
+        with patch('accounts.views.get_recognizer', return_value=recognizer):
+            for i in range(count):
+                data = {'image_data': camera_frame()}
+                if i == 0:
+                    data['start'] = '1'
+                url = reverse('stream_verify_voter_face', kwargs={'user_id': self.voter.pk})
+                responses.append(self.client.post(url, data).json())
+        return responses
+
+    def test_frames_are_embedded_as_they_arrive_until_the_login_gate_is_met(self):
+        recognizer = StubRecognizer(similarities=[0.72, 0.75])
+
+        first, second = self.send_frames(recognizer, 2)
+
+        self.assertFalse(first['done'])
+        self.assertEqual(recognizer.analyzed, 2)
+        self.assertTrue(second['success'])
+        self.assertEqual(second['frames'], 2)
+        self.assertAlmostEqual(second['confidence'], 0.735)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.voter.pk)
+
+    def test_matches_below_the_single_frame_gate_are_not_accepted(self):
+        # Above this recognizer's threshold of 0.6, but below the 0.7 a single-frame verification needs
+        recognizer = StubRecognizer(similarities=[0.65] * 5)
+
+        responses = self.send_frames(recognizer, 5)
+
+        self.assertEqual([response['done'] for response in responses], [False] * 4 + [True])
+        self.assertFalse(responses[-1]['success'])
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_mismatch_is_rejected_once_the_mean_cannot_recover(self):
+        recognizer = StubRecognizer(similarities=[0.1, 0.1])
+
+        responses = self.send_frames(recognizer, 2)
+
+        self.assertEqual([response['done'] for response in responses], [False, True])
+        self.assertFalse(responses[-1]['success'])
+        self.assertIn('confidence', responses[-1])
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_frames_outside_an_attempt_are_refused(self):
+        recognizer = StubRecognizer(similarities=[0.9])
+
+        with patch('accounts.views.get_recognizer', return_value=recognizer):
+            response = self.client.post(reverse('stream_verify_voter_face', kwargs={'user_id': self.voter.pk}),
+                                        {'image_data': camera_frame()}).json()
+
+        self.assertFalse(response['success'])
+        self.assertTrue(response['done'])
+        self.assertEqual(recognizer.analyzed, 0)
+
+@override_settings(FACE_ROI_FAST_PATH=True, FACE_ROI_MIN_SIZE=40)
+@patch('accounts.views.get_fast_detector', return_value=None)
+class FaceCropVerificationTest(FaceViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.voter = User.objects.create_user('voter', voter_id='1234', has_face_data=True)
+        session = self.client.session
+        session['voter_id_for_face_auth'] = '1234'
+        session.save()
+
+    def verify(self, recognizer, face_box):
+        with patch('accounts.views.get_recognizer', return_value=recognizer):
+            return self.client.post(reverse('stream_verify_voter_face', kwargs={'user_id': self.voter.pk}), {
+                'start': '1',
+                'image_data': camera_frame(),
+                'face_crop': camera_frame('face.jpg', size=(180, 150)),
+                'face_box': face_box
+            }).json()
+
+    def test_plausible_crop_is_embedded_without_detection(self, get_fast_detector):
+        recognizer = StubRecognizer(similarities=[0.9])
+        checked = get_quality_gate().stats()['checked']
+
+        response = self.verify(recognizer, '15,20,120,140')
+
+        self.assertTrue(response['success'])
+        self.assertEqual(recognizer.embedded_crops, [[15, 20, 120, 140]])
+        self.assertEqual(recognizer.analyzed, 0)
+        # Crops are not counted as frames the gate saved inference on
+        self.assertEqual(get_quality_gate().stats()['checked'], checked)
+
+    def test_implausible_or_malformed_crop_falls_back_to_full_detection(self, get_fast_detector):
+        for face_box in ('15,20,20,20', 'inf,20,120,140', 'not a box'):
+            recognizer = StubRecognizer(similarities=[0.9])
+
+            response = self.verify(recognizer, face_box)
+
+            self.assertTrue(response['success'], face_box)
+            self.assertEqual(recognizer.embedded_crops, [])
+            self.assertEqual(recognizer.analyzed, 1)
+
+            # Log out and claim the voter again for the next attempt
+            self.client.logout()
+            session = self.client.session
+            session['voter_id_for_face_auth'] = '1234'
+            session.save()
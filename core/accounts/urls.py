@@ -21,4 +21,7 @@ urlpatterns = [
     path('voters/<int:pk>/register-face/', views.register_voter_face, name='register_voter_face'),
     path('face-login/<int:user_id>/', views.face_login_view, name='face_login'),
     path('face-login/<int:user_id>/verify/', views.verify_voter_face, name='verify_voter_face'),
+    path('face-login/<int:user_id>/stream/', views.stream_verify_voter_face, name='stream_verify_voter_face'),
+    path('face-identify/', views.face_identify_view, name='face_identify'),
+    path('face-identify/verify/', views.identify_voter_face, name='identify_voter_face'),
 ]
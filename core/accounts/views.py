@@ -1,4 +1,7 @@
+import logging
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -7,15 +10,70 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-import base64
-import tempfile
-import os
 from .models import User
+from voting.models import Voting
+from voting.eligibility import voting_face_scope
 from .forms import (
     UserIdForm, PasswordForm, VoterCreationForm, VoterUpdateForm,
     AdminCreationForm, AdminUpdateForm
 )
-from facial_recognition import FacialRecognition
+from facial_recognition import get_recognizer
+from facial_recognition.image_ingest import decode_data_url, decode_upload
+from facial_recognition.quality import check_frame
+from facial_recognition.fast_detector import detect_preview, get_fast_detector
+from facial_recognition.face_roi import check_face_crop, parse_box
+from facial_recognition.streaming import ACCEPT, EvidenceAccumulator
+
+logger = logging.getLogger(__name__)
+
+def has_posted_frame(request, name='image_data'):
+    """Whether a frame was posted under name, as a file upload or a form field"""
+    return name in request.FILES or bool(request.POST.get(name))
+
+def decode_posted_frame(request, name='image_data'):
+    """Decode a frame posted as a binary multipart file, or as a base64 data URL field by older clients"""
+    upload = request.FILES.get(name)
+    if upload is not None:
+        # Decode the uploaded bytes directly, without a base64 text copy
+        return decode_upload(upload)
+
+    # Decode the data URL straight into an RGB array
+    return decode_data_url(request.POST[name])
+
+# Lowest confidence a face login accepts, on top of the recognizer's own match threshold. The advanced
+# implementation scores higher for the same face than the basic one (whose confidence is 1.0 - distance).
+ADVANCED_LOGIN_MIN_CONFIDENCE = 0.7
+SIMPLE_LOGIN_MIN_CONFIDENCE = 0.5
+
+def login_accept_score(face_recognizer):
+    """Similarity a face must reach to log a voter in: the recognizer's threshold and the login gate"""
+    if face_recognizer.using_advanced:
+        gate = ADVANCED_LOGIN_MIN_CONFIDENCE
+    else:
+        gate = SIMPLE_LOGIN_MIN_CONFIDENCE
+    return max(face_recognizer.match_similarity(), gate)
+
+def embed_posted_face_crop(request, face_recognizer):
+    """Embed the face crop and box posted by the client, or return None if absent or implausible"""
+    if not settings.FACE_ROI_FAST_PATH or not has_posted_frame(request, 'face_crop') or not request.POST.get('face_box'):
+        return None
+
+    try:
+        crop = decode_posted_frame(request, 'face_crop')
+        box = parse_box(request.POST['face_box'])
+    except ValueError as e:
+        logger.debug("Ignoring client face crop: %s", e)
+        return None
+
+    # Cheap checks on the crop; anything doubtful goes through full detection instead. A rejected
+    # crop saves no inference (the frame is checked again), so it is left out of the gate's stats.
+    quality = check_frame(crop, record=False)
+    roi = check_face_crop(crop, box, min_face_size=settings.FACE_ROI_MIN_SIZE, detector=get_fast_detector())
+    if not quality.ok or not roi.ok:
+        logger.debug("Client face crop rejected (%s), running full detection", quality.reason or roi.reason)
+        return None
+
+    return face_recognizer.embed_face_crop(crop, box)
 
 def login_view(request):
     user = None
@@ -183,13 +241,7 @@ class VoterDeleteView(LoginRequiredMixin, AdminRequiredMixin, DeleteView):
         # Delete facial recognition data if it exists
         if user.has_face_data:
             try:
-                face_recognizer = FacialRecognition()
-                if user.voter_id in face_recognizer.face_db:
-                    # Remove from database
-                    db_path = face_recognizer.db_path
-                    embedding_path = os.path.join(db_path, f"{user.voter_id}.npy")
-                    if os.path.exists(embedding_path):
-                        os.remove(embedding_path)
+                get_recognizer().remove_face(user.voter_id)
             except Exception as e:
                 messages.warning(self.request, f"Could not delete facial recognition data: {str(e)}")
 
@@ -300,7 +352,7 @@ def register_voter_face(request, pk):
 
         # Initialize facial recognition
         try:
-            face_recognizer = FacialRecognition(threshold=0.6)
+            face_recognizer = get_recognizer()
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -310,33 +362,19 @@ def register_voter_face(request, pk):
         # Handle face validation
         if action == 'validate':
             # Get image data
-            image_data = request.POST.get('image_data')
-            if not image_data:
+            if not has_posted_frame(request):
                 return JsonResponse({'success': False, 'error': 'No image data provided'})
 
-            # Remove data URL prefix
-            if 'base64,' in image_data:
-                image_data = image_data.split('base64,')[1]
-
-            # Decode base64 image
             try:
-                image_bytes = base64.b64decode(image_data)
-
-                # Save to temp file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                    temp_file.write(image_bytes)
-                    temp_path = temp_file.name
+                img_rgb = decode_posted_frame(request)
 
-                # Load image for face detection
-                import cv2
-                img = cv2.imread(temp_path)
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                # Reject blurry, dark or overexposed frames before running the detector
+                quality = check_frame(img_rgb)
+                if not quality.ok:
+                    return JsonResponse({'success': False, 'error': quality.message, 'quality': quality.reason})
 
-                # Detect faces
-                faces = face_recognizer.detect_face(img_rgb)
-
-                # Clean up temp file
-                os.unlink(temp_path)
+                # Detect faces with the lightweight preview detector (MTCNN stays for register and verify)
+                faces = detect_preview(img_rgb, face_recognizer)
 
                 if not faces:
                     return JsonResponse({
@@ -351,7 +389,8 @@ def register_voter_face(request, pk):
                 return JsonResponse({
                     'success': True,
                     'face_count': len(faces),
-                    'confidence': float(confidence)
+                    'confidence': float(confidence),
+                    'box': [int(value) for value in largest_face['box']]
                 })
 
             except Exception as e:
@@ -362,45 +401,52 @@ def register_voter_face(request, pk):
 
         # Handle face registration
         elif action == 'register':
-            # Process each image
+            # Decode and quality-check each image
             image_count = 0
-            successful_images = 0
             failed_images = 0
             errors = []
+            images = []
+            image_numbers = []
 
-            for key in request.POST:
-                if key.startswith('image_'):
-                    image_count += 1
-                    image_data = request.POST[key]
+            # Images arrive as file uploads (or data URL fields from older clients) named image_0, image_1, ...
+            image_keys = [key for key in list(request.FILES) + list(request.POST) if key.startswith('image_')]
 
-                    # Remove data URL prefix
-                    if 'base64,' in image_data:
-                        image_data = image_data.split('base64,')[1]
+            for key in image_keys:
+                image_count += 1
 
-                    # Decode base64 image
-                    try:
-                        image_bytes = base64.b64decode(image_data)
+                try:
+                    img_rgb = decode_posted_frame(request, key)
+                except Exception as e:
+                    failed_images += 1
+                    errors.append(f'Error processing image {image_count}: {str(e)}')
+                    continue
 
-                        # Save to temp file
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                            temp_file.write(image_bytes)
-                            temp_path = temp_file.name
+                # Skip unusable frames before running the detector
+                quality = check_frame(img_rgb)
+                if not quality.ok:
+                    failed_images += 1
+                    errors.append(f'Image {image_count}: {quality.message}')
+                    continue
 
-                        # Register face
-                        success = face_recognizer.register_face(voter.voter_id, img_path=temp_path)
+                images.append(img_rgb)
+                image_numbers.append(image_count)
 
-                        # Clean up temp file
-                        os.unlink(temp_path)
-
-                        if success:
-                            successful_images += 1
-                        else:
-                            failed_images += 1
-                            errors.append(f'No face detected in image {image_count}')
-
-                    except Exception as e:
+            # Register all images with one batched forward pass and a single database write
+            successful_images = 0
+            if images:
+                try:
+                    used = face_recognizer.register_faces(voter.voter_id, images)
+                except Exception as e:
+                    used = []
+                    failed_images += len(images)
+                    errors.append(f'Error registering face images: {str(e)}')
+
+                for number, success in zip(image_numbers, used):
+                    if success:
+                        successful_images += 1
+                    else:
                         failed_images += 1
-                        errors.append(f'Error processing image {image_count}: {str(e)}')
+                        errors.append(f'No face detected in image {number}')
 
             # Check if we have enough successful images
             if successful_images == 0:
@@ -438,12 +484,8 @@ def register_voter_face(request, pk):
                         'error': 'This voter does not have any facial recognition data.'
                     })
 
-                # Delete face embedding file
-                db_path = face_recognizer.db_path
-                embedding_path = os.path.join(db_path, f"{voter.voter_id}.npy")
-
-                if os.path.exists(embedding_path):
-                    os.remove(embedding_path)
+                # Delete face embedding from the shared database
+                face_recognizer.remove_face(voter.voter_id)
 
                 # Update user model
                 voter.has_face_data = False
@@ -496,7 +538,7 @@ def verify_voter_face(request, user_id):
 
         # Initialize facial recognition
         try:
-            face_recognizer = FacialRecognition(threshold=0.6)
+            face_recognizer = get_recognizer()
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -504,35 +546,21 @@ def verify_voter_face(request, user_id):
             })
 
         # Get image data
-        image_data = request.POST.get('image_data')
-        if not image_data:
+        if not has_posted_frame(request):
             return JsonResponse({'success': False, 'error': 'No image data provided'})
 
-        # Remove data URL prefix
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-
         # Handle face validation
         if action == 'validate':
-            # Decode base64 image
             try:
-                image_bytes = base64.b64decode(image_data)
-
-                # Save to temp file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                    temp_file.write(image_bytes)
-                    temp_path = temp_file.name
-
-                # Load image for face detection
-                import cv2
-                img = cv2.imread(temp_path)
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                img_rgb = decode_posted_frame(request)
 
-                # Detect faces
-                faces = face_recognizer.detect_face(img_rgb)
+                # Reject blurry, dark or overexposed frames before running the detector
+                quality = check_frame(img_rgb)
+                if not quality.ok:
+                    return JsonResponse({'success': False, 'error': quality.message, 'quality': quality.reason})
 
-                # Clean up temp file
-                os.unlink(temp_path)
+                # Detect faces with the lightweight preview detector (MTCNN stays for register and verify)
+                faces = detect_preview(img_rgb, face_recognizer)
 
                 if not faces:
                     return JsonResponse({
@@ -547,7 +575,8 @@ def verify_voter_face(request, user_id):
                 return JsonResponse({
                     'success': True,
                     'face_count': len(faces),
-                    'confidence': float(confidence)
+                    'confidence': float(confidence),
+                    'box': [int(value) for value in largest_face['box']]
                 })
 
             except Exception as e:
@@ -558,47 +587,39 @@ def verify_voter_face(request, user_id):
 
         # Handle face verification
         elif action == 'verify':
-            # Decode base64 image
             try:
-                image_bytes = base64.b64decode(image_data)
+                # Embed the client's face crop directly if it passes the sanity checks
+                embedding = embed_posted_face_crop(request, face_recognizer)
 
-                # Save to temp file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                    temp_file.write(image_bytes)
-                    temp_path = temp_file.name
+                # Otherwise run full detection on the whole frame
+                if embedding is None:
+                    img_rgb = decode_posted_frame(request)
 
-                # First check if a face is detected
-                import cv2
-                img = cv2.imread(temp_path)
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-                # Detect faces
-                faces = face_recognizer.detect_face(img_rgb)
-
-                if not faces:
-                    # Clean up temp file
-                    os.unlink(temp_path)
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'No face detected in the image. Please try again with better lighting and positioning.'
-                    })
+                    # Reject blurry, dark or overexposed frames before running the detector
+                    quality = check_frame(img_rgb)
+                    if not quality.ok:
+                        return JsonResponse({'success': False, 'error': quality.message, 'quality': quality.reason})
 
-                # Recognize face
-                recognized_id, confidence = face_recognizer.recognize_face(img_path=temp_path)
+                    # Detect, align and embed the face with a single detector pass
+                    analysis = face_recognizer.analyze_face(img_rgb)
 
-                # Clean up temp file
-                os.unlink(temp_path)
+                    if not analysis.faces:
+                        return JsonResponse({
+                            'success': False,
+                            'error': 'No face detected in the image. Please try again with better lighting and positioning.'
+                        })
+                    embedding = analysis.embedding
 
-                # Check if recognized
-                if recognized_id == user.voter_id:
-                    # Import the USING_ADVANCED flag to check which implementation is being used
-                    from facial_recognition import USING_ADVANCED
+                # Verify the embedding against the claimed voter only
+                matched, confidence = face_recognizer.verify_embedding(user.voter_id, embedding)
 
+                # Check if verified
+                if matched:
                     # Check confidence threshold based on which implementation is being used
-                    if USING_ADVANCED:
+                    if face_recognizer.using_advanced:
                         # For advanced implementation, higher scores are better (0.0 to 1.0)
                         # A score of 0.94 (94%) is excellent
-                        if confidence < 0.7:  # Threshold for advanced implementation
+                        if confidence < ADVANCED_LOGIN_MIN_CONFIDENCE:  # Threshold for advanced implementation
                             return JsonResponse({
                                 'success': False,
                                 'error': f'Low confidence match ({confidence:.1%}). Please try again with better lighting and positioning.',
@@ -607,7 +628,7 @@ def verify_voter_face(request, user_id):
                     else:
                         # For basic implementation, lower scores are better (0.0 to 1.0)
                         # But the confidence is returned as 1.0 - score, so higher is better
-                        if confidence < 0.5:  # Threshold for basic implementation
+                        if confidence < SIMPLE_LOGIN_MIN_CONFIDENCE:  # Threshold for basic implementation
                             return JsonResponse({
                                 'success': False,
                                 'error': f'Low confidence match ({confidence:.1%}). Please try again with better lighting and positioning.',
@@ -629,11 +650,8 @@ def verify_voter_face(request, user_id):
                         'redirect_url': reverse_lazy('home')
                     })
                 else:
-                    # Import the USING_ADVANCED flag to check which implementation is being used
-                    from facial_recognition import USING_ADVANCED
-
                     # Check if it's a close match based on which implementation is being used
-                    if USING_ADVANCED:
+                    if face_recognizer.using_advanced:
                         # For advanced implementation, higher scores are better
                         if confidence > 0.5:  # Higher threshold for "close match" with advanced implementation
                             error_message = f'Face verification failed with a close match ({confidence:.1%}). Please try again with better lighting and positioning.'
@@ -662,3 +680,233 @@ def verify_voter_face(request, user_id):
             return JsonResponse({'success': False, 'error': 'Invalid action'})
 
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+# Session key holding the evidence of the streamed verification attempt in progress
+STREAM_EVIDENCE_SESSION_KEY = 'face_stream_evidence'
+
+@csrf_exempt
+def stream_verify_voter_face(request, user_id):
+    """API endpoint verifying a voter's face from frames uploaded one at a time as they are captured"""
+    # Check if we have a voter ID in session
+    voter_id = request.session.get('voter_id_for_face_auth')
+    if not voter_id:
+        return JsonResponse({'success': False, 'error': 'Invalid login attempt'}, status=403)
+
+    user = get_object_or_404(User, pk=user_id, voter_id=voter_id, is_voter=True, has_face_data=True)
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+    if not has_posted_frame(request):
+        return JsonResponse({'success': False, 'error': 'No image data provided'})
+
+    try:
+        face_recognizer = get_recognizer()
+        # The combined score must pass the same gate as a single-frame verification
+        accept_score = login_accept_score(face_recognizer)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f"Error initializing facial recognition: {str(e)}"
+        })
+
+    evidence = EvidenceAccumulator(
+        accept_score,
+        min_frames=settings.FACE_STREAM_MIN_FRAMES,
+        max_frames=settings.FACE_STREAM_MAX_FRAMES,
+        strong_margin=settings.FACE_STREAM_STRONG_MARGIN
+    )
+
+    # The first frame of an attempt starts from scratch; later frames add to its evidence
+    state = request.session.get(STREAM_EVIDENCE_SESSION_KEY)
+    if request.POST.get('start'):
+        state = None
+    elif state is None:
+        return JsonResponse({'success': False, 'error': 'No verification in progress. Please try again.', 'done': True})
+    else:
+        evidence.restore(state)
+
+    # Embed this frame now, while the browser captures the next one
+    similarity = None
+    error = None
+    try:
+        # The first frame may come with the face crop validated earlier, which skips detection
+        embedding = embed_posted_face_crop(request, face_recognizer)
+
+        if embedding is None:
+            img_rgb = decode_posted_frame(request)
+
+            quality = check_frame(img_rgb)
+            if not quality.ok:
+                error = quality.message
+            else:
+                analysis = face_recognizer.analyze_face(img_rgb)
+                if analysis.embedding is None:
+                    error = 'No face detected in the image. Please try again with better lighting and positioning.'
+                embedding = analysis.embedding
+
+        if embedding is not None:
+            _, similarity = face_recognizer.verify_embedding(user.voter_id, embedding)
+    except Exception as e:
+        request.session.pop(STREAM_EVIDENCE_SESSION_KEY, None)
+        return JsonResponse({
+            'success': False,
+            'error': f'Error processing image: {str(e)}',
+            'done': True
+        })
+
+    decision = evidence.add(similarity)
+    if decision is None:
+        # Not conclusive yet: keep the evidence and ask for another frame
+        request.session[STREAM_EVIDENCE_SESSION_KEY] = evidence.state()
+        return JsonResponse({
+            'success': False,
+            'done': False,
+            'error': error,
+            'confidence': float(evidence.score),
+            'frames': evidence.frames
+        })
+
+    request.session.pop(STREAM_EVIDENCE_SESSION_KEY, None)
+    logger.info("Streaming face verification: decision=%s frames=%d score=%.3f",
+                decision, evidence.frames, evidence.score)
+
+    if decision == ACCEPT:
+        # Log the user in
+        user.backend = 'django.contrib.auth.backends.ModelBackend'
+        login(request, user)
+
+        # Clear session data
+        if 'voter_id_for_face_auth' in request.session:
+            del request.session['voter_id_for_face_auth']
+
+        return JsonResponse({
+            'success': True,
+            'done': True,
+            'message': 'Identity verified successfully',
+            'confidence': float(evidence.score),
+            'frames': evidence.frames,
+            'redirect_url': reverse_lazy('home')
+        })
+
+    if not evidence.scores:
+        error_message = error or 'No usable frames received.'
+    elif evidence.score > accept_score - 0.2:
+        error_message = f'Face verification failed with a close match ({evidence.score:.1%}). Please try again with better lighting and positioning.'
+    else:
+        error_message = 'Face verification failed. The face does not match our records.'
+
+    return JsonResponse({
+        'success': False,
+        'done': True,
+        'error': error_message,
+        'confidence': float(evidence.score),
+        'frames': evidence.frames
+    })
+
+def face_identify_view(request):
+    """View for logging in with the face alone, without entering a voter ID"""
+    # An optional voting restricts identification to the voters on its roll
+    voting = None
+    if request.GET.get('voting'):
+        voting = get_object_or_404(Voting, pk=request.GET.get('voting'))
+
+    return render(request, 'accounts/face_identify.html', {
+        'voting': voting
+    })
+
+@csrf_exempt
+def identify_voter_face(request):
+    """API endpoint identifying a voter from one frame against all enrolled faces"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+    if not has_posted_frame(request):
+        return JsonResponse({'success': False, 'error': 'No image data provided'})
+
+    # Any failure below sends the voter back to the ID entry form
+    fallback_url = str(reverse_lazy('login'))
+
+    # When logging in for a specific voting, only voters on its roll can match
+    candidate_ids = subset_key = None
+    voting = None
+    if request.POST.get('voting_id'):
+        try:
+            voting = Voting.objects.get(pk=request.POST.get('voting_id'))
+        except (Voting.DoesNotExist, ValueError):
+            return JsonResponse({'success': False, 'error': 'Voting not found'}, status=404)
+        subset_key, candidate_ids = voting_face_scope(voting)
+
+    try:
+        face_recognizer = get_recognizer()
+
+        img_rgb = decode_posted_frame(request)
+
+        # Reject blurry, dark or overexposed frames before running the detector
+        quality = check_frame(img_rgb)
+        if not quality.ok:
+            return JsonResponse({'success': False, 'error': quality.message, 'quality': quality.reason})
+
+        # Detect, align and embed the face with a single detector pass
+        analysis = face_recognizer.analyze_face(img_rgb)
+        if not analysis.faces:
+            return JsonResponse({
+                'success': False,
+                'error': 'No face detected in the image. Please try again with better lighting and positioning.'
+            })
+
+        # Search all enrolled voters; a weak or ambiguous best match is not accepted. Being a search rather
+        # than a check against one claimed voter, it needs at least the verification gate and usually more.
+        result = face_recognizer.identify_embedding(
+            analysis.embedding,
+            k=settings.FACE_IDENTIFY_SHORTLIST,
+            min_margin=settings.FACE_IDENTIFY_MARGIN,
+            min_similarity=max(login_accept_score(face_recognizer), settings.FACE_IDENTIFY_MIN_SIMILARITY),
+            candidate_ids=candidate_ids,
+            subset_key=subset_key
+        )
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error processing image: {str(e)}',
+            'fallback': True,
+            'redirect_url': fallback_url
+        })
+
+    # The shortlist names other voters, so it goes to the log rather than to the client
+    shortlist = ', '.join(f'{user_id}={similarity:.3f}(-{gap:.3f})' for user_id, similarity, gap in result['candidates'])
+    logger.info("Face identification shortlist: %s", shortlist or 'empty')
+
+    user = None
+    if result['user_id'] is not None:
+        user = User.objects.filter(voter_id=result['user_id'], is_voter=True, has_face_data=True).first()
+
+    if user is None:
+        if result['reason'] == 'ambiguous':
+            error_message = 'Your face matches more than one voter closely. Please log in with your voter ID.'
+        else:
+            error_message = 'Your face was not recognized. Please log in with your voter ID.'
+
+        logger.info("Face identification fell back to ID entry: reason=%s confidence=%.3f margin=%.3f",
+                    result['reason'], result['confidence'], result['margin'])
+        return JsonResponse({
+            'success': False,
+            'error': error_message,
+            'reason': result['reason'] or 'no_match',
+            'confidence': float(result['confidence']),
+            'margin': float(result['margin']),
+            'fallback': True,
+            'redirect_url': fallback_url
+        })
+
+    # Log the user in
+    user.backend = 'django.contrib.auth.backends.ModelBackend'
+    login(request, user)
+
+    return JsonResponse({
+        'success': True,
+        'message': f'Welcome, {user.first_name}',
+        'confidence': float(result['confidence']),
+        'margin': float(result['margin']),
+        'redirect_url': reverse_lazy('voting_detail', kwargs={'pk': voting.pk}) if voting else reverse_lazy('home')
+    })
@@ -1,10 +1,16 @@
 """
 Facial Recognition package for the Voting System.
 This package provides facial recognition functionality using either the simple or advanced implementation.
+
+Importing the package is cheap: OpenCV and the deep-learning frameworks are only imported
+when FacialRecognition or USING_ADVANCED is first accessed, which normally happens when the
+shared recognizer is created for the first face operation. probe_capabilities() reports which
+backends could be used without importing anything.
 """
 
+import importlib.util
 import os
-import sys
+import threading
 import traceback
 
 # Check if we're in a production environment (Railway)
@@ -14,10 +20,14 @@ IS_PRODUCTION = os.environ.get('RAILWAY_ENVIRONMENT') == 'production'
 class DummyFacialRecognition:
     """A dummy implementation of FacialRecognition for environments where OpenCV is not available."""
 
+    backend = 'dummy'
+    using_advanced = False
+
     def __init__(self, *args, **kwargs):
         print("WARNING: Using dummy facial recognition implementation. OpenCV/OpenGL dependencies are not available.")
         self.db_path = kwargs.get('db_path', 'facial_recognition/face_db')
         self.threshold = kwargs.get('threshold', 0.7)
+        self.face_db = {}
         # Create database directory if it doesn't exist
         os.makedirs(self.db_path, exist_ok=True)
 
@@ -42,58 +52,149 @@ class DummyFacialRecognition:
     def register_face(self, *args, **kwargs):
         return False
 
+    def register_faces(self, user_id, images):
+        return [False] * len(images)
+
+    def remove_face(self, *args, **kwargs):
+        return False
+
+    def reload_face_db(self):
+        pass
+
     def recognize_face(self, *args, **kwargs):
         return None, 0.0
 
-# Import the facial recognition implementations
-try:
-    # First try to import OpenCV to check if it's available
-    import cv2
+    def verify_face(self, *args, **kwargs):
+        return False, 0.0
+
+    def embed_face_crop(self, *args, **kwargs):
+        return None
+
+    def analyze_face(self, *args, **kwargs):
+        from .pipeline import NO_FACE
+        return NO_FACE
+
+    def recognize_embedding(self, *args, **kwargs):
+        return None, 0.0
+
+    def verify_embedding(self, *args, **kwargs):
+        return False, 0.0
+
+    def match_similarity(self):
+        return self.threshold
+
+    def identify_embedding(self, *args, **kwargs):
+        return {'user_id': None, 'confidence': 0.0, 'margin': 0.0, 'reason': 'no_match', 'candidates': []}
+
+    def get_info(self):
+        return {'backend': self.backend, 'class': type(self).__name__, 'using_advanced': False, 'registered_faces': 0}
+
+# Modules each backend needs, in order of preference
+BACKEND_REQUIREMENTS = {
+    'advanced': ('cv2', 'torch', 'facenet_pytorch'),
+    'simple': ('cv2', 'tensorflow', 'mtcnn'),
+    'onnx': ('cv2', 'torch', 'facenet_pytorch', 'onnxruntime'),
+}
+
+_backend_lock = threading.Lock()
+_backend = None
+
+
+def probe_capabilities():
+    """
+    Check which facial recognition backends are installed, without importing them.
+
+    Returns:
+        dict: Backend name -> True if all of its modules can be found
+    """
+    return {
+        name: all(importlib.util.find_spec(module) is not None for module in modules)
+        for name, modules in BACKEND_REQUIREMENTS.items()
+    }
+
+
+def _select_backend():
+    """
+    Import the best available implementation, honouring the FACE_BACKEND setting.
+
+    FACE_BACKEND may be 'auto' (advanced, then simple), 'advanced', 'simple' or 'onnx'.
+    The ONNX Runtime backend is never chosen automatically because it needs an exported model.
+
+    Returns:
+        tuple: (FacialRecognition class, USING_ADVANCED flag)
+    """
+    from .registry import get_setting
+
+    preferred = get_setting('FACE_BACKEND', 'auto')
 
-    # Test if OpenGL is available by creating a small window
     try:
-        if not IS_PRODUCTION:  # Skip this test in production to avoid GUI issues
-            test_img = cv2.imread(os.path.join(os.path.dirname(__file__), 'test_img.jpg'))
-            if test_img is None:
-                # Create a small test image if none exists
-                test_img = cv2.cvtColor(cv2.imread(os.path.join(os.path.dirname(__file__), 'test_img.jpg')), cv2.COLOR_BGR2RGB)
+        # First try to import OpenCV to check if it's available (this fails if OpenGL libraries are missing)
+        import cv2
+
+        if preferred == 'onnx':
+            try:
+                from .onnx_face_recognition import OnnxFacialRecognition
+                print("Using ONNX Runtime Facial Recognition with InceptionResNetV1 (VGGFace2)")
+                return OnnxFacialRecognition, True
+            except ImportError as e:
+                print(f"Could not import ONNX Runtime facial recognition: {e}")
 
         # Try to import the advanced implementation
-        try:
-            from .advanced_face_recognition import AdvancedFacialRecognition as FacialRecognition
-            USING_ADVANCED = True
-            print("Using Advanced Facial Recognition with InceptionResNetV1 (VGGFace2)")
-        except ImportError as e:
-            print(f"Could not import advanced facial recognition: {e}")
-            # Fall back to simple implementation
-            from .face_recognition import FacialRecognition
-            USING_ADVANCED = False
-            print("Using Simple Facial Recognition with ResNet50")
+        if preferred != 'simple':
+            try:
+                from .advanced_face_recognition import AdvancedFacialRecognition
+                print("Using Advanced Facial Recognition with InceptionResNetV1 (VGGFace2)")
+                return AdvancedFacialRecognition, True
+            except ImportError as e:
+                print(f"Could not import advanced facial recognition: {e}")
+
+        # Fall back to simple implementation
+        from .face_recognition import FacialRecognition
+        print("Using Simple Facial Recognition with ResNet50")
+        return FacialRecognition, False
+
+    except ImportError as e:
+        # If OpenCV or the frameworks are not available, use the dummy implementation
+        print(f"WARNING: Facial recognition dependencies are not available: {e}")
+        print("Using dummy facial recognition implementation.")
+
+        # Only show detailed error in development environment
+        if not IS_PRODUCTION:
+            print("ERROR: OpenCV is required for facial recognition. Please install the required dependencies.")
+            print("See the apt.txt file for the required system dependencies.")
+            traceback.print_exc()
     except Exception as e:
-        print(f"OpenGL error detected: {e}")
-        print("Falling back to dummy implementation due to missing OpenGL libraries")
-        FacialRecognition = DummyFacialRecognition
-        USING_ADVANCED = False
-
-except ImportError as e:
-    # If OpenCV is not available, use the dummy implementation
-    FacialRecognition = DummyFacialRecognition
-    USING_ADVANCED = False
-    print(f"WARNING: OpenCV is not available: {e}")
-    print("Using dummy facial recognition implementation.")
-
-    # Only show detailed error in development environment
-    if not IS_PRODUCTION:
-        print("ERROR: OpenCV is required for facial recognition. Please install the required dependencies.")
-        print("See the apt.txt file for the required system dependencies.")
-        traceback.print_exc()
-except Exception as e:
-    # Catch any other exceptions
-    FacialRecognition = DummyFacialRecognition
-    USING_ADVANCED = False
-    print(f"ERROR: Unexpected error initializing facial recognition: {e}")
-
-    if not IS_PRODUCTION:
-        traceback.print_exc()
-
-__all__ = ['FacialRecognition', 'USING_ADVANCED']
+        # Catch any other exceptions
+        print(f"ERROR: Unexpected error initializing facial recognition: {e}")
+
+        if not IS_PRODUCTION:
+            traceback.print_exc()
+
+    return DummyFacialRecognition, False
+
+
+def _load_backend():
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _select_backend()
+    return _backend
+
+
+def __getattr__(name):
+    # Resolve the backend lazily on first access (PEP 562)
+    if name == 'FacialRecognition':
+        return _load_backend()[0]
+    if name == 'USING_ADVANCED':
+        return _load_backend()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+from .registry import get_recognizer, reload_recognizer, shutdown_recognizer
+
+__all__ = [
+    'FacialRecognition', 'USING_ADVANCED', 'probe_capabilities',
+    'get_recognizer', 'reload_recognizer', 'shutdown_recognizer',
+]
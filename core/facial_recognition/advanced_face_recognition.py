@@ -5,20 +5,25 @@ This module provides a class for high-accuracy facial recognition operations usi
 models. It uses MTCNN from facenet_pytorch for face detection and InceptionResNetV1 with VGGFace2
 weights for generating face embeddings.
 
-The embeddings are stored as .npy files in the specified database directory, with filenames
-corresponding to user IDs. This implementation offers higher accuracy than the basic implementation
+The embeddings are stored in a packed, memory-mapped EmbeddingStore in the specified database
+directory, keyed by user ID. This implementation offers higher accuracy than the basic implementation
 and can utilize GPU acceleration when available.
 """
 
+import copy
 import os
+import threading
 import numpy as np
 from PIL import Image
 import torch
-from facenet_pytorch import MTCNN, InceptionResnetV1
-from scipy.spatial.distance import cosine
-import cv2
+from facenet_pytorch import MTCNN, InceptionResnetV1, fixed_image_standardization
 
-class AdvancedFacialRecognition:
+from .batching import MicroBatcher
+from .face_database import FaceDatabaseMixin
+from .image_ingest import load_image
+from .pipeline import FaceAnalysis, NO_FACE, largest_face, downscale_for_detection, detection_min_face_size
+
+class AdvancedFacialRecognition(FaceDatabaseMixin):
     """
     A class for facial recognition using MTCNN for face detection and InceptionResNetV1 for face embedding.
 
@@ -26,12 +31,24 @@ class AdvancedFacialRecognition:
         detector (MTCNN): MTCNN model for face detection
         model (InceptionResnetV1): InceptionResNetV1 model for face embedding
         db_path (str): Path to the directory containing face database
-        face_db (dict): Dictionary containing face embeddings for registered users
+        face_db (EmbeddingStore): Dict-like store of face embeddings for registered users
+        index (EmbeddingIndex): Normalized embedding matrix used for exact matching
+        ann_index (IVFIndex): Approximate index used for identification, or None
         threshold (float): Similarity threshold for face matching
         device (torch.device): Device to run the models on (CPU or CUDA)
+        optimized (bool): Whether the embedding model runs as a frozen TorchScript graph
     """
 
-    def __init__(self, db_path='facial_recognition/face_db', threshold=0.7, image_size=160, min_face_size=20):
+    backend = 'advanced'
+
+    # Whether confidence scores follow the advanced (InceptionResNetV1) scale
+    using_advanced = True
+
+    def __init__(self, db_path='facial_recognition/face_db', threshold=0.7, image_size=160, min_face_size=20,
+                 use_ann_index=False, ann_probe=None, batch_window_ms=None, max_batch_size=16,
+                 optimize=False, num_threads=None, detection_max_side=None,
+                 max_templates=5, template_dtype='float16', embedding_dtype='float32',
+                 sync_interval_ms=250):
         """
         Initialize the AdvancedFacialRecognition class.
 
@@ -40,10 +57,34 @@ class AdvancedFacialRecognition:
             threshold (float): Similarity threshold for face matching (higher is stricter)
             image_size (int): Size of the face images
             min_face_size (int): Minimum size of faces to detect
+            use_ann_index (bool): Whether to identify faces with the persisted IVF index if one exists
+            ann_probe (int, optional): Number of IVF lists scanned per query
+            batch_window_ms (float, optional): If set, concurrent embedding calls are collected for up
+                to this many milliseconds and run as one batch
+            max_batch_size (int): Maximum number of faces per batched forward pass
+            optimize (bool): Trace and freeze the embedding model with TorchScript and run it in
+                channels-last memory format under torch.inference_mode
+            num_threads (int, optional): Number of intra-op threads used by torch
+            detection_max_side (int, optional): Downscale frames so their longest side is at most
+                this many pixels before running MTCNN
+            max_templates (int): Maximum number of enrollment embeddings kept per user
+            template_dtype (str): Element type of the stored templates ('float16' or 'float32')
+            embedding_dtype (str): Element type of the in-memory search matrix ('float32', 'float16' or 'int8')
+            sync_interval_ms (float): Minimum time between checks for face database changes made by
+                other processes
         """
         # Set device (use GPU if available)
         self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
 
+        # Set thread counts explicitly instead of relying on torch's defaults
+        if num_threads:
+            torch.set_num_threads(num_threads)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # Can only be set before the first parallel operation in the process
+                pass
+
         # Initialize MTCNN detector with custom parameters
         self.detector = MTCNN(
             image_size=image_size,
@@ -55,63 +96,140 @@ class AdvancedFacialRecognition:
             device=self.device
         )
 
-        # Initialize InceptionResNetV1 model with VGGFace2 weights
-        self.model = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
-
         # Set parameters
         self.image_size = image_size
-        self.db_path = db_path
         self.threshold = threshold
+        self.min_face_size = min_face_size
+        self.detection_max_side = detection_max_side
+        self.optimized = False
 
-        # Create database directory if it doesn't exist
-        os.makedirs(db_path, exist_ok=True)
+        # Detectors for other minimum face sizes, sharing this detector's networks
+        self._scaled_detectors = {min_face_size: self.detector}
+        self._scaled_detectors_lock = threading.Lock()
+
+        # Initialize the face embedding model
+        self.model = self._load_embedding_model()
+        if optimize:
+            self._optimize_model(max_batch_size)
+
+        # Optionally batch concurrent embedding calls into one forward pass
+        self.batcher = None
+        if batch_window_ms:
+            self.batcher = MicroBatcher(self.embed_face_tensors, window_ms=batch_window_ms,
+                                        max_batch_size=max_batch_size)
 
         # Load face database
-        self.face_db = {}
-        self._load_face_db()
+        self._init_face_db(db_path, use_ann_index=use_ann_index, ann_probe=ann_probe,
+                           max_templates=max_templates, template_dtype=template_dtype,
+                           index_dtype=embedding_dtype, sync_interval_ms=sync_interval_ms)
 
-    def _load_face_db(self):
-        """Load face embeddings from the database directory."""
-        if not os.path.exists(self.db_path):
+    def _load_embedding_model(self):
+        """Load InceptionResNetV1 with VGGFace2 weights."""
+        return InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+
+    def _optimize_model(self, max_batch_size):
+        """
+        Replace the eager model with a frozen, channels-last TorchScript graph.
+
+        The input buffer for up to max_batch_size faces is allocated once and reused by
+        every forward pass. If tracing fails the eager model is kept.
+
+        Args:
+            max_batch_size (int): Number of faces the preallocated input buffer holds
+        """
+        shape = (max(1, max_batch_size), 3, self.image_size, self.image_size)
+        buffer = torch.zeros(shape, device=self.device).contiguous(memory_format=torch.channels_last)
+
+        try:
+            model = self.model.to(memory_format=torch.channels_last)
+            with torch.inference_mode():
+                traced = torch.jit.trace(model, buffer[:1])
+                traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+                # Warm up so the first request does not pay for graph optimization
+                traced(buffer)
+        except Exception as e:
+            print(f"Could not optimize the face embedding model, using eager mode: {e}")
             return
 
-        for filename in os.listdir(self.db_path):
-            if filename.endswith('.npy'):
-                user_id = filename.split('.')[0]
-                embedding_path = os.path.join(self.db_path, filename)
-                self.face_db[user_id] = np.load(embedding_path)
+        self.model = traced
+        self.optimized = True
+        self._input_buffer = buffer
+        self._input_lock = threading.Lock()
 
-    def detect_face(self, img_array):
+    def _detector_for(self, min_face_size):
         """
-        Detect faces in an image using MTCNN.
+        Return an MTCNN detector with the given minimum face size.
+
+        The minimum size depends on how much a frame was downscaled, and MTCNN only reads
+        it from the instance. Instead of changing the shared detector for every frame,
+        one shallow copy is kept per size; the copies share the P/R/O networks, so they
+        cost no extra weights and concurrent detections never wait for each other.
+
+        Args:
+            min_face_size (int): Minimum face size in detection-image pixels
+
+        Returns:
+            MTCNN: Detector configured for min_face_size
+        """
+        detector = self._scaled_detectors.get(min_face_size)
+        if detector is None:
+            with self._scaled_detectors_lock:
+                detector = self._scaled_detectors.get(min_face_size)
+                if detector is None:
+                    detector = copy.copy(self.detector)
+                    detector.min_face_size = min_face_size
+                    self._scaled_detectors[min_face_size] = detector
+        return detector
+
+    def _detect(self, img_array):
+        """
+        Run MTCNN once on a (possibly downscaled) frame and keep only high-confidence detections.
 
         Args:
             img_array (numpy.ndarray): Input image as numpy array (RGB)
 
         Returns:
-            list: List of detected face bounding boxes and probabilities
+            tuple: (boxes, faces) with raw [x1, y1, x2, y2] boxes and detect_face() dicts,
+                both in full-resolution coordinates
         """
-        # Convert numpy array to PIL Image
-        img_pil = Image.fromarray(img_array)
+        small, scale = downscale_for_detection(img_array, self.detection_max_side)
 
-        # Detect faces
-        boxes, probs = self.detector.detect(img_pil, landmarks=False)
+        detector = self._detector_for(detection_min_face_size(self.min_face_size, scale))
+        boxes, probs = detector.detect(Image.fromarray(small), landmarks=False)
 
         if boxes is None:
-            return []
+            return [], []
+
+        # Map boxes back to the full-resolution frame
+        boxes = boxes / scale
 
-        # Format results similar to MTCNN from TensorFlow
-        results = []
+        kept_boxes = []
+        faces = []
         for box, prob in zip(boxes, probs):
             if prob > 0.9:  # Only include high-confidence detections
                 x1, y1, x2, y2 = box
-                results.append({
+                kept_boxes.append(box)
+                # Format results similar to MTCNN from TensorFlow
+                faces.append({
                     'box': [int(x1), int(y1), int(x2 - x1), int(y2 - y1)],
                     'confidence': float(prob),
                     'keypoints': {}  # We're not using keypoints here
                 })
 
-        return results
+        return kept_boxes, faces
+
+    def detect_face(self, img_array):
+        """
+        Detect faces in an image using MTCNN.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            list: List of detected face bounding boxes and probabilities
+        """
+        _, faces = self._detect(img_array)
+        return faces
 
     def extract_face(self, img_array, face_box):
         """
@@ -129,7 +247,7 @@ class AdvancedFacialRecognition:
         x2, y2 = x1 + width, y1 + height
 
         # Extract the face
-        face = img_array[y1:y2, x1:x2]
+        face = img_array[max(y1, 0):y2, max(x1, 0):x2]
 
         # Resize to required size
         face_image = Image.fromarray(face)
@@ -143,29 +261,162 @@ class AdvancedFacialRecognition:
         Generate embedding for a face using InceptionResNetV1.
 
         Args:
-            face_array (numpy.ndarray): Face image as numpy array
+            face_array (numpy.ndarray): Face image as numpy array (already cropped to the face)
 
         Returns:
             numpy.ndarray: Face embedding vector
         """
-        # Convert to PIL Image
-        face_image = Image.fromarray(face_array)
+        # Convert the crop to a standardized CHW tensor directly instead of running MTCNN on it again
+        face_tensor = torch.from_numpy(np.ascontiguousarray(face_array)).permute(2, 0, 1).float()
+        face_tensor = fixed_image_standardization(face_tensor)
+
+        return self.embed_face_tensor(face_tensor)
 
-        # Convert to tensor and normalize
-        # Use the MTCNN extract_face method to get a properly formatted tensor
-        # This is a workaround since the transform method is not available
-        face_tensor = self.detector(face_image, return_prob=False).unsqueeze(0).to(self.device)
+    def embed_face_tensor(self, face_tensor):
+        """
+        Generate embedding for an aligned face tensor as produced by MTCNN.
+
+        Args:
+            face_tensor (torch.Tensor): Standardized face tensor of shape (3, image_size, image_size)
+
+        Returns:
+            numpy.ndarray: Face embedding vector
+        """
+        if self.batcher is not None:
+            return self.batcher(face_tensor)
+
+        return self.embed_face_tensors([face_tensor])[0]
+
+    def embed_face_tensors(self, face_tensors):
+        """
+        Generate embeddings for several aligned face tensors in one forward pass.
+
+        Args:
+            face_tensors (list): Standardized face tensors of shape (3, image_size, image_size)
+
+        Returns:
+            list: Face embedding vectors, in input order
+        """
+        if self.optimized:
+            return list(self._project(self._embed_optimized(face_tensors)))
 
-        # Get embedding
         with torch.no_grad():
-            embedding = self.model(face_tensor).cpu().numpy()
+            embeddings = self.model(torch.stack(face_tensors).to(self.device)).cpu().numpy()
+
+        return list(self._project(embeddings))
+
+    def _embed_optimized(self, face_tensors):
+        """Run the TorchScript model on face tensors copied into the preallocated input buffer."""
+        count = len(face_tensors)
+        with self._input_lock:
+            # Grow the buffer if a caller passes more faces than it was sized for
+            if count > self._input_buffer.shape[0]:
+                shape = (count,) + tuple(self._input_buffer.shape[1:])
+                self._input_buffer = torch.zeros(shape, device=self.device).contiguous(memory_format=torch.channels_last)
+
+            with torch.inference_mode():
+                batch = self._input_buffer[:count]
+                for row, face_tensor in zip(batch, face_tensors):
+                    row.copy_(face_tensor)
+                embeddings = self.model(batch).cpu().numpy()
+
+        return embeddings
+
+    def get_info(self):
+        """
+        Describe the backend and its current state.
+
+        Returns:
+            dict: Backend name, database size, index and batching details
+        """
+        return {
+            'backend': self.backend,
+            'class': type(self).__name__,
+            'using_advanced': self.using_advanced,
+            'registered_faces': len(self.index),
+            'ann_index': self.ann_index is not None,
+            'max_templates': self.max_templates,
+            'embedding_dtype': self.index.dtype,
+            'projection': self.projection.version if self.projection is not None else None,
+            'index_bytes': self.index.nbytes,
+            'batching': self.batcher.stats() if self.batcher is not None else None,
+            'detection_max_side': self.detection_max_side,
+            'inference': {
+                'device': str(self.device),
+                'torchscript': self.optimized,
+                'channels_last': self.optimized,
+                'threads': torch.get_num_threads(),
+                'interop_threads': torch.get_num_interop_threads(),
+            },
+        }
+
+    def close(self):
+        """Stop the batching thread, if any."""
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def analyze_face(self, img_array):
+        """
+        Detect faces and embed the largest one with a single MTCNN pass.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            FaceAnalysis: Detected faces, the aligned face tensor and its embedding
+        """
+        faces, main_face, face_tensor = self._align_face(img_array)
+        if face_tensor is None:
+            return NO_FACE
+
+        embedding = self.embed_face_tensor(face_tensor)
 
-        return embedding[0]
+        return FaceAnalysis(faces=faces, largest_face=main_face, face_tensor=face_tensor, embedding=embedding)
+
+    def embed_face_crop(self, crop, box):
+        """
+        Embed a face from a crop whose face box is already known, without running detection.
+
+        The crop is aligned exactly as a detected face would be (MTCNN margin, resize
+        and standardization), using the given box instead of a detection.
+
+        Args:
+            crop (numpy.ndarray): Image region around the face as numpy array (RGB)
+            box (list): Face box [x, y, width, height] relative to the crop
+
+        Returns:
+            numpy.ndarray: Face embedding vector
+        """
+        x, y, width, height = box
+        face_tensor = self.detector.extract(Image.fromarray(crop), np.array([[x, y, x + width, y + height]]), None)
+        return self.embed_face_tensor(face_tensor)
+
+    def _align_face(self, img_array):
+        """
+        Detect faces and crop the largest one, without computing its embedding.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            tuple: (faces, largest face, aligned face tensor), with None for the last two if no face is found
+        """
+        boxes, faces = self._detect(img_array)
+        if not faces:
+            return faces, None, None
+
+        # Use the largest face (assuming it's the main face)
+        main_face = largest_face(faces)
+        box = boxes[faces.index(main_face)]
+
+        # Crop and standardize the face from the full-resolution frame
+        face_tensor = self.detector.extract(Image.fromarray(img_array), np.array([box]), None)
+        return faces, main_face, face_tensor
 
     def register_face(self, user_id, img_path=None, img_array=None):
         """
-        Register a face in the database. If the user already exists, compute the mean
-        of the existing embedding and the new one for better accuracy.
+        Register a face in the database. The new embedding is added to the user's
+        templates (keeping the most recent ones) and their centroid is updated.
 
         Args:
             user_id (str): User ID to associate with the face
@@ -175,47 +426,42 @@ class AdvancedFacialRecognition:
         Returns:
             bool: True if registration successful, False otherwise
         """
-        if img_path is None and img_array is None:
-            return False
-
-        # Load image if path is provided
+        img_array = load_image(img_path, img_array)
         if img_array is None:
-            img = cv2.imread(img_path)
-            img_array = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        # Detect faces
-        faces = self.detect_face(img_array)
-        if not faces:
             return False
 
-        # Use the largest face (assuming it's the main face)
-        largest_face = max(faces, key=lambda x: x['box'][2] * x['box'][3])
+        analysis = self.analyze_face(img_array)
+        if analysis.embedding is None:
+            return False
 
-        # Extract and get embedding
-        face_array = self.extract_face(img_array, largest_face)
-        new_embedding = self.get_embedding(face_array)
+        self._store_embedding(user_id, analysis.embedding)
 
-        # Check if user already exists in the database
-        if user_id in self.face_db:
-            # Get existing embedding
-            existing_embedding = self.face_db[user_id]
+        return True
 
-            # Compute mean embedding (average of existing and new)
-            embedding = (existing_embedding + new_embedding) / 2.0
+    def register_faces(self, user_id, images):
+        """
+        Register several images of one user with a single batched forward pass and one database write.
 
-            # Normalize the embedding to unit length
-            embedding = embedding / np.linalg.norm(embedding)
-        else:
-            # This is a new user, use the new embedding directly
-            embedding = new_embedding
+        Args:
+            user_id (str): User ID to associate with the faces
+            images (list): Images as RGB numpy arrays
 
-        # Save embedding to database
-        np.save(os.path.join(self.db_path, f"{user_id}.npy"), embedding)
+        Returns:
+            list: For each image, True if a face was found and used for the template
+        """
+        # Detect and align every frame first, then embed all crops together
+        face_tensors = []
+        used = []
+        for img_array in images:
+            _, _, face_tensor = self._align_face(img_array)
+            used.append(face_tensor is not None)
+            if face_tensor is not None:
+                face_tensors.append(face_tensor)
 
-        # Update in-memory database
-        self.face_db[user_id] = embedding
+        if face_tensors:
+            self._store_embeddings(user_id, self.embed_face_tensors(face_tensors))
 
-        return True
+        return used
 
     def recognize_face(self, img_path=None, img_array=None):
         """
@@ -228,40 +474,85 @@ class AdvancedFacialRecognition:
         Returns:
             tuple: (user_id, confidence) if face recognized, (None, 0) otherwise
         """
-        if img_path is None and img_array is None:
-            return None, 0
-
-        # Load image if path is provided
+        img_array = load_image(img_path, img_array)
         if img_array is None:
-            img = cv2.imread(img_path)
-            img_array = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            return None, 0
 
-        # Detect faces
-        faces = self.detect_face(img_array)
-        if not faces:
+        analysis = self.analyze_face(img_array)
+        if analysis.embedding is None:
             return None, 0
 
-        # Use the largest face (assuming it's the main face)
-        largest_face = max(faces, key=lambda x: x['box'][2] * x['box'][3])
+        return self.recognize_embedding(analysis.embedding)
 
-        # Extract and get embedding
-        face_array = self.extract_face(img_array, largest_face)
-        embedding = self.get_embedding(face_array)
+    def recognize_embedding(self, embedding):
+        """
+        Identify the registered user closest to an embedding.
 
-        # Compare with database
-        best_match = None
-        best_score = 0.0  # Initialize with worst possible score (for cosine similarity, higher is better)
+        Args:
+            embedding (numpy.ndarray): Face embedding
 
-        for user_id, db_embedding in self.face_db.items():
-            # Calculate cosine similarity (higher is more similar)
-            similarity = 1 - cosine(embedding, db_embedding)  # Convert distance to similarity
+        Returns:
+            tuple: (user_id, confidence) if recognized, (None, best score) otherwise
+        """
+        # Compare with the enrolled embeddings (exact matrix search or IVF index)
+        matches = self.search_embedding(embedding, k=1)
 
-            if similarity > best_score:
-                best_score = similarity
-                best_match = user_id
+        if not matches:
+            return None, 0.0
+
+        # Cosine similarity of the best match (higher is more similar)
+        best_match, best_score = matches[0]
 
         # Check if the best match is above the threshold
-        if best_match is not None and best_score >= self.threshold:
+        if best_score >= self.threshold:
             return best_match, best_score
         else:
             return None, best_score
+
+    def verify_face(self, claimed_id, img_path=None, img_array=None):
+        """
+        Verify that a face belongs to a claimed user (1:1 verification).
+
+        Unlike recognize_face, only the claimed user's embedding is compared, so the
+        cost does not grow with the number of enrolled users.
+
+        Args:
+            claimed_id (str): User ID the face is claimed to belong to
+            img_path (str, optional): Path to the image file
+            img_array (numpy.ndarray, optional): Image as numpy array
+
+        Returns:
+            tuple: (matched, confidence) where confidence is the cosine similarity
+        """
+        # Skip detection and embedding entirely if the claimed user is not enrolled
+        if not self._is_registered(claimed_id):
+            return False, 0.0
+
+        img_array = load_image(img_path, img_array)
+        if img_array is None:
+            return False, 0.0
+
+        analysis = self.analyze_face(img_array)
+        if analysis.embedding is None:
+            return False, 0.0
+
+        return self.verify_embedding(claimed_id, analysis.embedding)
+
+    def verify_embedding(self, claimed_id, embedding):
+        """
+        Compare an embedding with a claimed user's embedding.
+
+        Args:
+            claimed_id (str): User ID the face is claimed to belong to
+            embedding (numpy.ndarray): Face embedding
+
+        Returns:
+            tuple: (matched, confidence) where confidence is the cosine similarity
+        """
+        similarity = self._claimed_similarity(claimed_id, embedding)
+
+        if similarity is None:
+            return False, 0.0
+
+        # Higher similarity is better
+        return similarity >= self.threshold, similarity
@@ -0,0 +1,348 @@
+"""
+Approximate nearest-neighbour (ANN) index for large-scale face identification.
+
+This is an inverted-file (IVF) index built in NumPy. Spherical k-means splits
+the normalized embeddings into n_lists clusters; every embedding is stored in
+the inverted list of its nearest centroid. A query is compared with the
+centroids first and then only with the embeddings in the n_probe closest
+lists, so a search touches roughly n_probe / n_lists of the database.
+
+The lists only hold row positions into the EmbeddingIndex that serves exact
+search, so the embeddings are kept once, in that index's (possibly compact)
+format. Only the trained centroids and the list assignments are persisted (next
+to the embedding store, as ivf_index.npz), so the embeddings can never go stale.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from .embedding_index import normalize
+
+INDEX_FILENAME = 'ivf_index.npz'
+
+
+def _assign(matrix, centroids, chunk_size=8192):
+    """Return the nearest centroid for every row, in chunks to bound memory use."""
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_size):
+        scores = matrix[start:start + chunk_size] @ centroids.T
+        assignments[start:start + chunk_size] = np.argmax(scores, axis=1)
+    return assignments
+
+
+def train_centroids(matrix, n_lists, n_iter=20, sample_size=50000, seed=0):
+    """
+    Train IVF centroids with spherical k-means.
+
+    Args:
+        matrix (numpy.ndarray): Normalized embeddings, one per row
+        n_lists (int): Number of clusters
+        n_iter (int): Number of k-means iterations
+        sample_size (int): Maximum number of rows used for training
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: Normalized centroids, one per row
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(matrix, dtype=np.float32)
+
+    if matrix.shape[0] > sample_size:
+        matrix = matrix[rng.choice(matrix.shape[0], sample_size, replace=False)]
+
+    n_lists = max(1, min(n_lists, matrix.shape[0]))
+    centroids = matrix[rng.choice(matrix.shape[0], n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = _assign(matrix, centroids)
+
+        # Sum the members of each cluster with one sort instead of a Python loop
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        occupied = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[occupied]
+        sums = np.add.reduceat(matrix[order], starts, axis=0)
+
+        new_centroids = centroids.copy()
+        new_centroids[occupied] = normalize(sums)
+
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            new_centroids[empty] = matrix[rng.choice(matrix.shape[0], empty.size, replace=False)]
+
+        centroids = new_centroids
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    An inverted-file index over the rows of an EmbeddingIndex.
+
+    The inverted lists hold row positions into the EmbeddingIndex matrix, not
+    copies of the embeddings, so the index adds only a few bytes per user and
+    scores candidates in whatever format (float32, float16 or int8) the matrix is
+    kept in. Rows moved by EmbeddingIndex.remove() are followed through its
+    on_row_moved callback.
+
+    Attributes:
+        centroids (numpy.ndarray): Normalized cluster centroids
+        n_probe (int): Default number of lists scanned per query
+        vectors (EmbeddingIndex): Index whose rows are searched, set by populate()
+    """
+
+    def __init__(self, centroids, n_probe=8):
+        """
+        Initialize an empty index with trained centroids.
+
+        Args:
+            centroids (numpy.ndarray): Cluster centroids, one per row
+            n_probe (int): Default number of lists scanned per query
+        """
+        self.centroids = normalize(centroids)
+        self.n_probe = n_probe
+        self.dim = self.centroids.shape[1]
+        self.vectors = None
+        self._reset_lists()
+        self._saved_assignments = {}
+
+    def _reset_lists(self):
+        """Empty every inverted list."""
+        self._list_ids = [np.empty(0, dtype=object) for _ in range(self.n_lists)]
+        self._list_rows = [np.empty(0, dtype=np.intp) for _ in range(self.n_lists)]
+        self._where = {}
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, user_id):
+        return user_id in self._where
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_probe=8, n_iter=20, sample_size=50000, seed=0):
+        """
+        Train a new index over the rows of an EmbeddingIndex and fill it.
+
+        Args:
+            vectors (EmbeddingIndex): Embeddings to index
+            n_lists (int, optional): Number of lists; defaults to about sqrt(N)
+            n_probe (int): Default number of lists scanned per query
+            n_iter (int): Number of k-means iterations
+            sample_size (int): Maximum number of rows used for training
+            seed (int): Random seed
+
+        Returns:
+            IVFIndex: The populated index
+        """
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(vectors))))
+
+        # Only the training sample is dequantized, not the whole matrix
+        rows = np.arange(len(vectors))
+        if rows.size > sample_size:
+            rows = np.sort(np.random.default_rng(seed).choice(rows.size, sample_size, replace=False))
+
+        centroids = train_centroids(vectors.take(rows), n_lists, n_iter=n_iter, sample_size=sample_size, seed=seed)
+        index = cls(centroids, n_probe=n_probe)
+        index.populate(vectors)
+        return index
+
+    def populate(self, vectors, chunk_size=8192):
+        """
+        Index every row of an EmbeddingIndex, replacing the current lists.
+
+        Persisted assignments are reused for known IDs; other rows are assigned to
+        their nearest centroid.
+
+        Args:
+            vectors (EmbeddingIndex): Embeddings to index; later set()/remove() calls on it
+                must be mirrored with add()/remove()
+            chunk_size (int): Rows dequantized at a time while assigning
+        """
+        self.vectors = vectors
+        vectors.on_row_moved = self._move_row
+        self._reset_lists()
+
+        ids = vectors.ids
+        if ids.size == 0:
+            return
+
+        assignments = np.empty(ids.size, dtype=np.int64)
+        for start in range(0, ids.size, chunk_size):
+            block = vectors.take(np.arange(start, min(start + chunk_size, ids.size)))
+            assignments[start:start + chunk_size] = _assign(block, self.centroids)
+
+        for row, user_id in enumerate(ids):
+            saved = self._saved_assignments.get(user_id)
+            if saved is not None and saved < self.n_lists:
+                assignments[row] = saved
+
+        for list_no in np.unique(assignments):
+            members = np.flatnonzero(assignments == list_no)
+            self._list_ids[list_no] = ids[members]
+            self._list_rows[list_no] = members.astype(np.intp)
+            for user_id in ids[members]:
+                self._where[user_id] = int(list_no)
+
+    def add(self, user_id, embedding):
+        """
+        Insert or reassign a user after their row was set in the EmbeddingIndex.
+
+        Args:
+            user_id (str): User ID
+            embedding (numpy.ndarray): The user's embedding, used to pick the list
+        """
+        row = self.vectors.rows_of([user_id])
+        if row.size == 0:
+            raise KeyError(f"User {user_id} is not in the embedding index")
+        if user_id in self._where:
+            self.remove(user_id)
+
+        list_no = int(np.argmax(self.centroids @ normalize(np.ravel(embedding))))
+        self._list_ids[list_no] = np.append(self._list_ids[list_no], np.array([user_id], dtype=object))
+        self._list_rows[list_no] = np.append(self._list_rows[list_no], row)
+        self._where[user_id] = list_no
+
+    def remove(self, user_id):
+        """
+        Remove a user.
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            bool: True if the user was present
+        """
+        list_no = self._where.pop(user_id, None)
+        if list_no is None:
+            return False
+
+        keep = self._list_ids[list_no] != user_id
+        self._list_ids[list_no] = self._list_ids[list_no][keep]
+        self._list_rows[list_no] = self._list_rows[list_no][keep]
+        return True
+
+    def _move_row(self, user_id, old_row, new_row):
+        """Follow a row that EmbeddingIndex.remove() moved into a freed slot."""
+        list_no = self._where.get(user_id)
+        if list_no is None:
+            return
+        rows = self._list_rows[list_no]
+        rows[rows == old_row] = new_row
+
+    def search(self, embedding, k=1, n_probe=None):
+        """
+        Find the approximately k most similar users to a query embedding.
+
+        Args:
+            embedding (numpy.ndarray): Query embedding
+            k (int): Number of results to return
+            n_probe (int, optional): Number of lists to scan; defaults to self.n_probe
+
+        Returns:
+            list: (user_id, similarity) tuples sorted by decreasing similarity
+        """
+        query = normalize(np.ravel(embedding))
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+
+        centroid_scores = self.centroids @ query
+        if n_probe < self.n_lists:
+            probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        else:
+            probe = np.arange(self.n_lists)
+
+        probe = [list_no for list_no in probe if self._list_ids[list_no].size]
+        if not probe:
+            return []
+
+        ids = np.concatenate([self._list_ids[list_no] for list_no in probe])
+        rows = np.concatenate([self._list_rows[list_no] for list_no in probe])
+        scores = self.vectors.similarities(query, rows)
+
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top]
+
+    def save(self, path):
+        """
+        Persist the centroids and list assignments, atomically replacing an existing file.
+
+        Args:
+            path (str): Destination .npz file
+        """
+        ids = list(self._where)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                n_probe=np.array(self.n_probe),
+                ids=np.array(ids, dtype=str),
+                assignments=np.array([self._where[user_id] for user_id in ids], dtype=np.int64),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a persisted index. Call populate() to fill it with embeddings.
+
+        Args:
+            path (str): .npz file written by save()
+
+        Returns:
+            IVFIndex: An empty index that remembers the persisted assignments
+        """
+        with np.load(path) as data:
+            index = cls(data['centroids'], n_probe=int(data['n_probe']))
+            index._saved_assignments = dict(zip(data['ids'].tolist(), data['assignments'].tolist()))
+        return index
+
+
+def benchmark_index(ann_index, exact_index, queries, k=10, n_probe_values=(1, 2, 4, 8, 16, 32)):
+    """
+    Measure recall and latency of an IVF index against exact search.
+
+    Args:
+        ann_index (IVFIndex): Index under test
+        exact_index (EmbeddingIndex): Brute-force index over the same embeddings
+        queries (numpy.ndarray): Query embeddings, one per row
+        k (int): Number of neighbours used for recall@k
+        n_probe_values (sequence): n_probe settings to evaluate
+
+    Returns:
+        list: One dict per n_probe value with recall, ann_ms and exact_ms
+    """
+    start = time.perf_counter()
+    truth = [set(user_id for user_id, _ in exact_index.search(query, k=k)) for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+    results = []
+    for n_probe in n_probe_values:
+        if n_probe > ann_index.n_lists:
+            break
+
+        hits = 0
+        start = time.perf_counter()
+        found = [ann_index.search(query, k=k, n_probe=n_probe) for query in queries]
+        ann_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+        for expected, matches in zip(truth, found):
+            hits += len(expected & set(user_id for user_id, _ in matches))
+
+        results.append({
+            'n_probe': n_probe,
+            'recall': hits / max(sum(len(expected) for expected in truth), 1),
+            'ann_ms': ann_ms,
+            'exact_ms': exact_ms,
+        })
+
+    return results
@@ -0,0 +1,179 @@
+"""
+Micro-batching scheduler for face embedding inference.
+
+Under threaded workers many voters can be verified at the same time, and each
+request would otherwise run the embedding model on a batch of one. The
+MicroBatcher collects concurrent requests for a short window (or until a maximum
+batch size is reached), runs one batched forward pass on a background thread and
+hands each caller its own result through a concurrent.futures.Future.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-item calls into batched calls of a function.
+
+    Attributes:
+        batch_fn (callable): Function taking a list of items and returning a list of results
+        window (float): Maximum time in seconds to wait for more items after the first one
+        max_batch_size (int): Maximum number of items per batch
+        timeout (float): Maximum time in seconds a call waits for its result
+    """
+
+    def __init__(self, batch_fn, window_ms=10, max_batch_size=16, name='face-batcher', timeout=30.0):
+        """
+        Initialize the batcher and start its worker thread.
+
+        Args:
+            batch_fn (callable): Function taking a list of items and returning a list of results
+            window_ms (float): Maximum time in milliseconds to wait for more items
+            max_batch_size (int): Maximum number of items per batch
+            name (str): Name of the worker thread
+            timeout (float): Maximum time in seconds a call waits for its result
+        """
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._items = 0
+        self._total_delay = 0.0
+        self._max_delay = 0.0
+        # Guards _closed so nothing can be queued behind _STOP
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch.
+
+        Args:
+            item: Input for batch_fn
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result
+
+        Raises:
+            RuntimeError: If the batcher is closed
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('MicroBatcher is closed')
+            self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item):
+        """
+        Submit an item and wait for its result.
+
+        Raises:
+            concurrent.futures.TimeoutError: If no result arrives within self.timeout seconds
+        """
+        return self.submit(item).result(timeout=self.timeout)
+
+    def _collect(self):
+        """Block for the first item, then gather more until the window or batch size is reached."""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # Finish this batch, then stop
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                for _, _, queued in batch:
+                    delay = started - queued
+                    self._items += 1
+                    self._total_delay += delay
+                    self._max_delay = max(self._max_delay, delay)
+
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        """
+        Return batching metrics.
+
+        Returns:
+            dict: Batch-size distribution and queueing delay in milliseconds
+        """
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                'batches': batches,
+                'items': self._items,
+                'mean_batch_size': self._items / batches if batches else 0.0,
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+                'mean_queue_delay_ms': 1000 * self._total_delay / self._items if self._items else 0.0,
+                'max_queue_delay_ms': 1000 * self._max_delay,
+            }
+
+    def close(self, timeout=5.0):
+        """Process already queued items and stop the worker thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+        # Fail whatever the worker did not get to before the timeout
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP:
+                entry[1].set_exception(RuntimeError('MicroBatcher was closed before the item was processed'))
+
+        # A worker still busy with a batch must find the stop marker afterwards
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
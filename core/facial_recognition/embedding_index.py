@@ -0,0 +1,279 @@
+"""
+In-memory embedding matrix used for vectorized face matching.
+
+All enrolled embeddings are kept L2-normalized in one contiguous float32 matrix,
+with a parallel array of user IDs. Matching a query is a single matrix-vector
+product followed by argmax/top-k, instead of one Python-level cosine call per
+enrolled user. Rows are inserted, replaced and removed incrementally so the
+matrix never has to be rebuilt from the face database.
+
+A search can be restricted to a subset of rows (e.g. the voters eligible for one
+voting); rows_of() maps user IDs to row positions, which stay valid until the
+layout version changes. An index built on top of the rows (see ann_index.py) can
+follow rows that remove() moves through the on_row_moved callback.
+
+The matrix can also be kept in a compact form (float16, or int8 with a scale per
+row; see quantization.py) to reduce memory use and search bandwidth.
+"""
+
+import numpy as np
+
+from . import quantization
+
+
+def normalize(embedding):
+    """
+    L2-normalize an embedding (or each row of a matrix of embeddings).
+
+    Args:
+        embedding (numpy.ndarray): Vector or 2-D matrix of vectors
+
+    Returns:
+        numpy.ndarray: float32 array of unit-length vectors
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norms = np.linalg.norm(embedding, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embedding / norms
+
+
+class EmbeddingIndex:
+    """
+    A contiguous matrix of normalized embeddings with one row per user.
+
+    Attributes:
+        dim (int): Embedding dimension, fixed by the first inserted vector
+        dtype (str): Element type the rows are kept in ('float32', 'float16' or 'int8')
+        ids (numpy.ndarray): User IDs of the active rows, in row order
+        matrix (numpy.ndarray): Normalized float32 embeddings of the active rows
+        layout_version (int): Incremented whenever rows are added, moved or removed
+        on_row_moved (callable): Called as on_row_moved(user_id, old_row, new_row) when remove()
+            moves a row, or None
+    """
+
+    def __init__(self, dim=None, capacity=64, dtype='float32'):
+        """
+        Initialize an empty index.
+
+        Args:
+            dim (int, optional): Embedding dimension; inferred from the first insert if omitted
+            capacity (int): Number of rows to preallocate
+            dtype (str): Element type the rows are kept in ('float32', 'float16' or 'int8')
+        """
+        self.dim = dim
+        self.dtype = quantization.check_dtype(dtype)
+        self._capacity = capacity
+        self._size = 0
+        self._rows = {}
+        self.layout_version = 0
+        self.on_row_moved = None
+        self._ids = np.empty(capacity, dtype=object)
+        self._matrix = np.empty((capacity, dim), dtype=self.dtype) if dim else None
+        # Per-row scales of int8 codes
+        self._scales = np.empty(capacity, dtype=np.float32) if self.dtype == 'int8' else None
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        scales = self._scales[:self._size] if self._scales is not None else None
+        return quantization.dequantize(self._matrix[:self._size], scales)
+
+    @property
+    def nbytes(self):
+        """Memory used by the active rows."""
+        if self._matrix is None:
+            return 0
+        row_bytes = self._matrix.itemsize * self.dim + (self._scales.itemsize if self._scales is not None else 0)
+        return row_bytes * self._size
+
+    def _grow(self, min_capacity):
+        """Grow the preallocated buffers geometrically to hold at least min_capacity rows."""
+        capacity = max(self._capacity * 2, min_capacity)
+
+        matrix = np.empty((capacity, self.dim), dtype=self.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        if self._scales is not None:
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+
+        self._matrix = matrix
+        self._ids = ids
+        self._capacity = capacity
+
+    def set(self, user_id, embedding):
+        """
+        Insert a user's embedding, replacing the existing row if there is one.
+
+        Args:
+            user_id (str): User ID
+            embedding (numpy.ndarray): Embedding vector (normalized on insert)
+        """
+        vector = normalize(np.ravel(embedding))
+
+        if self._matrix is None:
+            self.dim = vector.shape[0]
+            self._matrix = np.empty((self._capacity, self.dim), dtype=self.dtype)
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding dimension {vector.shape[0]} does not match index dimension {self.dim}")
+
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._size == self._capacity:
+                self._grow(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._rows[user_id] = row
+            self._ids[row] = user_id
+            self.layout_version += 1
+
+        codes, scales = quantization.quantize(vector[np.newaxis], self.dtype)
+        self._matrix[row] = codes[0]
+        if scales is not None:
+            self._scales[row] = scales[0]
+
+    def remove(self, user_id):
+        """
+        Remove a user's row by moving the last row into its place.
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            bool: True if the user was present
+        """
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return False
+
+        last = self._size - 1
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            if self._scales is not None:
+                self._scales[row] = self._scales[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+            if self.on_row_moved is not None:
+                self.on_row_moved(moved_id, last, row)
+
+        self._ids[last] = None
+        self._size = last
+        self.layout_version += 1
+        return True
+
+    def clear(self):
+        """Remove all rows while keeping the allocated buffers."""
+        self._rows = {}
+        self._ids[:self._size] = None
+        self._size = 0
+        self.layout_version += 1
+
+    def rows_of(self, user_ids):
+        """
+        Row positions of the given users, skipping those not in the index.
+
+        Args:
+            user_ids (iterable): User IDs
+
+        Returns:
+            numpy.ndarray: Sorted row positions, valid until layout_version changes
+        """
+        rows = [self._rows[user_id] for user_id in user_ids if user_id in self._rows]
+        return np.array(sorted(rows), dtype=np.intp)
+
+    def take(self, rows):
+        """
+        Normalized float32 embeddings of the given rows.
+
+        Args:
+            rows (numpy.ndarray): Row positions
+
+        Returns:
+            numpy.ndarray: One embedding per row, dequantized if the index is compact
+        """
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        scales = self._scales[rows] if self._scales is not None else None
+        return quantization.dequantize(self._matrix[rows], scales)
+
+    def similarities(self, embedding, rows=None):
+        """
+        Compute cosine similarity between a query and every row, or only the given rows.
+
+        Args:
+            embedding (numpy.ndarray): Query embedding
+            rows (numpy.ndarray, optional): Row positions from rows_of()
+
+        Returns:
+            numpy.ndarray: Similarity per row, aligned with ids (or with rows)
+        """
+        if self._size == 0 or (rows is not None and len(rows) == 0):
+            return np.empty(0, dtype=np.float32)
+
+        query = normalize(np.ravel(embedding))
+        if rows is None:
+            scales = self._scales[:self._size] if self._scales is not None else None
+            return quantization.similarities(self._matrix[:self._size], query, scales)
+
+        # Gather only the requested rows; the rest of the matrix is never read
+        scales = self._scales[rows] if self._scales is not None else None
+        return quantization.similarities(self._matrix[rows], query, scales)
+
+    def similarity(self, user_id, embedding):
+        """
+        Compute cosine similarity between a query and a single user's row.
+
+        Args:
+            user_id (str): User ID to compare against
+            embedding (numpy.ndarray): Query embedding
+
+        Returns:
+            float: Similarity, or None if the user is not in the index
+        """
+        row = self._rows.get(user_id)
+        if row is None:
+            return None
+        similarity = float(self._matrix[row].astype(np.float32) @ normalize(np.ravel(embedding)))
+        if self._scales is not None:
+            similarity *= float(self._scales[row])
+        return similarity
+
+    def search(self, embedding, k=1, rows=None):
+        """
+        Find the k most similar users to a query embedding.
+
+        Args:
+            embedding (numpy.ndarray): Query embedding
+            k (int): Number of results to return
+            rows (numpy.ndarray, optional): Only search these row positions (from rows_of())
+
+        Returns:
+            list: (user_id, similarity) tuples sorted by decreasing similarity
+        """
+        scores = self.similarities(embedding, rows)
+        if scores.size == 0:
+            return []
+
+        k = min(k, scores.size)
+        if k == 1:
+            top = np.array([np.argmax(scores)])
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+        ids = self.ids if rows is None else self._ids[rows]
+        return [(ids[i], float(scores[i])) for i in top]
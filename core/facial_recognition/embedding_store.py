@@ -0,0 +1,553 @@
+"""
+Packed, memory-mapped storage for face embeddings.
+
+Instead of one <user_id>.npy file per user, all embeddings live in a single
+append-only matrix file (float32 by default) that is memory-mapped read-only. A small
+append-only log next to it maps rows to user IDs:
+
+    A <row> <user_id>    row <row> holds the current embedding of <user_id>
+    D <user_id>          <user_id> was deleted (tombstone)
+
+Updating a user appends a new row and the older row becomes dead. Compaction
+writes the live rows to a new generation of files and then atomically replaces
+store.json, which names the current generation, so readers always see either the
+old or the new files. Writers take an exclusive file lock, so several worker
+processes can share one store directory.
+
+The log doubles as a change feed between processes: poll() checks with two stat()
+calls whether another process appended to the log or switched generation, and
+pop_changes() hands the affected user IDs to whoever keeps derived state (such as
+the in-memory search index) so it can apply just those inserts and deletes.
+
+store.json also records the element type of the matrix file and the version tag
+of the projection (see projection.py) the stored vectors were written with, or null
+for raw model embeddings. An existing store is always reopened with its recorded
+element type, whatever dtype is requested; the requested one only applies to new stores.
+
+A rewrite can be staged without switching to it: stage_rewrite() writes the next
+generation and a store.pending.json naming it, and commit_pending() later renames
+that file over store.json. This lets several stores switch together once some other
+file (such as the projection) has been atomically replaced.
+
+Legacy <user_id>.npy files are imported once when the store is first created.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+STORE_FORMAT = 1
+META_FILENAME = 'store.json'
+PENDING_META_FILENAME = 'store.pending.json'
+LOCK_FILENAME = 'store.lock'
+
+
+class _FileLock:
+    """Exclusive inter-process lock on a file (no-op where fcntl is unavailable)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class EmbeddingStore:
+    """
+    A dict-like store of one embedding per user backed by a packed matrix file.
+
+    Attributes:
+        db_path (str): Directory containing the store files
+        dim (int): Embedding dimension, fixed by the first stored vector
+        generation (int): Current file generation, incremented by compaction
+        projection (str): Version tag of the projection applied to the stored vectors, or None
+    """
+
+    def __init__(self, db_path, dtype=np.float32):
+        """
+        Open (or create) the store in a directory.
+
+        Args:
+            db_path (str): Directory containing the store files
+            dtype (numpy.dtype): Element type of the matrix file of a new store (an existing
+                store keeps the element type it was created with)
+        """
+        self.db_path = db_path
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.generation = 0
+        self.projection = None
+
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._row_count = 0
+        self._log_offset = 0
+        self._mmap = None
+        self._meta_stamp = None
+        # Users changed by other processes since the last pop_changes(), and whether the store was reloaded
+        self._changed = set()
+        self._reloaded = True
+
+        os.makedirs(db_path, exist_ok=True)
+
+        with self._file_lock():
+            if not os.path.exists(self._meta_path):
+                self._write_meta(0, None)
+                self._import_legacy_files()
+            self._load()
+
+    # ------------------------------------------------------------------
+    # Paths and metadata
+    # ------------------------------------------------------------------
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.db_path, META_FILENAME)
+
+    def _data_path(self, generation=None, dtype=None):
+        generation = self.generation if generation is None else generation
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        # Name the file after its element type (e.g. .f32, .f16)
+        suffix = f'{dtype.kind}{dtype.itemsize * 8}'
+        return os.path.join(self.db_path, f'embeddings-{generation}.{suffix}')
+
+    def _stored_dtype(self, meta):
+        """Element type of an existing store, from store.json or, for older stores, its data file name."""
+        if meta.get('dtype'):
+            return np.dtype(meta['dtype'])
+        for dtype in (np.float32, np.float16):
+            if os.path.exists(self._data_path(meta['generation'], dtype)):
+                return np.dtype(dtype)
+        return self.dtype
+
+    def _log_path(self, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.db_path, f'embeddings-{generation}.log')
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.db_path, LOCK_FILENAME))
+
+    def _read_meta(self):
+        with open(self._meta_path) as f:
+            return json.load(f)
+
+    def _stat_meta(self):
+        """Identify the current store.json; it is replaced (new inode) on every write."""
+        stat = os.stat(self._meta_path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @property
+    def _pending_meta_path(self):
+        return os.path.join(self.db_path, PENDING_META_FILENAME)
+
+    def _write_meta(self, generation, dim, path=None, projection=None):
+        """Atomically replace store.json (or write a staged one to path)."""
+        if path is None:
+            path, projection = self._meta_path, self.projection
+        meta = {'format': STORE_FORMAT, 'generation': generation, 'dim': dim, 'dtype': self.dtype.name,
+                'projection': projection}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if path == self._meta_path:
+            self._meta_stamp = self._stat_meta()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        """Load the current generation from disk, discarding in-memory state."""
+        self._meta_stamp = self._stat_meta()
+        meta = self._read_meta()
+        self.generation = meta['generation']
+        self.dim = meta['dim']
+        self.dtype = self._stored_dtype(meta)
+        self.projection = meta.get('projection')
+        self._rows = {}
+        self._row_count = 0
+        self._log_offset = 0
+        self._mmap = None
+        self._changed = set()
+        self._reloaded = True
+        self._read_log(track_changes=False)
+
+    def _read_log(self, track_changes=True):
+        """Apply log entries written since the last read."""
+        log_path = self._log_path()
+        if not os.path.exists(log_path):
+            return
+
+        with open(log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+
+        # Ignore a trailing partial line left by an interrupted write
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8').splitlines():
+            parts = line.split(' ', 2)
+            if parts[0] == 'A' and len(parts) == 3:
+                row = int(parts[1])
+                self._rows[parts[2]] = row
+                self._row_count = max(self._row_count, row + 1)
+            elif parts[0] == 'D' and len(parts) == 2:
+                self._rows.pop(parts[1], None)
+            else:
+                continue
+            if track_changes:
+                self._changed.add(parts[-1])
+
+        self._log_offset += end
+
+    def _import_legacy_files(self):
+        """Import <user_id>.npy files written by earlier versions."""
+        for filename in sorted(os.listdir(self.db_path)):
+            if filename.endswith('.npy'):
+                user_id = filename.split('.')[0]
+                embedding = np.load(os.path.join(self.db_path, filename))
+                self._append(user_id, embedding)
+
+    def refresh(self):
+        """
+        Pick up changes written by other processes.
+
+        Applies new log entries, or reloads everything if the store was compacted.
+        """
+        with self._lock:
+            self._meta_stamp = self._stat_meta()
+            meta = self._read_meta()
+            if meta['generation'] != self.generation:
+                self._load()
+            else:
+                # Another process may have set the dimension of a previously empty store
+                self.dim = meta['dim']
+                self._read_log()
+
+    def poll(self):
+        """
+        Refresh the store if another process changed it since the last refresh.
+
+        Only stat()s store.json and the log when nothing changed.
+
+        Returns:
+            bool: True if the store was refreshed
+        """
+        try:
+            changed = self._stat_meta() != self._meta_stamp
+            if not changed:
+                log_path = self._log_path()
+                log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+                changed = log_size != self._log_offset
+        except FileNotFoundError:
+            changed = True
+
+        if changed:
+            self.refresh()
+        return changed
+
+    def pop_changes(self):
+        """
+        Return and forget the changes picked up from other processes.
+
+        Returns:
+            tuple: (reloaded, user_ids) where reloaded is True if the store was loaded from
+                scratch (first open, compaction or rewrite) and user_ids are the users inserted,
+                updated or deleted by other processes since the last call
+        """
+        with self._lock:
+            reloaded, changed = self._reloaded, self._changed
+            self._reloaded = False
+            self._changed = set()
+            return reloaded, changed
+
+    # ------------------------------------------------------------------
+    # Mapping interface
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    def __iter__(self):
+        return iter(list(self._rows))
+
+    def __getitem__(self, user_id):
+        embedding = self.get(user_id)
+        if embedding is None:
+            raise KeyError(user_id)
+        return embedding
+
+    def keys(self):
+        return list(self._rows)
+
+    def items(self):
+        """Return (user_id, embedding) pairs for all live rows."""
+        with self._lock:
+            matrix = self._matrix()
+            return [(user_id, matrix[row]) for user_id, row in self._rows.items()]
+
+    def get(self, user_id, default=None):
+        """
+        Return a user's embedding as a read-only view into the memory map.
+
+        Args:
+            user_id (str): User ID
+            default: Value returned if the user has no embedding
+
+        Returns:
+            numpy.ndarray: The stored embedding
+        """
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return default
+            return self._matrix()[row]
+
+    def _matrix(self):
+        """Return the memory-mapped matrix, remapping it if rows were appended."""
+        if self._row_count == 0:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+
+        if self._mmap is None or self._mmap.shape[0] < self._row_count:
+            self._mmap = np.memmap(self._data_path(), dtype=self.dtype, mode='r',
+                                   shape=(self._row_count, self.dim))
+        return self._mmap
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def _append(self, user_id, embedding):
+        """Write one row and its log entry. The file lock must be held."""
+        embedding = np.ascontiguousarray(np.ravel(embedding), dtype=self.dtype)
+
+        if self.dim is None:
+            self.dim = embedding.shape[0]
+            self._write_meta(self.generation, self.dim)
+        elif embedding.shape[0] != self.dim:
+            raise ValueError(f"Embedding dimension {embedding.shape[0]} does not match store dimension {self.dim}")
+
+        row = self._row_count
+        data_path = self._data_path()
+        mode = 'r+b' if os.path.exists(data_path) else 'wb'
+        with open(data_path, mode) as f:
+            # Seek instead of appending so that a row orphaned by a crash is overwritten
+            f.seek(row * self.dim * self.dtype.itemsize)
+            f.write(embedding.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._write_log_line(f'A {row} {user_id}')
+        self._rows[user_id] = row
+        self._row_count = row + 1
+
+    def _write_log_line(self, line):
+        with open(self._log_path(), 'ab') as f:
+            f.write((line + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_offset = f.tell()
+
+    def put(self, user_id, embedding):
+        """
+        Store a user's embedding, superseding any previous one.
+
+        Args:
+            user_id (str): User ID
+            embedding (numpy.ndarray): Embedding vector
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            self._append(user_id, embedding)
+
+    def delete(self, user_id):
+        """
+        Delete a user's embedding by writing a tombstone.
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            bool: True if the user had an embedding
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            if user_id not in self._rows:
+                return False
+            self._write_log_line(f'D {user_id}')
+            del self._rows[user_id]
+            return True
+
+    @property
+    def dead_rows(self):
+        """Number of rows in the matrix file that are superseded or deleted."""
+        return self._row_count - len(self._rows)
+
+    def compact(self):
+        """
+        Rewrite the store with only the live rows.
+
+        The new matrix and log are written under a new generation number and become
+        visible when store.json is atomically replaced; the old files are then removed.
+
+        Returns:
+            int: Number of dead rows that were dropped
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            dropped = self.dead_rows
+
+            user_ids = list(self._rows)
+            matrix = self._matrix()
+            rows = [self._rows[user_id] for user_id in user_ids]
+            live = np.asarray(matrix[rows], dtype=self.dtype) if rows else np.empty((0, self.dim or 0), dtype=self.dtype)
+
+            self._write_generation(user_ids, live)
+            return dropped
+
+    def rewrite(self, transform, projection):
+        """
+        Replace every stored vector with a transformed one, e.g. after fitting a projection.
+
+        Args:
+            transform (callable): Called with the user IDs and the (n, dim) matrix of their vectors;
+                returns the new (n, new_dim) matrix
+            projection (str): Version tag to record for the new vectors, or None
+        """
+        with self._lock:
+            self.stage_rewrite(transform, projection)
+            self.commit_pending(projection)
+
+    def stage_rewrite(self, transform, projection):
+        """
+        Write transformed vectors as the next generation without switching to it.
+
+        The store keeps serving the current generation until commit_pending() is called
+        with the same projection tag. Rows written in between are not carried over.
+
+        Args:
+            transform (callable): Called with the user IDs and the (n, dim) matrix of their vectors;
+                returns the new (n, new_dim) matrix
+            projection (str): Version tag to record for the new vectors, or None
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            user_ids = list(self._rows)
+            matrix = self._matrix()
+            live = np.asarray(matrix[[self._rows[user_id] for user_id in user_ids]], dtype=np.float32)
+
+            dim = self.dim
+            if user_ids:
+                live = np.asarray(transform(user_ids, live), dtype=self.dtype)
+                dim = live.shape[1]
+
+            new_generation = self.generation + 1
+            self._write_generation_files(new_generation, user_ids, live)
+            self._write_meta(new_generation, dim, path=self._pending_meta_path, projection=projection)
+
+    def commit_pending(self, projection):
+        """
+        Switch to the generation staged by stage_rewrite(), if it was staged for projection.
+
+        Safe to call from any process and more than once: only the first call switches.
+
+        Args:
+            projection (str): Version tag the staged generation must have been written for
+
+        Returns:
+            bool: True if the staged generation was committed
+        """
+        with self._lock, self._file_lock():
+            try:
+                with open(self._pending_meta_path) as f:
+                    pending = json.load(f)
+            except FileNotFoundError:
+                return False
+
+            old_generation = self._read_meta()['generation']
+            if pending['generation'] != old_generation + 1:
+                # Staged before a later compaction; its files are gone
+                os.remove(self._pending_meta_path)
+                return False
+            if pending.get('projection') != projection:
+                return False
+
+            # Commit point: readers switch to the staged generation from here on
+            os.replace(self._pending_meta_path, self._meta_path)
+            self._mmap = None
+            self._load()
+            self._remove_generation(old_generation)
+            return True
+
+    def set_projection(self, projection):
+        """
+        Record the projection of an empty store, before its first vector is written.
+
+        Args:
+            projection (str): Version tag, or None
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            if self._rows:
+                raise ValueError('The projection of a non-empty store can only be changed with rewrite()')
+            # Start a fresh generation so dead rows of the old dimension are dropped
+            self.projection = projection
+            self.dim = None
+            self._write_generation([], np.empty((0, 0), dtype=self.dtype))
+
+    def _write_generation(self, user_ids, matrix):
+        """Write rows as a new generation and switch to it. Both locks must be held."""
+        old_generation = self.generation
+        new_generation = old_generation + 1
+
+        # A staged rewrite would refer to the files overwritten below
+        if os.path.exists(self._pending_meta_path):
+            os.remove(self._pending_meta_path)
+
+        self._write_generation_files(new_generation, user_ids, matrix)
+
+        # Commit point: readers switch to the new generation from here on
+        self._write_meta(new_generation, self.dim)
+        self._mmap = None
+        self._load()
+        self._remove_generation(old_generation)
+
+    def _write_generation_files(self, new_generation, user_ids, matrix):
+        """Write the matrix and log files of a generation. Both locks must be held."""
+        with open(self._data_path(new_generation), 'wb') as f:
+            f.write(np.ascontiguousarray(matrix, dtype=self.dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self._log_path(new_generation), 'wb') as f:
+            for row, user_id in enumerate(user_ids):
+                f.write(f'A {row} {user_id}\n'.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove_generation(self, generation):
+        for path in (self._data_path(generation), self._log_path(generation)):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,573 @@
+"""
+Face database handling shared by the recognizer backends.
+
+The backends differ in how they detect faces and compute embeddings, but store
+and search embeddings the same way: a packed EmbeddingStore on disk, an
+in-memory EmbeddingIndex for exact vectorized search and, optionally, an
+IVFIndex for approximate search over very large databases.
+
+If the database directory holds a fitted projection (projection.npz), every
+embedding is projected to a lower dimension before it is stored or matched.
+
+Each user keeps up to max_templates enrollment embeddings (compact float16 rows in
+a second EmbeddingStore under templates/) plus their normalized centroid, which is
+what the main store and the search indexes hold. Searches shortlist users by
+centroid, so they cost the same as with one vector per user, and then score the
+shortlist and 1:1 verifications against all of a user's templates at once.
+
+Searches can also be scoped to a candidate subset of users, such as the voters on
+one voting's roll. The row positions of a subset are cached under a key chosen by
+the caller, so repeated scoped searches only read those rows of the matrix.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .ann_index import IVFIndex, INDEX_FILENAME
+from .embedding_index import EmbeddingIndex, normalize
+from .embedding_store import EmbeddingStore
+from .projection import EmbeddingProjection, PROJECTION_FILENAME, load_projection
+
+TEMPLATES_DIRNAME = 'templates'
+
+# Number of users scored against their templates after the centroid search
+SEARCH_SHORTLIST = 8
+
+# Number of candidate subsets whose row positions are kept
+SUBSET_CACHE_SIZE = 32
+
+
+class FaceDatabaseMixin:
+    """
+    Mixin providing face database storage and search for a recognizer.
+
+    Attributes:
+        db_path (str): Path to the directory containing face database
+        face_db (EmbeddingStore): Dict-like store of face embeddings for registered users
+        index (EmbeddingIndex): Normalized embedding matrix used for exact matching
+        ann_index (IVFIndex): Approximate index used for identification, or None
+        templates (EmbeddingStore): Per-user rows of up to max_templates enrollment embeddings
+        max_templates (int): Maximum number of enrollment embeddings kept per user
+        projection (EmbeddingProjection): Projection applied to embeddings, or None
+    """
+
+    def _init_face_db(self, db_path, use_ann_index=False, ann_probe=None, max_templates=5, template_dtype='float16',
+                      index_dtype='float32', sync_interval_ms=250):
+        """
+        Set up the face database. Called from the recognizer's __init__.
+
+        Args:
+            db_path (str): Path to the directory containing face database
+            use_ann_index (bool): Whether to search with the persisted IVF index if one exists
+            ann_probe (int, optional): Number of IVF lists scanned per query
+            max_templates (int): Maximum number of enrollment embeddings kept per user
+            template_dtype (str): Element type of the stored templates ('float16' or 'float32')
+            index_dtype (str): Element type of the in-memory search matrix ('float32', 'float16' or 'int8')
+            sync_interval_ms (float): Minimum time between checks for changes made by other processes
+                (0 checks before every lookup)
+        """
+        self.db_path = db_path
+        self.use_ann_index = use_ann_index
+        self.ann_probe = ann_probe
+        self.max_templates = max(1, max_templates)
+        self.template_dtype = template_dtype
+        self.index_dtype = index_dtype
+        self.sync_interval = (sync_interval_ms or 0) / 1000.0
+        self._last_sync = 0.0
+
+        # Create database directory if it doesn't exist
+        os.makedirs(db_path, exist_ok=True)
+
+        # The lock guards the database when a single instance is shared between threads
+        self._db_lock = threading.RLock()
+        self._load_face_db()
+
+    @property
+    def ann_index_path(self):
+        return os.path.join(self.db_path, INDEX_FILENAME)
+
+    def _load_face_db(self):
+        """Open the embedding store and build the search indexes from it."""
+        self.face_db = EmbeddingStore(self.db_path)
+        self.templates = EmbeddingStore(os.path.join(self.db_path, TEMPLATES_DIRNAME), dtype=self.template_dtype)
+        self.index = EmbeddingIndex(dtype=self.index_dtype)
+        self._subsets = OrderedDict()
+
+        # Stored and query vectors must come from the same projection
+        self.projection = load_projection(self.db_path)
+        version = self.projection.version if self.projection is not None else None
+        for store in (self.face_db, self.templates):
+            if store.projection == version:
+                continue
+            # Finish a fit_projection() that stopped after saving the projection
+            if store.commit_pending(version):
+                continue
+            if len(store) == 0:
+                store.set_projection(version)
+            else:
+                raise ValueError(
+                    f"Face database {store.db_path} holds vectors for projection {store.projection}, "
+                    f"but the configured projection is {version}. Run 'manage.py fit_face_projection' "
+                    f"or restore the matching {PROJECTION_FILENAME}."
+                )
+
+        for user_id, embedding in self.face_db.items():
+            self.index.set(user_id, embedding)
+
+        self._load_ann_index()
+
+        # Everything loaded so far is already in the index
+        self.face_db.pop_changes()
+        self.templates.pop_changes()
+        self._last_sync = time.monotonic()
+
+    def _stat_ann_index(self):
+        """Identify the persisted IVF index file; it is replaced (new inode) on every save."""
+        try:
+            stat = os.stat(self.ann_index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load_ann_index(self):
+        """Load the persisted IVF index, if enabled and present, over the in-memory index."""
+        self.ann_index = None
+        self._ann_index_stamp = self._stat_ann_index() if self.use_ann_index else None
+        if self._ann_index_stamp is not None:
+            self.ann_index = IVFIndex.load(self.ann_index_path)
+            if self.ann_probe:
+                self.ann_index.n_probe = self.ann_probe
+            self.ann_index.populate(self.index)
+
+    def _sync_face_db(self, force=False):
+        """
+        Apply inserts and deletes made by other processes to the in-memory indexes.
+
+        Called before lookups. At most once per sync_interval, the store's files are
+        stat()ed and only new log entries are read; a compaction or rewrite by another
+        process triggers a full reload. An IVF index rebuilt by another process (such
+        as 'manage.py build_face_index') is loaded in place of the current one. The
+        database lock must be held.
+
+        Args:
+            force (bool): Check for changes even if the last check was within sync_interval
+        """
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+
+        # Templates are read from the store on demand, so only its row map needs refreshing
+        self.templates.poll()
+        self.templates.pop_changes()
+
+        self.face_db.poll()
+        reloaded, changed = self.face_db.pop_changes()
+
+        if reloaded:
+            print(f"Face database {self.db_path} was rewritten by another process, reloading")
+            self._load_face_db()
+            return
+
+        for user_id in changed:
+            embedding = self.face_db.get(user_id)
+            if embedding is None:
+                self.index.remove(user_id)
+                if self.ann_index is not None:
+                    self.ann_index.remove(user_id)
+            else:
+                self.index.set(user_id, embedding)
+                if self.ann_index is not None:
+                    self.ann_index.add(user_id, embedding)
+
+        if self.use_ann_index and self._stat_ann_index() != self._ann_index_stamp:
+            self._load_ann_index()
+
+    def reload_face_db(self):
+        """Discard the in-memory face database and load it again from disk."""
+        with self._db_lock:
+            self._load_face_db()
+
+    def build_ann_index(self, n_lists=None, n_probe=8, n_iter=20):
+        """
+        Train a new IVF index over the current database, persist it and start using it.
+
+        Args:
+            n_lists (int, optional): Number of lists; defaults to about sqrt(N)
+            n_probe (int): Default number of lists scanned per query
+            n_iter (int): Number of k-means iterations
+
+        Returns:
+            IVFIndex: The new index
+        """
+        with self._db_lock:
+            ann_index = IVFIndex.build(self.index, n_lists=n_lists, n_probe=n_probe, n_iter=n_iter)
+            ann_index.save(self.ann_index_path)
+            self.ann_index = ann_index
+            self._ann_index_stamp = self._stat_ann_index()
+            return ann_index
+
+    def _project(self, embeddings):
+        """
+        Apply the database's projection to model embeddings.
+
+        Args:
+            embeddings (numpy.ndarray): Embedding or matrix of embeddings from the model
+
+        Returns:
+            numpy.ndarray: Projected embeddings (unchanged if there is no projection)
+        """
+        if self.projection is None:
+            return embeddings
+        return self.projection.apply(embeddings)
+
+    def _store_embedding(self, user_id, new_embedding):
+        """
+        Add a new enrollment embedding for a user.
+
+        Args:
+            user_id (str): User ID to associate with the face
+            new_embedding (numpy.ndarray): Newly computed face embedding
+        """
+        self._store_embeddings(user_id, [new_embedding])
+
+    def _store_embeddings(self, user_id, new_embeddings):
+        """
+        Add new enrollment embeddings for a user and update their centroid.
+
+        Only the most recent max_templates embeddings are kept. The templates and the
+        centroid are each written once, however many embeddings are added.
+
+        Args:
+            user_id (str): User ID to associate with the faces
+            new_embeddings (list): Newly computed face embeddings
+        """
+        with self._db_lock:
+            # Start from the latest templates, which another process may have just changed. This
+            # also fills an empty index, whose dimension is needed to read the stored templates.
+            self._sync_face_db(force=True)
+            templates = normalize(np.asarray(new_embeddings))
+            existing = self._user_templates(user_id)
+            if len(existing):
+                templates = np.vstack([existing, templates])
+
+            # A store created with a different max_templates keeps its row width
+            capacity = self.max_templates
+            if self.templates.dim:
+                capacity = self.templates.dim // templates.shape[1]
+            templates = templates[-min(capacity, self.max_templates):]
+
+            # Pad unused template slots with zero rows
+            row = np.zeros((capacity, templates.shape[1]), dtype=np.float32)
+            row[:len(templates)] = templates
+            self.templates.put(user_id, row.ravel())
+
+            # The centroid is what the search indexes hold
+            centroid = normalize(templates.mean(axis=0))
+            self.face_db.put(user_id, centroid)
+            self.index.set(user_id, centroid)
+            if self.ann_index is not None:
+                self.ann_index.add(user_id, centroid)
+
+    def _user_templates(self, user_id):
+        """
+        Return a user's stored templates as normalized float32 rows.
+
+        Users enrolled before templates were kept only have a centroid, which then
+        serves as their single template.
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            numpy.ndarray: Array of shape (n_templates, dim), empty if the user is not registered
+        """
+        row = self.templates.get(user_id)
+        if row is not None and self.index.dim:
+            templates = np.asarray(row, dtype=np.float32).reshape(-1, self.index.dim)
+            return normalize(templates[np.any(templates != 0, axis=1)])
+
+        centroid = self.face_db.get(user_id)
+        if centroid is None:
+            return np.empty((0, self.index.dim or 0), dtype=np.float32)
+        return normalize(centroid)[np.newaxis]
+
+    def _template_similarities(self, user_ids, embedding):
+        """
+        Score a query against all templates of several users with one vectorized product.
+
+        Args:
+            user_ids (list): User IDs to score
+            embedding (numpy.ndarray): Query embedding
+
+        Returns:
+            numpy.ndarray: Best similarity over each user's templates and centroid
+        """
+        query = normalize(np.ravel(embedding))
+        scores = np.empty(len(user_ids), dtype=np.float32)
+        if not user_ids:
+            return scores
+
+        # Gather every user's templates into one (users, slots, dim) block; missing slots are zero
+        blocks = [self._user_templates(user_id) for user_id in user_ids]
+        slots = max(len(block) for block in blocks)
+        stacked = np.zeros((len(blocks), slots, query.shape[0]), dtype=np.float32)
+        present = np.zeros((len(blocks), slots), dtype=bool)
+        for i, block in enumerate(blocks):
+            stacked[i, :len(block)] = block
+            present[i, :len(block)] = True
+
+        similarities = np.where(present, stacked @ query, -np.inf)
+        for i, user_id in enumerate(user_ids):
+            # A user whose template slots are all empty is scored by centroid alone
+            template_similarity = similarities[i].max() if slots else -np.inf
+            centroid_similarity = self.index.similarity(user_id, query)
+            scores[i] = max(template_similarity, centroid_similarity if centroid_similarity is not None else -np.inf)
+        return scores
+
+    def remove_face(self, user_id):
+        """
+        Remove a user's face data from the database.
+
+        Args:
+            user_id (str): User ID whose face data should be removed
+
+        Returns:
+            bool: True if face data existed and was removed, False otherwise
+        """
+        with self._db_lock:
+            existed = self.face_db.delete(user_id)
+            self.templates.delete(user_id)
+            self.index.remove(user_id)
+            if self.ann_index is not None:
+                self.ann_index.remove(user_id)
+
+            # Also drop a legacy per-user file so the embedding cannot be imported again
+            embedding_path = os.path.join(self.db_path, f"{user_id}.npy")
+            if os.path.exists(embedding_path):
+                os.remove(embedding_path)
+                existed = True
+
+        return existed
+
+    def _subset_rows(self, subset_key, candidate_ids):
+        """
+        Row positions of a candidate subset, cached under subset_key until the index layout changes.
+
+        The database lock must be held.
+
+        Args:
+            subset_key (str): Cache key; callers must use a new key when the subset changes
+            candidate_ids (iterable): User IDs in the subset
+
+        Returns:
+            numpy.ndarray: Row positions in the in-memory index
+        """
+        if subset_key is None:
+            return self.index.rows_of(candidate_ids)
+
+        cached = self._subsets.get(subset_key)
+        if cached is not None and cached[0] == self.index.layout_version:
+            self._subsets.move_to_end(subset_key)
+            return cached[1]
+
+        rows = self.index.rows_of(candidate_ids)
+        self._subsets[subset_key] = (self.index.layout_version, rows)
+        self._subsets.move_to_end(subset_key)
+        while len(self._subsets) > SUBSET_CACHE_SIZE:
+            self._subsets.popitem(last=False)
+        return rows
+
+    def search_embedding(self, embedding, k=1, candidate_ids=None, subset_key=None):
+        """
+        Find the registered users most similar to an embedding.
+
+        Users are shortlisted by centroid (with the IVF index when it is enabled and
+        loaded, otherwise an exact search), then scored against all their templates.
+        If candidate_ids is given, only those users' rows are searched, exactly.
+
+        Args:
+            embedding (numpy.ndarray): Query embedding
+            k (int): Number of results to return
+            candidate_ids (iterable, optional): Restrict the search to these user IDs
+            subset_key (str, optional): Key under which the subset's row positions are cached
+
+        Returns:
+            list: (user_id, cosine similarity) tuples sorted by decreasing similarity
+        """
+        with self._db_lock:
+            self._sync_face_db()
+            shortlist_size = max(k, SEARCH_SHORTLIST)
+            if candidate_ids is not None:
+                rows = self._subset_rows(subset_key, candidate_ids)
+                shortlist = self.index.search(embedding, k=shortlist_size, rows=rows)
+            elif self.ann_index is not None:
+                shortlist = self.ann_index.search(embedding, k=shortlist_size)
+            else:
+                shortlist = self.index.search(embedding, k=shortlist_size)
+
+            user_ids = [user_id for user_id, _ in shortlist]
+            scores = self._template_similarities(user_ids, embedding)
+
+        order = np.argsort(-scores, kind='stable')[:k]
+        return [(user_ids[i], float(scores[i])) for i in order]
+
+    def match_similarity(self):
+        """
+        Lowest cosine similarity that passes the recognizer's match threshold.
+
+        Returns:
+            float: Similarity a verified face must reach
+        """
+        return float(self.threshold)
+
+    def _accepts_similarity(self, similarity):
+        """Whether a cosine similarity passes the recognizer's match threshold."""
+        return similarity >= self.threshold
+
+    def identify_embedding(self, embedding, k=5, min_margin=0.05, min_similarity=0.0, candidate_ids=None,
+                           subset_key=None):
+        """
+        Identify a user from an embedding alone, without a claimed user ID.
+
+        The best match is only accepted if it passes the match threshold and
+        min_similarity and beats the runner-up by at least min_margin; otherwise the
+        result is marked ambiguous (or no_match) so the caller can fall back to asking
+        for an ID.
+
+        Args:
+            embedding (numpy.ndarray): Query embedding
+            k (int): Number of candidates to return
+            min_margin (float): Minimum similarity gap between the best and second-best user
+            min_similarity (float): Minimum similarity of the best user, on top of the match threshold
+            candidate_ids (iterable, optional): Restrict the search to these user IDs
+            subset_key (str, optional): Key under which the subset's row positions are cached
+
+        Returns:
+            dict: user_id (None unless accepted), confidence, margin, reason ('no_match',
+                'ambiguous' or None) and candidates, a list of (user_id, similarity, gap to best)
+        """
+        matches = self.search_embedding(embedding, k=max(k, 2), candidate_ids=candidate_ids, subset_key=subset_key)
+        if not matches:
+            return {'user_id': None, 'confidence': 0.0, 'margin': 0.0, 'reason': 'no_match', 'candidates': []}
+
+        best_id, best = matches[0]
+        margin = best - matches[1][1] if len(matches) > 1 else best
+
+        if not self._accepts_similarity(best) or best < min_similarity:
+            reason = 'no_match'
+        elif margin < min_margin:
+            reason = 'ambiguous'
+        else:
+            reason = None
+
+        return {
+            'user_id': best_id if reason is None else None,
+            'confidence': best,
+            'margin': margin,
+            'reason': reason,
+            'candidates': [(user_id, similarity, best - similarity) for user_id, similarity in matches[:k]],
+        }
+
+    def _claimed_similarity(self, claimed_id, embedding):
+        """
+        Compute the best cosine similarity between an embedding and one user's templates.
+
+        Args:
+            claimed_id (str): User ID to compare against
+            embedding (numpy.ndarray): Query embedding
+
+        Returns:
+            float: Similarity, or None if the user is not registered
+        """
+        with self._db_lock:
+            self._sync_face_db()
+            if claimed_id not in self.index:
+                return None
+            return float(self._template_similarities([claimed_id], embedding)[0])
+
+    def _is_registered(self, user_id):
+        with self._db_lock:
+            self._sync_face_db()
+            return user_id in self.index
+
+
+def fit_projection(db_path, dim, whiten=False, template_dtype='float16'):
+    """
+    Fit a PCA projection on a database's raw embeddings and project the database with it.
+
+    The projection is fitted on every stored template (or the stored vector of users
+    without templates). All templates and centroids are then rewritten in the lower
+    dimension and projection.npz is saved, after which recognizers opened on the
+    directory project every new embedding the same way. The projected vectors are
+    staged as new store generations first, and saving projection.npz is the single
+    commit point, so a crash leaves either the raw or the projected database. The raw vectors are not kept,
+    so a projected database cannot be fitted again.
+
+    Args:
+        db_path (str): Face database directory
+        dim (int): Output dimension
+        whiten (bool): Scale each component to unit variance
+        template_dtype (str): Element type of the template store
+
+    Returns:
+        tuple: (EmbeddingProjection, number of vectors it was fitted on)
+
+    Raises:
+        ValueError: If the database is empty, already projected or too small for dim
+    """
+    face_db = EmbeddingStore(db_path)
+    templates = EmbeddingStore(os.path.join(db_path, TEMPLATES_DIRNAME), dtype=template_dtype)
+
+    if face_db.projection is not None or load_projection(db_path) is not None:
+        raise ValueError(f'Face database {db_path} is already projected ({face_db.projection})')
+    if len(face_db) == 0:
+        raise ValueError(f'No face embeddings found in {db_path}')
+
+    input_dim = face_db.dim
+
+    def user_templates(user_id):
+        row = templates.get(user_id)
+        if row is None:
+            return normalize(face_db[user_id])[np.newaxis]
+        rows = np.asarray(row, dtype=np.float32).reshape(-1, input_dim)
+        return normalize(rows[np.any(rows != 0, axis=1)])
+
+    samples = np.vstack([user_templates(user_id) for user_id in face_db.keys()])
+    projection = EmbeddingProjection.fit(samples, dim, whiten=whiten)
+
+    def project_templates(user_ids, matrix):
+        projected = np.zeros((matrix.shape[0], matrix.shape[1] // input_dim * dim), dtype=np.float32)
+        for i, row in enumerate(matrix):
+            rows = row.reshape(-1, input_dim)
+            present = np.any(rows != 0, axis=1)
+            block = np.zeros((rows.shape[0], dim), dtype=np.float32)
+            block[present] = normalize(projection.apply(normalize(rows[present])))
+            projected[i] = block.ravel()
+        return projected
+
+    def project_centroids(user_ids, matrix):
+        return np.stack([normalize(normalize(projection.apply(user_templates(user_id))).mean(axis=0))
+                         for user_id in user_ids])
+
+    # Centroids are recomputed from the raw templates, so project them first. Both stores
+    # keep serving the raw vectors until the projection is saved below.
+    face_db.stage_rewrite(project_centroids, projection.version)
+    templates.stage_rewrite(project_templates, projection.version)
+
+    # An IVF index trained on raw vectors will not match the database
+    index_path = os.path.join(db_path, INDEX_FILENAME)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    # Commit point: once projection.npz names the new version, every recognizer that opens
+    # the database switches both stores to the staged generations (see _load_face_db)
+    projection.save(os.path.join(db_path, PROJECTION_FILENAME))
+    face_db.commit_pending(projection.version)
+    templates.commit_pending(projection.version)
+
+    return projection, samples.shape[0]
@@ -5,21 +5,27 @@ This module provides a class for facial recognition operations including face de
 embedding generation, face registration, and face recognition. It uses MTCNN for face detection
 and ResNet50 for generating face embeddings.
 
-The embeddings are stored as .npy files in the specified database directory, with filenames
-corresponding to user IDs.
+The embeddings are stored in a packed, memory-mapped EmbeddingStore in the specified database
+directory, keyed by user ID.
 """
 
+import copy
 import os
+import threading
 import numpy as np
 from PIL import Image
 import tensorflow as tf
 from tensorflow.keras.preprocessing import image
 from tensorflow.keras.applications.resnet50 import preprocess_input, ResNet50
 from mtcnn import MTCNN
-from scipy.spatial.distance import cosine
-import cv2
 
-class FacialRecognition:
+from .batching import MicroBatcher
+from .face_database import FaceDatabaseMixin
+from .image_ingest import load_image
+from .pipeline import (FaceAnalysis, NO_FACE, largest_face, downscale_for_detection,
+                       detection_min_face_size, rescale_face)
+
+class FacialRecognition(FaceDatabaseMixin):
     """
     A class for facial recognition using MTCNN for face detection and ResNet50 for face embedding.
 
@@ -27,45 +33,65 @@ class FacialRecognition:
         detector (MTCNN): MTCNN model for face detection
         model (ResNet50): ResNet50 model for face embedding
         db_path (str): Path to the directory containing face database
-        face_db (dict): Dictionary containing face embeddings for registered users
+        face_db (EmbeddingStore): Dict-like store of face embeddings for registered users
+        index (EmbeddingIndex): Normalized embedding matrix used for exact matching
+        ann_index (IVFIndex): Approximate index used for identification, or None
         threshold (float): Similarity threshold for face matching
     """
 
-    def __init__(self, db_path='facial_recognition/face_db', threshold=0.5):
+    backend = 'simple'
+
+    # Whether confidence scores follow the advanced (InceptionResNetV1) scale
+    using_advanced = False
+
+    def __init__(self, db_path='facial_recognition/face_db', threshold=0.5, use_ann_index=False, ann_probe=None,
+                 batch_window_ms=None, max_batch_size=16, min_face_size=20, detection_max_side=None,
+                 max_templates=5, template_dtype='float16', embedding_dtype='float32',
+                 sync_interval_ms=250):
         """
         Initialize the FacialRecognition class.
 
         Args:
             db_path (str): Path to the directory containing face database
             threshold (float): Similarity threshold for face matching (lower is stricter)
+            use_ann_index (bool): Whether to identify faces with the persisted IVF index if one exists
+            ann_probe (int, optional): Number of IVF lists scanned per query
+            batch_window_ms (float, optional): If set, concurrent embedding calls are collected for up
+                to this many milliseconds and run as one batch
+            max_batch_size (int): Maximum number of faces per batched forward pass
+            min_face_size (int): Minimum size of faces to detect, in original pixels
+            detection_max_side (int, optional): Downscale frames so their longest side is at most
+                this many pixels before running MTCNN
+            max_templates (int): Maximum number of enrollment embeddings kept per user
+            template_dtype (str): Element type of the stored templates ('float16' or 'float32')
+            embedding_dtype (str): Element type of the in-memory search matrix ('float32', 'float16' or 'int8')
+            sync_interval_ms (float): Minimum time between checks for face database changes made by
+                other processes
         """
         # Initialize MTCNN detector
         self.detector = MTCNN()
+        self.min_face_size = min_face_size
+        self.detection_max_side = detection_max_side
+        # Copies of the detector for other minimum face sizes (old mtcnn versions only)
+        self._scaled_detectors = {}
+        self._scaled_detectors_lock = threading.Lock()
 
         # Initialize ResNet50 model
         self.model = ResNet50(include_top=False, pooling='avg')
 
-        # Set database path and threshold
-        self.db_path = db_path
-        self.threshold = threshold
+        # Optionally batch concurrent embedding calls into one forward pass
+        self.batcher = None
+        if batch_window_ms:
+            self.batcher = MicroBatcher(self.get_embeddings, window_ms=batch_window_ms,
+                                        max_batch_size=max_batch_size)
 
-        # Create database directory if it doesn't exist
-        os.makedirs(db_path, exist_ok=True)
+        # Set threshold
+        self.threshold = threshold
 
         # Load face database
-        self.face_db = {}
-        self._load_face_db()
-
-    def _load_face_db(self):
-        """Load face embeddings from the database directory."""
-        if not os.path.exists(self.db_path):
-            return
-
-        for filename in os.listdir(self.db_path):
-            if filename.endswith('.npy'):
-                user_id = filename.split('.')[0]
-                embedding_path = os.path.join(self.db_path, filename)
-                self.face_db[user_id] = np.load(embedding_path)
+        self._init_face_db(db_path, use_ann_index=use_ann_index, ann_probe=ann_probe,
+                           max_templates=max_templates, template_dtype=template_dtype,
+                           index_dtype=embedding_dtype, sync_interval_ms=sync_interval_ms)
 
     def detect_face(self, img_array):
         """
@@ -75,10 +101,30 @@ class FacialRecognition:
             img_array (numpy.ndarray): Input image as numpy array
 
         Returns:
-            list: List of detected face bounding boxes
+            list: List of detected face bounding boxes, in full-resolution coordinates
         """
-        faces = self.detector.detect_faces(img_array)
-        return faces
+        small, scale = downscale_for_detection(img_array, self.detection_max_side)
+        faces = self._run_detector(small, detection_min_face_size(self.min_face_size, scale))
+
+        # Map boxes back to the full-resolution frame
+        return [rescale_face(face, scale) for face in faces]
+
+    def _run_detector(self, img_array, min_face_size):
+        """Run MTCNN with a per-frame minimum face size."""
+        # mtcnn < 1.0 only reads the minimum face size from the detector instance, so keep one
+        # shallow copy (sharing the networks) per size instead of changing the shared detector
+        if hasattr(self.detector, '_min_face_size'):
+            detector = self._scaled_detectors.get(min_face_size)
+            if detector is None:
+                with self._scaled_detectors_lock:
+                    detector = self._scaled_detectors.get(min_face_size)
+                    if detector is None:
+                        detector = copy.copy(self.detector)
+                        detector._min_face_size = min_face_size
+                        self._scaled_detectors[min_face_size] = detector
+            return detector.detect_faces(img_array)
+
+        return self.detector.detect_faces(img_array, min_face_size=min_face_size)
 
     def extract_face(self, img_array, face_box, required_size=(224, 224)):
         """
@@ -96,8 +142,8 @@ class FacialRecognition:
         x1, y1, width, height = face_box['box']
         x2, y2 = x1 + width, y1 + height
 
-        # Extract the face
-        face = img_array[y1:y2, x1:x2]
+        # Extract the face (MTCNN can report slightly negative coordinates at the image border)
+        face = img_array[max(y1, 0):y2, max(x1, 0):x2]
 
         # Resize to required size
         face_image = Image.fromarray(face)
@@ -116,18 +162,109 @@ class FacialRecognition:
         Returns:
             numpy.ndarray: Face embedding vector
         """
-        # Expand dimensions and preprocess
-        face_array = np.expand_dims(face_array, axis=0)
-        face_array = preprocess_input(face_array)
+        if self.batcher is not None:
+            return self.batcher(face_array)
+
+        return self.get_embeddings([face_array])[0]
+
+    def get_embeddings(self, face_arrays):
+        """
+        Generate embeddings for several faces in one forward pass.
+
+        Args:
+            face_arrays (list): Face images as numpy arrays of the same size
+
+        Returns:
+            list: Face embedding vectors, in input order
+        """
+        # Stack into one batch and preprocess
+        batch = preprocess_input(np.stack(face_arrays).astype('float32'))
 
-        # Get embedding
-        embedding = self.model.predict(face_array)
-        return embedding[0]
+        # Get embeddings
+        embeddings = self.model.predict(batch, verbose=0)
+
+        # Reduce to the fitted projection's dimension, if there is one
+        return list(self._project(embeddings))
+
+    def get_info(self):
+        """
+        Describe the backend and its current state.
+
+        Returns:
+            dict: Backend name, database size, index and batching details
+        """
+        return {
+            'backend': self.backend,
+            'class': type(self).__name__,
+            'using_advanced': self.using_advanced,
+            'registered_faces': len(self.index),
+            'ann_index': self.ann_index is not None,
+            'max_templates': self.max_templates,
+            'embedding_dtype': self.index.dtype,
+            'projection': self.projection.version if self.projection is not None else None,
+            'index_bytes': self.index.nbytes,
+            'batching': self.batcher.stats() if self.batcher is not None else None,
+            'detection_max_side': self.detection_max_side,
+        }
+
+    def close(self):
+        """Stop the batching thread, if any."""
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def analyze_face(self, img_array):
+        """
+        Detect faces and embed the largest one with a single MTCNN pass.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            FaceAnalysis: Detected faces, the face crop fed to ResNet50 and its embedding
+        """
+        faces, main_face, face_array = self._align_face(img_array)
+        if face_array is None:
+            return NO_FACE
+
+        embedding = self.get_embedding(face_array)
+
+        return FaceAnalysis(faces=faces, largest_face=main_face, face_tensor=face_array, embedding=embedding)
+
+    def embed_face_crop(self, crop, box):
+        """
+        Embed a face from a crop whose face box is already known, without running MTCNN.
+
+        Args:
+            crop (numpy.ndarray): Image region around the face as numpy array (RGB)
+            box (list): Face box [x, y, width, height] relative to the crop
+
+        Returns:
+            numpy.ndarray: Face embedding vector
+        """
+        return self.get_embedding(self.extract_face(crop, {'box': box}))
+
+    def _align_face(self, img_array):
+        """
+        Detect faces and crop the largest one, without computing its embedding.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            tuple: (faces, largest face, face crop), with None for the last two if no face is found
+        """
+        faces = self.detect_face(img_array)
+        if not faces:
+            return faces, None, None
+
+        # Use the largest face (assuming it's the main face)
+        main_face = largest_face(faces)
+        return faces, main_face, self.extract_face(img_array, main_face)
 
     def register_face(self, user_id, img_path=None, img_array=None):
         """
-        Register a face in the database. If the user already exists, compute the mean
-        of the existing embedding and the new one for better accuracy.
+        Register a face in the database. The new embedding is added to the user's
+        templates (keeping the most recent ones) and their centroid is updated.
 
         Args:
             user_id (str): User ID to associate with the face
@@ -137,47 +274,42 @@ class FacialRecognition:
         Returns:
             bool: True if registration successful, False otherwise
         """
-        if img_path is None and img_array is None:
-            return False
-
-        # Load image if path is provided
+        img_array = load_image(img_path, img_array)
         if img_array is None:
-            img = cv2.imread(img_path)
-            img_array = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        # Detect faces
-        faces = self.detect_face(img_array)
-        if not faces:
             return False
 
-        # Use the largest face (assuming it's the main face)
-        largest_face = max(faces, key=lambda x: x['box'][2] * x['box'][3])
+        analysis = self.analyze_face(img_array)
+        if analysis.embedding is None:
+            return False
 
-        # Extract and get embedding
-        face_array = self.extract_face(img_array, largest_face)
-        new_embedding = self.get_embedding(face_array)
+        self._store_embedding(user_id, analysis.embedding)
 
-        # Check if user already exists in the database
-        if user_id in self.face_db:
-            # Get existing embedding
-            existing_embedding = self.face_db[user_id]
+        return True
 
-            # Compute mean embedding (average of existing and new)
-            embedding = (existing_embedding + new_embedding) / 2.0
+    def register_faces(self, user_id, images):
+        """
+        Register several images of one user with a single batched forward pass and one database write.
 
-            # Normalize the embedding to unit length
-            embedding = embedding / np.linalg.norm(embedding)
-        else:
-            # This is a new user, use the new embedding directly
-            embedding = new_embedding
+        Args:
+            user_id (str): User ID to associate with the faces
+            images (list): Images as RGB numpy arrays
 
-        # Save embedding to database
-        np.save(os.path.join(self.db_path, f"{user_id}.npy"), embedding)
+        Returns:
+            list: For each image, True if a face was found and used for the template
+        """
+        # Detect and crop every frame first, then embed all crops together
+        face_arrays = []
+        used = []
+        for img_array in images:
+            _, _, face_array = self._align_face(img_array)
+            used.append(face_array is not None)
+            if face_array is not None:
+                face_arrays.append(face_array)
 
-        # Update in-memory database
-        self.face_db[user_id] = embedding
+        if face_arrays:
+            self._store_embeddings(user_id, self.get_embeddings(face_arrays))
 
-        return True
+        return used
 
     def recognize_face(self, img_path=None, img_array=None):
         """
@@ -190,40 +322,94 @@ class FacialRecognition:
         Returns:
             tuple: (user_id, confidence) if face recognized, (None, 0) otherwise
         """
-        if img_path is None and img_array is None:
-            return None, 0
-
-        # Load image if path is provided
+        img_array = load_image(img_path, img_array)
         if img_array is None:
-            img = cv2.imread(img_path)
-            img_array = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            return None, 0
 
-        # Detect faces
-        faces = self.detect_face(img_array)
-        if not faces:
+        analysis = self.analyze_face(img_array)
+        if analysis.embedding is None:
             return None, 0
 
-        # Use the largest face (assuming it's the main face)
-        largest_face = max(faces, key=lambda x: x['box'][2] * x['box'][3])
+        return self.recognize_embedding(analysis.embedding)
 
-        # Extract and get embedding
-        face_array = self.extract_face(img_array, largest_face)
-        embedding = self.get_embedding(face_array)
+    def recognize_embedding(self, embedding):
+        """
+        Identify the registered user closest to an embedding.
+
+        Args:
+            embedding (numpy.ndarray): Face embedding
 
-        # Compare with database
-        best_match = None
-        best_score = 1.0  # Initialize with worst possible score
+        Returns:
+            tuple: (user_id, confidence) if recognized, (None, 0) otherwise
+        """
+        # Compare with the enrolled embeddings (exact matrix search or IVF index)
+        matches = self.search_embedding(embedding, k=1)
 
-        for user_id, db_embedding in self.face_db.items():
-            # Calculate cosine similarity (lower is more similar)
-            similarity = cosine(embedding, db_embedding)
+        if not matches:
+            return None, 0
 
-            if similarity < best_score:
-                best_score = similarity
-                best_match = user_id
+        # Convert the best similarity to a cosine distance (lower is more similar)
+        best_match, similarity = matches[0]
+        best_score = 1.0 - similarity
 
         # Check if the best match is below the threshold
-        if best_match is not None and best_score < self.threshold:
+        if best_score < self.threshold:
             return best_match, 1.0 - best_score  # Convert to confidence score (higher is better)
         else:
             return None, 0
+
+    def match_similarity(self):
+        # The threshold is a cosine distance (lower is stricter)
+        return 1.0 - float(self.threshold)
+
+    def _accepts_similarity(self, similarity):
+        # The threshold is a cosine distance (lower is stricter)
+        return (1.0 - similarity) < self.threshold
+
+    def verify_face(self, claimed_id, img_path=None, img_array=None):
+        """
+        Verify that a face belongs to a claimed user (1:1 verification).
+
+        Unlike recognize_face, only the claimed user's embedding is compared, so the
+        cost does not grow with the number of enrolled users.
+
+        Args:
+            claimed_id (str): User ID the face is claimed to belong to
+            img_path (str, optional): Path to the image file
+            img_array (numpy.ndarray, optional): Image as numpy array
+
+        Returns:
+            tuple: (matched, confidence) where confidence is the cosine similarity
+        """
+        # Skip detection and embedding entirely if the claimed user is not enrolled
+        if not self._is_registered(claimed_id):
+            return False, 0.0
+
+        img_array = load_image(img_path, img_array)
+        if img_array is None:
+            return False, 0.0
+
+        analysis = self.analyze_face(img_array)
+        if analysis.embedding is None:
+            return False, 0.0
+
+        return self.verify_embedding(claimed_id, analysis.embedding)
+
+    def verify_embedding(self, claimed_id, embedding):
+        """
+        Compare an embedding with a claimed user's embedding.
+
+        Args:
+            claimed_id (str): User ID the face is claimed to belong to
+            embedding (numpy.ndarray): Face embedding
+
+        Returns:
+            tuple: (matched, confidence) where confidence is the cosine similarity
+        """
+        similarity = self._claimed_similarity(claimed_id, embedding)
+
+        if similarity is None:
+            return False, 0.0
+
+        # The threshold is a cosine distance (lower is stricter)
+        return (1.0 - similarity) < self.threshold, similarity
@@ -0,0 +1,90 @@
+"""
+Sanity checks for face crops supplied by the browser.
+
+After a validate call the browser knows where the face is, so on verify it can
+send a tight crop around the face together with the face box (relative to the
+crop). If the crop passes the cheap checks below, the recognizer embeds it
+directly with embed_face_crop() and MTCNN does not run at all; otherwise the view
+falls back to full detection on the whole frame.
+
+The checks are geometric (box inside the crop, large enough, face-shaped, filling
+most of the crop) plus, when a fast preview detector is configured, a detection
+on the small crop that must overlap the supplied box.
+"""
+
+import math
+from collections import namedtuple
+
+# ok: whether the crop can be embedded directly
+# reason: short machine-readable reason for rejecting it, or None
+RoiCheck = namedtuple('RoiCheck', ['ok', 'reason'])
+
+
+def parse_box(value):
+    """
+    Parse a face box sent as 'x,y,width,height'.
+
+    Args:
+        value (str): Comma-separated box
+
+    Returns:
+        list: [x, y, width, height] as ints
+
+    Raises:
+        ValueError: If the value does not hold four finite numbers
+    """
+    parts = [float(part) for part in str(value).split(',')]
+    if len(parts) != 4:
+        raise ValueError(f'Expected x,y,width,height, got {value!r}')
+    if not all(math.isfinite(part) for part in parts):
+        raise ValueError(f'Face box values must be finite, got {value!r}')
+    return [int(round(part)) for part in parts]
+
+
+def box_iou(a, b):
+    """Intersection over union of two [x, y, width, height] boxes."""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    intersection = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def check_face_crop(crop, box, min_face_size=40, min_fill=0.3, aspect_range=(0.7, 1.8), detector=None,
+                    min_overlap=0.4):
+    """
+    Decide whether a client-supplied face crop can skip server-side detection.
+
+    Args:
+        crop (numpy.ndarray): Cropped image as numpy array (RGB)
+        box (list): Face box [x, y, width, height] relative to the crop
+        min_face_size (int): Minimum face width and height in pixels
+        min_fill (float): Minimum fraction of the crop area covered by the box
+        aspect_range (tuple): Allowed range of height / width
+        detector (FastFaceDetector, optional): If given, must find a face overlapping the box
+        min_overlap (float): Minimum IoU between the box and the detector's face
+
+    Returns:
+        RoiCheck: Whether the crop is usable and, if not, why
+    """
+    crop_height, crop_width = crop.shape[:2]
+    x, y, width, height = box
+
+    if width <= 0 or height <= 0 or crop_width == 0 or crop_height == 0:
+        return RoiCheck(False, 'empty_box')
+    # Allow a pixel of rounding at the edges
+    if x < -1 or y < -1 or x + width > crop_width + 1 or y + height > crop_height + 1:
+        return RoiCheck(False, 'box_outside_crop')
+    if min(width, height) < min_face_size:
+        return RoiCheck(False, 'face_too_small')
+    if not aspect_range[0] <= height / width <= aspect_range[1]:
+        return RoiCheck(False, 'bad_aspect_ratio')
+    if width * height < min_fill * crop_width * crop_height:
+        return RoiCheck(False, 'crop_too_loose')
+
+    if detector is not None:
+        faces = detector.detect(crop)
+        if not any(box_iou(box, face['box']) >= min_overlap for face in faces):
+            return RoiCheck(False, 'face_not_confirmed')
+
+    return RoiCheck(True, None)
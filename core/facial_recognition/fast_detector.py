@@ -0,0 +1,195 @@
+"""
+Lightweight face detectors for validation previews.
+
+The validate actions only tell the browser whether a face is in the frame and roughly
+where, so they do not need MTCNN. FastFaceDetector uses either a Haar cascade that
+ships with OpenCV or OpenCV's res10 SSD face detector (cv2.dnn, Caffe model files
+downloaded separately). Registration and verification keep using the recognizer's
+MTCNN detector.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from .pipeline import downscale_for_detection, rescale_face
+from .registry import get_setting
+
+HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+RES10_PROTOTXT = 'deploy.prototxt'
+RES10_WEIGHTS = 'res10_300x300_ssd_iter_140000.caffemodel'
+
+# Mean BGR values the res10 SSD was trained with
+RES10_MEAN = (104.0, 177.0, 123.0)
+
+
+class FastFaceDetector:
+    """
+    Face detector based on OpenCV, returning detections in detect_face() format.
+
+    OpenCV cascade classifiers and dnn networks must not be shared between threads,
+    so each thread lazily loads its own copy.
+
+    Attributes:
+        kind (str): 'haar' or 'res10'
+        model_dir (str): Directory containing the cascade or res10 model files
+        max_side (int): Frames are downscaled to this longest side before detection
+        min_confidence (float): Minimum res10 detection confidence
+    """
+
+    def __init__(self, kind='haar', model_dir=None, max_side=320, min_confidence=0.6):
+        """
+        Initialize the detector and check that its model files exist.
+
+        Args:
+            kind (str): 'haar' or 'res10'
+            model_dir (str, optional): Directory with the model files (defaults to OpenCV's
+                bundled cascades for 'haar')
+            max_side (int): Frames are downscaled to this longest side before detection
+            min_confidence (float): Minimum res10 detection confidence
+
+        Raises:
+            ValueError: If kind is unknown
+            FileNotFoundError: If the model files are missing
+        """
+        import cv2
+
+        if kind not in ('haar', 'res10'):
+            raise ValueError(f'Unknown fast face detector: {kind}')
+
+        if model_dir is None and kind == 'haar':
+            model_dir = cv2.data.haarcascades
+
+        self.kind = kind
+        self.model_dir = model_dir or ''
+        self.max_side = max_side
+        self.min_confidence = min_confidence
+
+        for filename in self._model_files():
+            path = os.path.join(self.model_dir, filename)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'Face detector model file not found: {path}')
+
+        self._local = threading.local()
+
+    def _model_files(self):
+        if self.kind == 'haar':
+            return [HAAR_CASCADE]
+        return [RES10_PROTOTXT, RES10_WEIGHTS]
+
+    def _model(self):
+        import cv2
+
+        model = getattr(self._local, 'model', None)
+        if model is None:
+            if self.kind == 'haar':
+                model = cv2.CascadeClassifier(os.path.join(self.model_dir, HAAR_CASCADE))
+            else:
+                model = cv2.dnn.readNetFromCaffe(os.path.join(self.model_dir, RES10_PROTOTXT),
+                                                 os.path.join(self.model_dir, RES10_WEIGHTS))
+            self._local.model = model
+        return model
+
+    def detect(self, img_array):
+        """
+        Detect faces in an image.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            list: Detections in detect_face() format, in full-resolution coordinates
+        """
+        small, scale = downscale_for_detection(img_array, self.max_side)
+
+        if self.kind == 'haar':
+            faces = self._detect_haar(small)
+        else:
+            faces = self._detect_res10(small)
+
+        return [rescale_face(face, scale) for face in faces]
+
+    def _detect_haar(self, img_array):
+        import cv2
+
+        gray = cv2.equalizeHist(cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY))
+        boxes = self._model().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+
+        # Cascades do not produce a probability; a box has already passed minNeighbors votes
+        return [{'box': [int(x), int(y), int(w), int(h)], 'confidence': 1.0, 'keypoints': {}}
+                for x, y, w, h in boxes]
+
+    def _detect_res10(self, img_array):
+        import cv2
+
+        height, width = img_array.shape[:2]
+        bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), RES10_MEAN)
+
+        net = self._model()
+        net.setInput(blob)
+        detections = net.forward()[0, 0]
+
+        faces = []
+        for detection in detections:
+            confidence = float(detection[2])
+            if confidence < self.min_confidence:
+                continue
+            x1, y1, x2, y2 = np.clip(detection[3:7], 0.0, 1.0) * [width, height, width, height]
+            faces.append({
+                'box': [int(x1), int(y1), int(x2 - x1), int(y2 - y1)],
+                'confidence': confidence,
+                'keypoints': {}
+            })
+        return faces
+
+
+_detector_lock = threading.Lock()
+_detector = None
+_detector_loaded = False
+
+
+def get_fast_detector():
+    """
+    Return the process-wide preview detector configured by FACE_FAST_DETECTOR.
+
+    Returns:
+        FastFaceDetector: The shared detector, or None if it is disabled or unavailable
+    """
+    global _detector, _detector_loaded
+
+    if _detector_loaded:
+        return _detector
+
+    with _detector_lock:
+        if not _detector_loaded:
+            kind = get_setting('FACE_FAST_DETECTOR', 'haar')
+            if kind:
+                try:
+                    _detector = FastFaceDetector(
+                        kind=kind,
+                        model_dir=get_setting('FACE_FAST_DETECTOR_MODEL_DIR', None),
+                        max_side=get_setting('FACE_FAST_DETECTOR_MAX_SIDE', 320),
+                    )
+                except (ImportError, ValueError, FileNotFoundError) as e:
+                    print(f"Fast face detector unavailable, validation previews use MTCNN: {e}")
+            _detector_loaded = True
+        return _detector
+
+
+def detect_preview(img_array, recognizer):
+    """
+    Detect faces for a validation preview with the fast detector, or the recognizer's MTCNN if none is configured.
+
+    Args:
+        img_array (numpy.ndarray): Input image as numpy array (RGB)
+        recognizer: Recognizer to fall back to
+
+    Returns:
+        list: Detections in detect_face() format
+    """
+    detector = get_fast_detector()
+    if detector is None:
+        return recognizer.detect_face(img_array)
+    return detector.detect(img_array)
@@ -0,0 +1,105 @@
+"""
+In-memory decoding of uploaded face images.
+
+The browser sends frames as binary JPEG files in multipart uploads (older
+clients send base64 data URLs in form fields). They are decoded straight from
+bytes into an RGB numpy array with cv2.imdecode on a np.frombuffer view, so no
+temporary files are written on the face verification hot path.
+"""
+
+import base64
+
+import numpy as np
+
+
+def decode_image(image_bytes):
+    """
+    Decode encoded image bytes (JPEG, PNG, ...) into an RGB array.
+
+    Args:
+        image_bytes (bytes): Encoded image data
+
+    Returns:
+        numpy.ndarray: Image as an RGB numpy array
+
+    Raises:
+        ValueError: If the bytes cannot be decoded as an image
+    """
+    import cv2
+
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('Could not decode image data')
+
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def decode_upload(upload):
+    """
+    Decode an uploaded image file into an RGB array.
+
+    Small uploads are held in memory by Django; their buffer is decoded in place
+    instead of being copied out with read().
+
+    Args:
+        upload: Django UploadedFile or any binary file-like object
+
+    Returns:
+        numpy.ndarray: Image as an RGB numpy array
+
+    Raises:
+        ValueError: If the file cannot be decoded as an image
+    """
+    file = getattr(upload, 'file', upload)
+    if hasattr(file, 'getbuffer'):
+        return decode_image(file.getbuffer())
+
+    upload.seek(0)
+    return decode_image(upload.read())
+
+
+def decode_data_url(image_data):
+    """
+    Decode a base64 data URL (or plain base64 string) into an RGB array.
+
+    Args:
+        image_data (str): Data URL such as 'data:image/jpeg;base64,...'
+
+    Returns:
+        numpy.ndarray: Image as an RGB numpy array
+
+    Raises:
+        ValueError: If the data is not valid base64 or not a decodable image
+    """
+    # Remove data URL prefix
+    _, separator, payload = image_data.partition('base64,')
+    if not separator:
+        payload = image_data
+
+    try:
+        image_bytes = base64.b64decode(payload)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid base64 image data: {e}')
+
+    return decode_image(image_bytes)
+
+
+def load_image(img_path=None, img_array=None):
+    """
+    Return an RGB image from either an array or a file path.
+
+    Args:
+        img_path (str, optional): Path to the image file
+        img_array (numpy.ndarray, optional): Image as numpy array (returned unchanged)
+
+    Returns:
+        numpy.ndarray: Image as an RGB numpy array, or None if neither argument is given
+    """
+    if img_array is not None:
+        return img_array
+    if img_path is None:
+        return None
+
+    with open(img_path, 'rb') as f:
+        return decode_image(f.read())
@@ -0,0 +1,245 @@
+"""
+ONNX Runtime Facial Recognition Module using MTCNN for face detection and an exported
+InceptionResNetV1 for face recognition.
+
+Face detection and alignment are the same as in AdvancedFacialRecognition, but the
+embedding network runs as an ONNX model (optionally int8-quantized) through ONNX Runtime
+on the CPU, with an explicit intra-op thread count. The model is exported once with
+`manage.py export_face_onnx`, which also checks parity with the PyTorch embeddings and
+compares latency, so the backend can be switched on with FACE_BACKEND = 'onnx' once it
+is within tolerance.
+"""
+
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+from .advanced_face_recognition import AdvancedFacialRecognition
+from .embedding_index import normalize
+
+INPUT_NAME = 'faces'
+OUTPUT_NAME = 'embeddings'
+
+
+class OnnxFacialRecognition(AdvancedFacialRecognition):
+    """
+    AdvancedFacialRecognition with the embedding model running in ONNX Runtime.
+
+    Attributes:
+        model_path (str): Path to the exported (optionally quantized) ONNX model
+        intra_op_threads (int): Number of threads ONNX Runtime uses inside an operator
+        session (onnxruntime.InferenceSession): Session running the embedding model
+    """
+
+    backend = 'onnx'
+
+    def __init__(self, db_path='facial_recognition/face_db', threshold=0.7, model_path=None,
+                 intra_op_threads=None, **kwargs):
+        """
+        Initialize the OnnxFacialRecognition class.
+
+        Args:
+            db_path (str): Path to the directory containing face database
+            threshold (float): Similarity threshold for face matching (higher is stricter)
+            model_path (str): Path to the exported ONNX model
+            intra_op_threads (int, optional): ONNX Runtime intra-op threads (default: all cores)
+            **kwargs: Other AdvancedFacialRecognition options
+        """
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX face model not found at {model_path}. Run 'manage.py export_face_onnx' first.")
+
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+
+        super().__init__(db_path=db_path, threshold=threshold, **kwargs)
+
+    def _load_embedding_model(self):
+        """Create the ONNX Runtime session instead of loading the PyTorch model."""
+        self.session = create_session(self.model_path, self.intra_op_threads)
+        return self.session
+
+    def embed_face_tensors(self, face_tensors):
+        """
+        Generate embeddings for several aligned face tensors in one ONNX Runtime call.
+
+        Args:
+            face_tensors (list): Standardized face tensors of shape (3, image_size, image_size)
+
+        Returns:
+            list: Face embedding vectors, in input order
+        """
+        batch = np.stack([np.asarray(face_tensor.cpu(), dtype=np.float32) for face_tensor in face_tensors])
+        embeddings = self.session.run([OUTPUT_NAME], {INPUT_NAME: batch})[0]
+        return list(self._project(embeddings))
+
+    def get_info(self):
+        info = super().get_info()
+        info['onnx_model'] = self.model_path
+        info['intra_op_threads'] = self.intra_op_threads
+        return info
+
+
+def create_session(model_path, intra_op_threads=None):
+    """
+    Create a CPU ONNX Runtime session tuned for small-batch inference.
+
+    Args:
+        model_path (str): Path to the ONNX model
+        intra_op_threads (int, optional): Threads used inside an operator (default: all cores)
+
+    Returns:
+        onnxruntime.InferenceSession: The session
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+
+    return ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def export_model(output_path, image_size=160, opset=13):
+    """
+    Export InceptionResNetV1 (VGGFace2) to ONNX with a dynamic batch dimension.
+
+    Args:
+        output_path (str): Destination .onnx file
+        image_size (int): Face image size the model is exported for
+        opset (int): ONNX opset version
+
+    Returns:
+        torch.nn.Module: The PyTorch model that was exported (for parity checks)
+    """
+    import torch
+    from facenet_pytorch import InceptionResnetV1
+
+    model = InceptionResnetV1(pretrained='vggface2').eval()
+    dummy = torch.randn(1, 3, image_size, image_size)
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    torch.onnx.export(
+        model, dummy, output_path,
+        input_names=[INPUT_NAME], output_names=[OUTPUT_NAME],
+        dynamic_axes={INPUT_NAME: {0: 'batch'}, OUTPUT_NAME: {0: 'batch'}},
+        opset_version=opset,
+    )
+    return model
+
+
+def quantize_model(input_path, output_path):
+    """
+    Quantize an ONNX model's weights to int8 (dynamic quantization).
+
+    Args:
+        input_path (str): fp32 ONNX model
+        output_path (str): Destination for the int8 model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+
+
+def load_face_samples(image_paths, limit=32, image_size=160):
+    """
+    Detect, align and standardize faces from image files for parity checks.
+
+    The faces go through the same MTCNN alignment and fixed_image_standardization as
+    at inference time, so the check covers the real input distribution of the model.
+
+    Args:
+        image_paths (iterable): Image files to read; files without a face are skipped
+        limit (int): Maximum number of faces to return
+        image_size (int): Size of the aligned face images
+
+    Returns:
+        numpy.ndarray: Standardized face batch of shape (N, 3, image_size, image_size)
+    """
+    from facenet_pytorch import MTCNN
+    from PIL import Image
+
+    detector = MTCNN(image_size=image_size, margin=0, post_process=True)
+    faces = []
+    for path in image_paths:
+        if len(faces) >= limit:
+            break
+        try:
+            with Image.open(path) as image:
+                face = detector(image.convert('RGB'))
+        except OSError:
+            continue
+        if face is not None:
+            faces.append(face.numpy())
+
+    if not faces:
+        return np.empty((0, 3, image_size, image_size), dtype=np.float32)
+    return np.stack(faces).astype(np.float32)
+
+
+def standardized_sample(count, image_size=160, seed=0):
+    """
+    Random 8-bit images passed through fixed_image_standardization.
+
+    Args:
+        count (int): Number of images
+        image_size (int): Image size
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: Standardized batch of shape (count, 3, image_size, image_size)
+    """
+    import torch
+    from facenet_pytorch import fixed_image_standardization
+
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(count, 3, image_size, image_size)).astype(np.float32)
+    return fixed_image_standardization(torch.from_numpy(pixels)).numpy()
+
+
+def compare_with_torch(torch_model, session, faces, batch_size=1, repeats=20):
+    """
+    Compare ONNX Runtime embeddings and latency with the PyTorch model.
+
+    Args:
+        torch_model (torch.nn.Module): Reference PyTorch model
+        session (onnxruntime.InferenceSession): Session under test
+        faces (numpy.ndarray): Standardized face batch of shape (N, 3, H, W)
+        batch_size (int): Batch size used for the latency measurement
+        repeats (int): Number of timed runs
+
+    Returns:
+        dict: min/mean cosine similarity, max absolute difference and mean latency per batch in ms
+    """
+    import torch
+
+    faces = np.asarray(faces, dtype=np.float32)
+    with torch.inference_mode():
+        reference = torch_model(torch.from_numpy(faces)).numpy()
+    candidate = session.run([OUTPUT_NAME], {INPUT_NAME: faces})[0]
+
+    cosine = np.sum(normalize(reference) * normalize(candidate), axis=1)
+
+    batch = faces[:batch_size]
+    with torch.inference_mode():
+        torch_model(torch.from_numpy(batch))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            torch_model(torch.from_numpy(batch))
+        torch_ms = (time.perf_counter() - start) * 1000 / repeats
+
+    session.run([OUTPUT_NAME], {INPUT_NAME: batch})
+    start = time.perf_counter()
+    for _ in range(repeats):
+        session.run([OUTPUT_NAME], {INPUT_NAME: batch})
+    onnx_ms = (time.perf_counter() - start) * 1000 / repeats
+
+    return {
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'max_abs_diff': float(np.abs(reference - candidate).max()),
+        'torch_ms': torch_ms,
+        'onnx_ms': onnx_ms,
+    }
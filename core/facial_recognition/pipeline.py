@@ -0,0 +1,100 @@
+"""
+Result type and shared helpers of the single-pass detect-and-embed pipeline.
+
+A recognizer's analyze_face() runs face detection once and returns the detected
+boxes, the aligned crop of the largest face and its embedding together, so callers
+never have to run the detector again to get any of the three. Detection can run on
+a downscaled copy of the frame, with boxes mapped back to full resolution for cropping.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+# faces: list of detections in detect_face() format
+# largest_face: detection the crop and embedding were computed from, or None
+# face_tensor: aligned face crop as fed to the embedding model, or None
+# embedding: embedding of the largest face, or None
+FaceAnalysis = namedtuple('FaceAnalysis', ['faces', 'largest_face', 'face_tensor', 'embedding'])
+
+NO_FACE = FaceAnalysis(faces=[], largest_face=None, face_tensor=None, embedding=None)
+
+
+def largest_face(faces):
+    """
+    Return the detection with the largest bounding box (assumed to be the main face).
+
+    Args:
+        faces (list): Detections in detect_face() format
+
+    Returns:
+        dict: The largest detection
+    """
+    return max(faces, key=lambda x: x['box'][2] * x['box'][3])
+
+
+# MTCNN's first stage scans 12x12 cells, so smaller minimum face sizes only upsample the image
+MIN_DETECTION_FACE_SIZE = 12
+
+
+def downscale_for_detection(img_array, max_side):
+    """
+    Shrink an image so its longest side is at most max_side before running the detector.
+
+    Detection cost grows with pixel count, while the face in a login frame is large, so
+    it can be found just as well at a lower resolution. Crops are still taken from the
+    full-resolution image.
+
+    Args:
+        img_array (numpy.ndarray): Input image as numpy array (RGB)
+        max_side (int): Maximum length of the longest side, or None/0 to keep the image as is
+
+    Returns:
+        tuple: (image, scale) where scale is the detection size divided by the original size
+    """
+    height, width = img_array.shape[:2]
+    longest = max(height, width)
+    if not max_side or longest <= max_side:
+        return img_array, 1.0
+
+    scale = max_side / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    resized = Image.fromarray(img_array).resize(size, Image.BILINEAR)
+    return np.asarray(resized), scale
+
+
+def detection_min_face_size(min_face_size, scale):
+    """
+    Convert a minimum face size in original pixels to the downscaled detection image.
+
+    Args:
+        min_face_size (int): Minimum face size in the original image
+        scale (float): Scale returned by downscale_for_detection
+
+    Returns:
+        int: Minimum face size to give the detector
+    """
+    return max(MIN_DETECTION_FACE_SIZE, int(round(min_face_size * scale)))
+
+
+def rescale_face(face, scale):
+    """
+    Map a detection found on a downscaled image back to original image coordinates.
+
+    Args:
+        face (dict): Detection in detect_face() format
+        scale (float): Scale returned by downscale_for_detection
+
+    Returns:
+        dict: The detection with its box and keypoints in original pixels
+    """
+    if scale == 1.0:
+        return face
+
+    x, y, width, height = face['box']
+    keypoints = {name: (int(round(px / scale)), int(round(py / scale)))
+                 for name, (px, py) in face.get('keypoints', {}).items()}
+    return dict(face,
+                box=[int(round(x / scale)), int(round(y / scale)), int(round(width / scale)), int(round(height / scale))],
+                keypoints=keypoints)
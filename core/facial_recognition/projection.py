@@ -0,0 +1,138 @@
+"""
+Fitted linear projection of face embeddings to a lower dimension.
+
+ResNet50 global-average-pooled features are 2048-d, far wider than needed to tell
+faces apart. EmbeddingProjection holds a PCA (optionally whitening) projection fitted
+on enrolled embeddings by `manage.py fit_face_projection`. It is saved as
+projection.npz in the face database directory, and every embedding is projected
+before it is stored or matched.
+
+Each projection has a version tag derived from its parameters. The embedding stores
+record the tag of the projection their vectors were written with, and the
+recognizer refuses to mix vectors from different projections.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+PROJECTION_FILENAME = 'projection.npz'
+
+
+class EmbeddingProjection:
+    """
+    Centering followed by a linear map to a lower dimension.
+
+    Attributes:
+        mean (numpy.ndarray): Mean of the fitting embeddings, shape (input_dim,)
+        components (numpy.ndarray): Projection matrix, shape (input_dim, output_dim)
+        whiten (bool): Whether components were scaled to unit variance
+        version (str): Tag identifying this projection
+    """
+
+    def __init__(self, mean, components, whiten=False, version=None):
+        """
+        Initialize the projection.
+
+        Args:
+            mean (numpy.ndarray): Mean of the fitting embeddings
+            components (numpy.ndarray): Projection matrix of shape (input_dim, output_dim)
+            whiten (bool): Whether components were scaled to unit variance
+            version (str, optional): Tag; derived from the parameters if omitted
+        """
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.whiten = bool(whiten)
+        self.version = version or self._make_version()
+
+    def _make_version(self):
+        digest = hashlib.sha1(self.mean.tobytes() + self.components.tobytes()).hexdigest()[:10]
+        kind = 'pcaw' if self.whiten else 'pca'
+        return f'{kind}{self.output_dim}-{digest}'
+
+    @property
+    def input_dim(self):
+        return self.components.shape[0]
+
+    @property
+    def output_dim(self):
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, matrix, dim, whiten=False):
+        """
+        Fit a PCA projection on a set of embeddings.
+
+        Args:
+            matrix (numpy.ndarray): Embeddings, one per row
+            dim (int): Output dimension
+            whiten (bool): Scale each component to unit variance
+
+        Returns:
+            EmbeddingProjection: The fitted projection
+
+        Raises:
+            ValueError: If there are fewer embeddings than output dimensions
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if dim > min(matrix.shape):
+            raise ValueError(f'Cannot fit {dim} components from {matrix.shape[0]} embeddings of dimension {matrix.shape[1]}')
+
+        mean = matrix.mean(axis=0)
+        _, singular_values, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        components = vt[:dim].T
+
+        if whiten:
+            std = singular_values[:dim] / np.sqrt(max(matrix.shape[0] - 1, 1))
+            components = components / np.maximum(std, 1e-6)
+
+        return cls(mean, components, whiten=whiten)
+
+    def apply(self, embeddings):
+        """
+        Project one embedding or a matrix of embeddings.
+
+        Args:
+            embeddings (numpy.ndarray): Vector of shape (input_dim,) or matrix of shape (n, input_dim)
+
+        Returns:
+            numpy.ndarray: float32 projected vector(s)
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return (embeddings - self.mean) @ self.components
+
+    def explained_variance(self, matrix):
+        """Fraction of the variance of matrix kept by the projection (ignoring whitening)."""
+        centered = np.asarray(matrix, dtype=np.float64) - self.mean
+        basis = self.components / np.linalg.norm(self.components, axis=0)
+        return float(np.sum((centered @ basis) ** 2) / np.sum(centered ** 2))
+
+    def save(self, path):
+        """Save the projection to an .npz file, atomically replacing an existing one."""
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, mean=self.mean, components=self.components,
+                 whiten=np.array(self.whiten), version=np.array(self.version))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a projection saved with save()."""
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'], whiten=bool(data['whiten']), version=str(data['version']))
+
+
+def load_projection(db_path):
+    """
+    Load the projection of a face database, if it has one.
+
+    Args:
+        db_path (str): Face database directory
+
+    Returns:
+        EmbeddingProjection: The projection, or None
+    """
+    path = os.path.join(db_path, PROJECTION_FILENAME)
+    if not os.path.exists(path):
+        return None
+    return EmbeddingProjection.load(path)
@@ -0,0 +1,35 @@
+"""
+Wire protocol shared by the face inference server and its clients.
+
+Requests and responses are pickled tuples sent over a
+multiprocessing.connection socket authenticated with a shared key:
+
+    request:  (method, args, kwargs)
+    response: ('ok', result) or ('error', exception class name, message)
+
+This module only holds constants so that clients can import it without pulling
+in NumPy, PIL or the inference frameworks.
+"""
+
+# Recognizer methods that clients may call
+REMOTE_METHODS = (
+    'detect_face',
+    'analyze_face',
+    'embed_face_crop',
+    'register_face',
+    'register_faces',
+    'remove_face',
+    'recognize_face',
+    'verify_face',
+    'recognize_embedding',
+    'verify_embedding',
+    'search_embedding',
+    'identify_embedding',
+    'match_similarity',
+    'reload_face_db',
+    'get_info',
+)
+
+# Methods that only touch the in-memory database and skip the inference limit
+LIGHT_METHODS = ('remove_face', 'recognize_embedding', 'verify_embedding', 'search_embedding',
+                  'identify_embedding', 'match_similarity', 'get_info')
@@ -0,0 +1,288 @@
+"""
+Cheap frame-quality gate that runs before face detection.
+
+Blurry, dark or overexposed webcam frames rarely produce a usable match, but they
+would otherwise go through MTCNN and the embedding model before the voter is asked
+to retry. FrameQualityGate measures sharpness (variance of the Laplacian), mean
+luminance and contrast on a small grayscale copy of the frame, which takes a few
+milliseconds, and rejects unusable frames with a specific reason.
+
+Every web worker has its own gate, so the counters are periodically merged into
+quality_stats.json in the face database directory; 'manage.py face_quality_stats'
+reports how many frames (and inference runs) the gate saved across all workers.
+"""
+
+import atexit
+import json
+import os
+import threading
+from collections import Counter, namedtuple
+
+from .embedding_store import _FileLock
+from .registry import get_setting, DEFAULT_DB_PATH
+
+STATS_FILENAME = 'quality_stats.json'
+
+# ok: whether the frame is usable
+# reason: short machine-readable reason ('too_dark', 'too_bright', 'low_contrast', 'blurry') or None
+# message: explanation to show the voter, or None
+# metrics: dict with the measured sharpness, brightness and contrast
+QualityResult = namedtuple('QualityResult', ['ok', 'reason', 'message', 'metrics'])
+
+REJECTION_MESSAGES = {
+    'too_dark': 'The image is too dark. Please move to a brighter place and try again.',
+    'too_bright': 'The image is overexposed. Please avoid strong backlight or direct light and try again.',
+    'low_contrast': 'The image has too little contrast. Please improve the lighting and try again.',
+    'blurry': 'The image is blurry. Please hold still and make sure the camera is in focus.',
+}
+
+
+class FrameQualityGate:
+    """
+    Rejects frames that are too blurry, dark, bright or flat to be worth analyzing.
+
+    Attributes:
+        min_sharpness (float): Minimum variance of the Laplacian
+        min_brightness (float): Minimum mean luminance (0-255)
+        max_brightness (float): Maximum mean luminance (0-255)
+        min_contrast (float): Minimum standard deviation of luminance (0-255)
+        analysis_side (int): Longest side of the grayscale copy the metrics are measured on
+        stats_path (str): File the counters are merged into, or None to keep them in memory only
+        flush_every (int): Number of checks between merges into stats_path
+    """
+
+    def __init__(self, min_sharpness=40.0, min_brightness=40.0, max_brightness=220.0, min_contrast=20.0,
+                 analysis_side=320, stats_path=None, flush_every=50):
+        """
+        Initialize the gate.
+
+        Args:
+            min_sharpness (float): Minimum variance of the Laplacian
+            min_brightness (float): Minimum mean luminance (0-255)
+            max_brightness (float): Maximum mean luminance (0-255)
+            min_contrast (float): Minimum standard deviation of luminance (0-255)
+            analysis_side (int): Longest side of the grayscale copy the metrics are measured on
+            stats_path (str, optional): File the counters are merged into
+            flush_every (int): Number of checks between merges into stats_path
+        """
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.analysis_side = analysis_side
+        self.stats_path = stats_path
+        self.flush_every = max(1, flush_every)
+
+        self._stats_lock = threading.Lock()
+        self._checked = 0
+        self._rejections = Counter()
+        # Counts not yet merged into stats_path
+        self._unflushed_checked = 0
+        self._unflushed_rejections = Counter()
+
+    def measure(self, img_array):
+        """
+        Measure sharpness, brightness and contrast of a frame.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+
+        Returns:
+            dict: sharpness, brightness and contrast
+        """
+        import cv2
+
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+
+        # Measure on a fixed-size copy so thresholds do not depend on the camera resolution
+        height, width = gray.shape
+        scale = self.analysis_side / max(height, width)
+        if scale < 1:
+            gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                              interpolation=cv2.INTER_AREA)
+
+        mean, stddev = cv2.meanStdDev(gray)
+        return {
+            'sharpness': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+            'brightness': float(mean[0][0]),
+            'contrast': float(stddev[0][0]),
+        }
+
+    def check(self, img_array, record=True):
+        """
+        Decide whether a frame is worth running face detection on.
+
+        Args:
+            img_array (numpy.ndarray): Input image as numpy array (RGB)
+            record (bool): Count the frame in stats(); pass False for images that would
+                never have reached face detection, so the saved-inference counts stay honest
+
+        Returns:
+            QualityResult: Whether the frame is usable and, if not, why
+        """
+        metrics = self.measure(img_array)
+
+        reason = None
+        if metrics['brightness'] < self.min_brightness:
+            reason = 'too_dark'
+        elif metrics['brightness'] > self.max_brightness:
+            reason = 'too_bright'
+        elif metrics['contrast'] < self.min_contrast:
+            reason = 'low_contrast'
+        elif metrics['sharpness'] < self.min_sharpness:
+            reason = 'blurry'
+
+        if not record:
+            return self._result(reason, metrics)
+
+        with self._stats_lock:
+            self._checked += 1
+            self._unflushed_checked += 1
+            if reason:
+                self._rejections[reason] += 1
+                self._unflushed_rejections[reason] += 1
+            flush = self.stats_path is not None and self._unflushed_checked >= self.flush_every
+
+        if flush:
+            self.flush_stats()
+
+        return self._result(reason, metrics)
+
+    @staticmethod
+    def _result(reason, metrics):
+        if reason:
+            return QualityResult(ok=False, reason=reason, message=REJECTION_MESSAGES[reason], metrics=metrics)
+        return QualityResult(ok=True, reason=None, message=None, metrics=metrics)
+
+    def stats(self):
+        """
+        Return how many frames were checked and how many inference runs were skipped.
+
+        Returns:
+            dict: Checked and rejected frame counts, rejections per reason and the rejected fraction
+        """
+        with self._stats_lock:
+            return _summarize(self._checked, self._rejections)
+
+    def flush_stats(self):
+        """Merge the counters gathered since the last flush into stats_path."""
+        if self.stats_path is None:
+            return
+
+        with self._stats_lock:
+            checked, rejections = self._unflushed_checked, self._unflushed_rejections
+            self._unflushed_checked, self._unflushed_rejections = 0, Counter()
+        if checked:
+            merge_stats(self.stats_path, checked, rejections)
+
+
+def _summarize(checked, rejections):
+    rejected = sum(rejections.values())
+    return {
+        'checked': checked,
+        'rejected': rejected,
+        'rejected_fraction': rejected / checked if checked else 0.0,
+        'rejections': dict(rejections),
+    }
+
+
+def merge_stats(path, checked, rejections):
+    """
+    Add a worker's counts to the shared stats file.
+
+    Args:
+        path (str): Stats file
+        checked (int): Number of frames checked
+        rejections (dict): Number of rejected frames per reason
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _FileLock(path + '.lock'):
+        totals = read_stats(path)
+        merged = Counter(totals['rejections'])
+        merged.update(rejections)
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'checked': totals['checked'] + checked, 'rejections': dict(merged)}, f)
+        os.replace(tmp_path, path)
+
+
+def read_stats(path):
+    """
+    Read the counters of all workers from the shared stats file.
+
+    Args:
+        path (str): Stats file
+
+    Returns:
+        dict: Checked and rejected frame counts, rejections per reason and the rejected fraction
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    return _summarize(data.get('checked', 0), Counter(data.get('rejections', {})))
+
+
+_gate_lock = threading.Lock()
+_gate = None
+
+
+def get_quality_gate():
+    """
+    Return the process-wide quality gate configured from settings.
+
+    Returns:
+        FrameQualityGate: The shared gate, or None if FACE_QUALITY_GATE is disabled
+    """
+    global _gate
+
+    if not get_setting('FACE_QUALITY_GATE', True):
+        return None
+
+    with _gate_lock:
+        if _gate is None:
+            _gate = FrameQualityGate(
+                min_sharpness=get_setting('FACE_QUALITY_MIN_SHARPNESS', 40.0),
+                min_brightness=get_setting('FACE_QUALITY_MIN_BRIGHTNESS', 40.0),
+                max_brightness=get_setting('FACE_QUALITY_MAX_BRIGHTNESS', 220.0),
+                min_contrast=get_setting('FACE_QUALITY_MIN_CONTRAST', 20.0),
+                stats_path=quality_stats_path(),
+            )
+        return _gate
+
+
+def shutdown_quality_gate():
+    """Merge the shared gate's pending counters and drop it. The next get_quality_gate() call creates a new one."""
+    global _gate
+
+    with _gate_lock:
+        if _gate is not None:
+            _gate.flush_stats()
+        _gate = None
+
+
+def quality_stats_path():
+    """Path of the shared quality gate stats file."""
+    return os.path.join(get_setting('FACE_DB_PATH', DEFAULT_DB_PATH), STATS_FILENAME)
+
+
+def check_frame(img_array, record=True):
+    """
+    Run the shared quality gate on a frame.
+
+    Args:
+        img_array (numpy.ndarray): Input image as numpy array (RGB)
+        record (bool): Count the frame in the gate's stats
+
+    Returns:
+        QualityResult: The gate's verdict (always ok if the gate is disabled)
+    """
+    gate = get_quality_gate()
+    if gate is None:
+        return QualityResult(ok=True, reason=None, message=None, metrics={})
+    return gate.check(img_array, record=record)
+
+
+atexit.register(shutdown_quality_gate)
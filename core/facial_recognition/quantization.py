@@ -0,0 +1,146 @@
+"""
+Compact representations of normalized face embeddings.
+
+Every worker keeps the whole embedding matrix in RAM and reads all of it for each
+exact search, so for large voter rolls the element type matters. Rows can be kept as:
+
+    float32   4 bytes per value (reference)
+    float16   2 bytes per value
+    int8      1 byte per value plus one float32 scale per row (per-vector symmetric quantization)
+
+The similarity kernel works on the compact matrix block by block, converting only
+one block at a time to float32, so no full-size float32 copy is ever made.
+drift_report() measures how far each format's similarities and rankings drift from
+float32 on a given set of embeddings.
+"""
+
+import time
+
+import numpy as np
+
+SUPPORTED_DTYPES = ('float32', 'float16', 'int8')
+
+# Rows converted to float32 at a time by the similarity kernel
+BLOCK_ROWS = 4096
+
+
+def check_dtype(dtype):
+    """Return the canonical name of a supported embedding dtype or raise ValueError."""
+    name = np.dtype(dtype).name
+    if name not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {name}; use one of {', '.join(SUPPORTED_DTYPES)}")
+    return name
+
+
+def quantize(vectors, dtype):
+    """
+    Convert float32 vectors to a compact representation.
+
+    Args:
+        vectors (numpy.ndarray): Matrix of vectors, one per row
+        dtype (str): 'float32', 'float16' or 'int8'
+
+    Returns:
+        tuple: (codes, scales) where scales is None for float types
+    """
+    dtype = check_dtype(dtype)
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    if dtype != 'int8':
+        return vectors.astype(dtype), None
+
+    # Symmetric per-row scale so that the largest magnitude maps to 127
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes, scales=None):
+    """
+    Convert compact vectors back to float32.
+
+    Args:
+        codes (numpy.ndarray): Compact matrix from quantize()
+        scales (numpy.ndarray, optional): Per-row scales for int8 codes
+
+    Returns:
+        numpy.ndarray: float32 matrix (the input itself if it already is float32)
+    """
+    matrix = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * scales[:, np.newaxis]
+    return matrix
+
+
+def similarities(codes, query, scales=None, block_rows=BLOCK_ROWS):
+    """
+    Dot products between a float32 query and every row of a compact matrix.
+
+    Args:
+        codes (numpy.ndarray): Compact matrix from quantize()
+        query (numpy.ndarray): Normalized float32 query vector
+        scales (numpy.ndarray, optional): Per-row scales for int8 codes
+        block_rows (int): Rows converted to float32 at a time
+
+    Returns:
+        numpy.ndarray: float32 similarity per row
+    """
+    if codes.dtype == np.float32:
+        return codes @ query
+
+    scores = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], block_rows):
+        block = codes[start:start + block_rows].astype(np.float32)
+        scores[start:start + block_rows] = block @ query
+
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def drift_report(matrix, queries, dtypes=SUPPORTED_DTYPES, k=10, repeats=3):
+    """
+    Compare compact formats with float32 on the same embeddings and queries.
+
+    Args:
+        matrix (numpy.ndarray): Normalized float32 embeddings, one per row
+        queries (numpy.ndarray): Normalized float32 query embeddings
+        dtypes (sequence): Formats to evaluate
+        k (int): Neighbours used for recall@k
+        repeats (int): Timed passes over all queries
+
+    Returns:
+        list: One dict per format with bytes per vector, max/mean absolute similarity
+            error, top-1 agreement, recall@k and mean milliseconds per query
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    k = min(k, matrix.shape[0])
+
+    reference = queries @ matrix.T
+    reference_top = np.argsort(-reference, axis=1)[:, :k]
+
+    results = []
+    for dtype in dtypes:
+        codes, scales = quantize(matrix, dtype)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            scores = np.stack([similarities(codes, query, scales) for query in queries])
+        ms = (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+
+        top = np.argsort(-scores, axis=1)[:, :k]
+        error = np.abs(scores - reference)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])
+
+        results.append({
+            'dtype': check_dtype(dtype),
+            'bytes_per_vector': codes.itemsize * matrix.shape[1] + (scales.itemsize if scales is not None else 0),
+            'max_error': float(error.max()),
+            'mean_error': float(error.mean()),
+            'top1_agreement': float(np.mean(top[:, 0] == reference_top[:, 0])),
+            'recall': float(recall),
+            'ms_per_query': ms,
+        })
+    return results
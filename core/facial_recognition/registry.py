@@ -0,0 +1,165 @@
+"""
+Process-wide registry for the shared facial recognition instance.
+
+Constructing a recognizer loads the face detector, the embedding model and the
+whole face database, which takes seconds. The registry creates a single instance
+lazily on first use and hands the same object to every view and management
+command in the process. Creation is guarded by a lock so that concurrent requests
+in threaded workers never build more than one instance.
+"""
+
+import atexit
+import threading
+
+DEFAULT_DB_PATH = 'facial_recognition/face_db'
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_ONNX_MODEL_PATH = 'facial_recognition/models/inception_resnet_v1.onnx'
+
+_lock = threading.RLock()
+_recognizer = None
+
+
+def get_setting(name, default):
+    """
+    Read a facial recognition setting from Django settings if they are configured.
+
+    The package is also used from standalone scripts, so a missing or unconfigured
+    Django installation simply falls back to the default value.
+
+    Args:
+        name (str): Name of the setting
+        default: Value to return when the setting is not available
+
+    Returns:
+        The configured value or the default
+    """
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except ImportError:
+        pass
+    return default
+
+
+def create_local_recognizer():
+    """
+    Build a new in-process recognizer from the configured settings.
+
+    Returns:
+        FacialRecognition: A recognizer that runs the models in this process
+    """
+    from . import FacialRecognition
+
+    options = {
+        'db_path': get_setting('FACE_DB_PATH', DEFAULT_DB_PATH),
+        'threshold': get_setting('FACE_RECOGNITION_THRESHOLD', DEFAULT_THRESHOLD),
+        'use_ann_index': get_setting('FACE_ANN_INDEX', False),
+        'ann_probe': get_setting('FACE_ANN_PROBE', None),
+        'batch_window_ms': get_setting('FACE_BATCH_WINDOW_MS', None),
+        'max_batch_size': get_setting('FACE_BATCH_MAX_SIZE', 16),
+        'detection_max_side': get_setting('FACE_DETECTION_MAX_SIDE', None),
+        'max_templates': get_setting('FACE_MAX_TEMPLATES', 5),
+        'template_dtype': get_setting('FACE_TEMPLATE_DTYPE', 'float16'),
+        'embedding_dtype': get_setting('FACE_EMBEDDING_DTYPE', 'float32'),
+        'sync_interval_ms': get_setting('FACE_DB_SYNC_INTERVAL_MS', 250),
+    }
+
+    backend = getattr(FacialRecognition, 'backend', None)
+    if backend in ('advanced', 'onnx'):
+        options['num_threads'] = get_setting('FACE_TORCH_THREADS', None)
+    if backend == 'advanced':
+        options['optimize'] = get_setting('FACE_TORCH_OPTIMIZE', False)
+    if backend == 'onnx':
+        options['model_path'] = get_setting('FACE_ONNX_MODEL_PATH', DEFAULT_ONNX_MODEL_PATH)
+        options['intra_op_threads'] = get_setting('FACE_ONNX_THREADS', None)
+
+    return FacialRecognition(**options)
+
+
+def get_worker_authkey():
+    """Return the key shared by the face inference server and its clients."""
+    authkey = get_setting('FACE_WORKER_AUTHKEY', None) or get_setting('SECRET_KEY', '')
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+
+def _create_recognizer():
+    """
+    Build the shared recognizer.
+
+    If FACE_WORKER_SOCKET is configured, the models live in the face inference server
+    and this process only gets a lightweight client.
+    """
+    socket_path = get_setting('FACE_WORKER_SOCKET', None)
+    if socket_path:
+        from .remote import RemoteFacialRecognition
+        return RemoteFacialRecognition(socket_path, get_worker_authkey(),
+                                       timeout=get_setting('FACE_WORKER_TIMEOUT', 30.0))
+
+    return create_local_recognizer()
+
+
+def get_recognizer():
+    """
+    Return the shared recognizer, creating it on first use.
+
+    Returns:
+        FacialRecognition: The process-wide recognizer instance
+    """
+    global _recognizer
+
+    recognizer = _recognizer
+    if recognizer is not None:
+        return recognizer
+
+    with _lock:
+        if _recognizer is None:
+            _recognizer = _create_recognizer()
+        return _recognizer
+
+
+def reload_recognizer(rebuild=False):
+    """
+    Reload the shared recognizer.
+
+    By default only the face database is reloaded from disk and the loaded models
+    are kept. With rebuild=True the instance is discarded and constructed again,
+    which also picks up changed settings.
+
+    Args:
+        rebuild (bool): Whether to construct a new instance instead of reloading data
+
+    Returns:
+        FacialRecognition: The reloaded recognizer instance
+    """
+    global _recognizer
+
+    with _lock:
+        if rebuild or _recognizer is None:
+            _close(_recognizer)
+            _recognizer = _create_recognizer()
+        else:
+            _recognizer.reload_face_db()
+        return _recognizer
+
+
+def shutdown_recognizer():
+    """Release the shared recognizer. The next get_recognizer() call creates a new one."""
+    global _recognizer
+
+    with _lock:
+        _close(_recognizer)
+        _recognizer = None
+
+
+def _close(recognizer):
+    """Call the recognizer's close hook if it provides one."""
+    close = getattr(recognizer, 'close', None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            print(f"Error shutting down facial recognition: {e}")
+
+
+atexit.register(shutdown_recognizer)
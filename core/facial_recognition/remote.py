@@ -0,0 +1,112 @@
+"""
+Client backend that forwards face operations to the face inference server.
+
+RemoteFacialRecognition has the same interface as the local recognizers but only
+depends on the standard library and the constants in protocol.py, so web workers
+using it never import NumPy, PIL or the inference frameworks. Each thread
+keeps its own connection to the server, and a dropped connection is reopened once
+before an error is raised.
+"""
+
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from .protocol import REMOTE_METHODS
+
+
+class FaceWorkerError(RuntimeError):
+    """Raised when the face inference server cannot be reached or reports an error."""
+
+
+class RemoteFacialRecognition:
+    """
+    A recognizer that runs every operation in the face inference server.
+
+    Attributes:
+        address (str): Path of the server's Unix socket
+        timeout (float): Seconds to wait for a response
+    """
+
+    def __init__(self, address, authkey, timeout=30.0):
+        """
+        Initialize the client. Connections are opened lazily.
+
+        Args:
+            address (str): Path of the server's Unix socket
+            authkey (bytes): Shared key used to authenticate with the server
+            timeout (float): Seconds to wait for a response
+        """
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._using_advanced = None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            except (OSError, EOFError, AuthenticationError) as e:
+                raise FaceWorkerError(f'Face inference server is not reachable at {self.address}: {e}')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            with self._connections_lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def _call(self, method, *args, **kwargs):
+        """Send one request to the server and return its result."""
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send((method, args, kwargs))
+                if not conn.poll(self.timeout):
+                    # The late response would be read by the next request, so drop the connection
+                    self._drop_connection()
+                    raise FaceWorkerError(f'Face inference server did not respond within {self.timeout}s')
+                response = conn.recv()
+                break
+            except (OSError, EOFError) as e:
+                self._drop_connection()
+                if attempt == 1:
+                    raise FaceWorkerError(f'Lost connection to face inference server: {e}')
+
+        if response[0] == 'ok':
+            return response[1]
+
+        _, error_type, message = response
+        raise FaceWorkerError(f'{error_type}: {message}')
+
+    def __getattr__(self, name):
+        # Forward the recognizer API; anything else is a genuine missing attribute
+        if name in REMOTE_METHODS:
+            return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+        raise AttributeError(name)
+
+    @property
+    def using_advanced(self):
+        # The backend cannot change while the server runs, so ask only once
+        if self._using_advanced is None:
+            self._using_advanced = self._call('get_info')['using_advanced']
+        return self._using_advanced
+
+    def close(self):
+        """Close every connection opened by this client."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,107 @@
+"""
+Multi-frame face verification from frames uploaded as they are captured.
+
+Instead of one JPEG per verification attempt, the browser uploads a frame as soon
+as it has captured it, and keeps capturing and uploading until the server has
+decided. Each frame is embedded when it arrives. EvidenceAccumulator combines the
+per-frame similarities and decides as soon as the evidence is conclusive, so a
+clear match usually needs only the first frames and no more are captured.
+
+The accumulator's state is small enough to keep in the session between the
+uploads of one attempt (see state() and restore()).
+"""
+
+# Decisions returned by EvidenceAccumulator.add()
+ACCEPT = 'accept'
+REJECT = 'reject'
+
+
+class EvidenceAccumulator:
+    """
+    Combines per-frame similarities for one claimed identity and decides early.
+
+    The match is accepted once at least min_frames frames with a face have a mean
+    similarity of accept_score or more, or as soon as a single frame reaches
+    accept_score + strong_margin. It is rejected when max_frames have been seen, or
+    earlier once even perfect scores on the remaining frames could not lift the
+    mean to accept_score.
+
+    Attributes:
+        accept_score (float): Mean cosine similarity required to accept
+        min_frames (int): Frames with a face needed before accepting on the mean
+        max_frames (int): Frames examined before giving up
+        strong_margin (float): Margin above accept_score that accepts on a single frame
+        scores (list): Similarities of the frames with a face so far
+        frames (int): Frames examined so far, including those without a usable face
+    """
+
+    def __init__(self, accept_score, min_frames=2, max_frames=5, strong_margin=0.1):
+        """
+        Initialize the accumulator.
+
+        Args:
+            accept_score (float): Mean cosine similarity required to accept
+            min_frames (int): Frames with a face needed before accepting on the mean
+            max_frames (int): Frames examined before giving up
+            strong_margin (float): Margin above accept_score that accepts on a single frame
+        """
+        self.accept_score = accept_score
+        self.min_frames = max(1, min_frames)
+        self.max_frames = max(self.min_frames, max_frames)
+        self.strong_margin = strong_margin
+        self.scores = []
+        self.frames = 0
+
+    def state(self):
+        """
+        Return the evidence gathered so far, in a JSON-serializable form.
+
+        Returns:
+            dict: Similarities of the frames with a face and the number of frames examined
+        """
+        return {'scores': list(self.scores), 'frames': self.frames}
+
+    def restore(self, state):
+        """
+        Continue from evidence returned by state().
+
+        Args:
+            state (dict): Saved evidence
+        """
+        self.scores = [float(score) for score in state['scores']]
+        self.frames = int(state['frames'])
+
+    @property
+    def score(self):
+        """Mean similarity of the frames with a face, or 0.0 if there are none."""
+        return sum(self.scores) / len(self.scores) if self.scores else 0.0
+
+    def add(self, similarity):
+        """
+        Record one frame.
+
+        Args:
+            similarity (float): Cosine similarity to the claimed user, or None if the
+                frame had no usable face
+
+        Returns:
+            str: ACCEPT, REJECT, or None if more frames are needed
+        """
+        self.frames += 1
+        if similarity is not None:
+            self.scores.append(float(similarity))
+
+            if similarity >= self.accept_score + self.strong_margin:
+                return ACCEPT
+            if len(self.scores) >= self.min_frames and self.score >= self.accept_score:
+                return ACCEPT
+
+        remaining = self.max_frames - self.frames
+        if remaining <= 0:
+            return REJECT
+
+        # Best mean reachable if every remaining frame were a perfect match
+        best_mean = (sum(self.scores) + remaining) / (len(self.scores) + remaining)
+        if best_mean < self.accept_score:
+            return REJECT
+        return None
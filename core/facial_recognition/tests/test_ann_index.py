@@ -0,0 +1,64 @@
+from django.test import SimpleTestCase
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from facial_recognition.ann_index import IVFIndex
+from facial_recognition.embedding_index import EmbeddingIndex, normalize
+
+class IVFIndexTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 32))
+        self.matrix = normalize(centers[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, 32)))
+        self.ids = [str(i) for i in range(len(self.matrix))]
+
+        self.exact = EmbeddingIndex()
+        for user_id, embedding in zip(self.ids, self.matrix):
+            self.exact.set(user_id, embedding)
+
+    def test_scanning_all_lists_matches_exact_search(self):
+        index = IVFIndex.build(self.exact, n_lists=16)
+
+        for query in self.matrix[:20]:
+            expected = [user_id for user_id, _ in self.exact.search(query, k=5)]
+            found = [user_id for user_id, _ in index.search(query, k=5, n_probe=16)]
+            self.assertEqual(found, expected)
+
+    def test_add_remove_and_persistence(self):
+        index = IVFIndex.build(self.exact, n_lists=16, n_probe=4)
+        self.exact.remove('7')
+        index.remove('7')
+        self.exact.set('new', self.matrix[7])
+        index.add('new', self.matrix[7])
+        self.assertEqual(index.search(self.matrix[7], k=1)[0][0], 'new')
+
+        db_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(db_path, 'ivf_index.npz')
+            index.save(path)
+            loaded = IVFIndex.load(path)
+        finally:
+            shutil.rmtree(db_path)
+
+        loaded.populate(self.exact)
+        self.assertEqual(loaded.n_probe, 4)
+        self.assertEqual(len(loaded), len(self.ids))
+        self.assertEqual(loaded.search(self.matrix[42], k=1)[0][0], '42')
+
+    def test_lists_score_the_shared_compact_matrix(self):
+        compact = EmbeddingIndex(dtype='int8')
+        for user_id, embedding in zip(self.ids, self.matrix):
+            compact.set(user_id, embedding)
+        index = IVFIndex.build(compact, n_lists=16)
+
+        # Removing a row moves the last row into its place; the lists must follow it
+        compact.remove('3')
+        index.remove('3')
+        last = self.ids[-1]
+        self.assertEqual(index.search(self.matrix[-1], k=1, n_probe=16)[0][0], last)
+
+        expected = [user_id for user_id, _ in compact.search(self.matrix[5], k=5)]
+        found = [user_id for user_id, _ in index.search(self.matrix[5], k=5, n_probe=16)]
+        self.assertEqual(found, expected)
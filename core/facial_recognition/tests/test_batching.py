@@ -0,0 +1,62 @@
+from django.test import SimpleTestCase
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from facial_recognition.batching import MicroBatcher
+
+class MicroBatcherTest(SimpleTestCase):
+    def test_concurrent_calls_are_batched_and_results_routed_back(self):
+        calls = []
+
+        def double_all(items):
+            calls.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double_all, window_ms=50, max_batch_size=8)
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(batcher, range(8)))
+        finally:
+            batcher.close()
+
+        self.assertEqual(results, [item * 2 for item in range(8)])
+        self.assertLess(len(calls), 8)
+
+        stats = batcher.stats()
+        self.assertEqual(stats['items'], 8)
+        self.assertEqual(stats['batches'], len(calls))
+        self.assertGreaterEqual(stats['max_queue_delay_ms'], 0.0)
+
+    def test_exceptions_are_raised_in_every_caller(self):
+        def fail(items):
+            raise ValueError('model failed')
+
+        batcher = MicroBatcher(fail, window_ms=1)
+        try:
+            with self.assertRaises(ValueError):
+                batcher(1)
+        finally:
+            batcher.close()
+
+    def test_close_fails_pending_items_and_rejects_new_ones(self):
+        release = threading.Event()
+
+        def slow(items):
+            release.wait(5)
+            return items
+
+        batcher = MicroBatcher(slow, window_ms=1, max_batch_size=1)
+        running = batcher.submit(1)
+        pending = batcher.submit(2)
+        time.sleep(0.05)
+
+        # The worker is stuck on the first item, so the second is still queued when close() gives up
+        batcher.close(timeout=0.05)
+        release.set()
+
+        self.assertEqual(running.result(timeout=5), 1)
+        with self.assertRaises(RuntimeError):
+            pending.result(timeout=5)
+        with self.assertRaises(RuntimeError):
+            batcher.submit(3)
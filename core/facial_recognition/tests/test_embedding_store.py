@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from facial_recognition.embedding_store import EmbeddingStore
+
+class EmbeddingStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_path)
+
+    def test_put_get_and_reopen(self):
+        store = EmbeddingStore(self.db_path)
+        first = self.rng.normal(size=8).astype(np.float32)
+        second = self.rng.normal(size=8).astype(np.float32)
+
+        store.put('1234', first)
+        store.put('5678', second)
+
+        reopened = EmbeddingStore(self.db_path)
+        self.assertEqual(len(reopened), 2)
+        np.testing.assert_array_equal(reopened['1234'], first)
+        np.testing.assert_array_equal(reopened['5678'], second)
+
+    def test_update_and_delete_leave_dead_rows_until_compaction(self):
+        store = EmbeddingStore(self.db_path)
+        latest = self.rng.normal(size=8).astype(np.float32)
+
+        store.put('1234', self.rng.normal(size=8))
+        store.put('1234', latest)
+        store.put('5678', self.rng.normal(size=8))
+        self.assertTrue(store.delete('5678'))
+        self.assertFalse(store.delete('5678'))
+
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.dead_rows, 2)
+
+        self.assertEqual(store.compact(), 2)
+        self.assertEqual(store.dead_rows, 0)
+        self.assertEqual(store.generation, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.db_path, 'embeddings-0.f32')))
+
+        reopened = EmbeddingStore(self.db_path)
+        self.assertNotIn('5678', reopened)
+        np.testing.assert_array_equal(reopened['1234'], latest)
+
+    def test_other_instance_sees_changes_after_refresh(self):
+        writer = EmbeddingStore(self.db_path)
+        reader = EmbeddingStore(self.db_path)
+
+        writer.put('1234', self.rng.normal(size=8))
+        self.assertNotIn('1234', reader)
+
+        reader.refresh()
+        self.assertIn('1234', reader)
+
+        writer.compact()
+        writer.delete('1234')
+        reader.refresh()
+        self.assertNotIn('1234', reader)
+
+    def test_reopening_with_another_dtype_keeps_the_stored_one(self):
+        first = self.rng.normal(size=8).astype(np.float32)
+        second = self.rng.normal(size=8).astype(np.float32)
+        EmbeddingStore(self.db_path, dtype=np.float16).put('V001', first)
+
+        store = EmbeddingStore(self.db_path, dtype=np.float32)
+        self.assertEqual(store.dtype, np.float16)
+        np.testing.assert_allclose(store['V001'], first, atol=1e-2)
+
+        store.put('V002', second)
+        reopened = EmbeddingStore(self.db_path)
+        np.testing.assert_allclose(reopened['V001'], first, atol=1e-2)
+        np.testing.assert_allclose(reopened['V002'], second, atol=1e-2)
+
+    def test_legacy_npy_files_are_imported(self):
+        embedding = self.rng.normal(size=8).astype(np.float32)
+        np.save(os.path.join(self.db_path, '1077.npy'), embedding)
+
+        store = EmbeddingStore(self.db_path)
+
+        np.testing.assert_array_equal(store['1077'], embedding)
@@ -0,0 +1,128 @@
+from django.test import SimpleTestCase
+import numpy as np
+import shutil
+import tempfile
+
+from facial_recognition.embedding_index import normalize
+from facial_recognition.face_database import FaceDatabaseMixin
+
+class FaceDatabase(FaceDatabaseMixin):
+    def __init__(self, db_path):
+        self.threshold = 0.7
+        self._init_face_db(db_path)
+
+class FaceDatabaseTest(SimpleTestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_path)
+
+    def test_batch_enrollment_stores_the_mean_template_once(self):
+        db = FaceDatabase(self.db_path)
+        samples = self.rng.normal(size=(5, 8)).astype(np.float32)
+
+        puts = []
+        original_put = db.face_db.put
+        db.face_db.put = lambda user_id, embedding: puts.append(user_id) or original_put(user_id, embedding)
+
+        db._store_embeddings('V001', list(samples))
+
+        self.assertEqual(puts, ['V001'])
+        expected = normalize(normalize(samples).mean(axis=0))
+        np.testing.assert_allclose(db.face_db['V001'], expected, rtol=1e-5, atol=1e-6)
+        self.assertAlmostEqual(db._claimed_similarity('V001', expected), 1.0, places=5)
+
+    def test_only_the_most_recent_templates_are_kept_and_matched(self):
+        db = FaceDatabase(self.db_path)
+        db.max_templates = 3
+        samples = normalize(self.rng.normal(size=(5, 8)))
+
+        for sample in samples:
+            db._store_embedding('V001', sample)
+        db._store_embedding('V002', self.rng.normal(size=8))
+
+        templates = db._user_templates('V001')
+        np.testing.assert_allclose(templates, samples[-3:], atol=1e-3)
+        np.testing.assert_allclose(db.face_db['V001'], normalize(templates.mean(axis=0)), atol=1e-3)
+
+        # Every kept template matches on its own; a dropped one only through the centroid
+        self.assertAlmostEqual(db._claimed_similarity('V001', samples[-1]), 1.0, places=3)
+        self.assertLess(db._claimed_similarity('V001', samples[0]), 0.99)
+        self.assertEqual(db.search_embedding(samples[-2], k=1)[0][0], 'V001')
+
+        # Templates are stored compactly and removed with the user
+        self.assertEqual(db.templates.dtype, np.float16)
+        db.remove_face('V001')
+        self.assertEqual(len(db._user_templates('V001')), 0)
+        self.assertIsNone(db._claimed_similarity('V001', samples[-1]))
+
+    def test_users_without_template_slots_are_matched_by_centroid(self):
+        db = FaceDatabase(self.db_path)
+        sample = normalize(self.rng.normal(size=16))
+        db._store_embedding('V001', sample)
+
+        # A template row with every slot empty leaves the shortlisted user with no templates at all
+        db.templates.put('V001', np.zeros(db.max_templates * 16, dtype=np.float32))
+        self.assertEqual(len(db._user_templates('V001')), 0)
+
+        matches = db.search_embedding(sample, k=1)
+        self.assertEqual(matches[0][0], 'V001')
+        self.assertAlmostEqual(matches[0][1], 1.0, places=5)
+        self.assertAlmostEqual(db._claimed_similarity('V001', sample), 1.0, places=5)
+
+    def test_identification_falls_back_when_the_runner_up_is_too_close(self):
+        db = FaceDatabase(self.db_path)
+        base = normalize(self.rng.normal(size=16))
+        twin = normalize(base + 0.01 * self.rng.normal(size=16))
+        other = normalize(self.rng.normal(size=16))
+        db._store_embedding('V001', base)
+        db._store_embedding('V002', other)
+
+        result = db.identify_embedding(base, k=2, min_margin=0.05)
+        self.assertEqual(result['user_id'], 'V001')
+        self.assertEqual([c[0] for c in result['candidates']], ['V001', 'V002'])
+        self.assertAlmostEqual(result['candidates'][1][2], result['margin'], places=6)
+
+        # A near-identical second voter makes the best match ambiguous
+        db._store_embedding('V003', twin)
+        result = db.identify_embedding(base, k=2, min_margin=0.05)
+        self.assertIsNone(result['user_id'])
+        self.assertEqual(result['reason'], 'ambiguous')
+
+        # A face nobody matches is rejected outright
+        self.assertEqual(db.identify_embedding(-base)['reason'], 'no_match')
+
+    def test_identification_requires_the_minimum_similarity(self):
+        db = FaceDatabase(self.db_path)
+        db.threshold = 0.6
+        base = normalize(self.rng.normal(size=16))
+        noise = normalize(self.rng.normal(size=16))
+        noise = normalize(noise - noise.dot(base) * base)
+        db._store_embedding('V001', base)
+
+        # Passes the recognizer's 0.6 threshold, but not a stricter identification floor
+        query = 0.65 * base + np.sqrt(1 - 0.65 ** 2) * noise
+        self.assertEqual(db.identify_embedding(query)['user_id'], 'V001')
+        result = db.identify_embedding(query, min_similarity=0.85)
+        self.assertIsNone(result['user_id'])
+        self.assertEqual(result['reason'], 'no_match')
+        self.assertAlmostEqual(result['confidence'], 0.65, places=3)
+
+    def test_scoped_search_only_matches_the_candidate_subset(self):
+        db = FaceDatabase(self.db_path)
+        samples = normalize(self.rng.normal(size=(6, 16)))
+        for i, sample in enumerate(samples):
+            db._store_embedding(f'V00{i}', sample)
+
+        roll = ['V001', 'V003', 'V009']
+        matches = db.search_embedding(samples[0], k=3, candidate_ids=roll, subset_key='voting-1')
+        self.assertEqual(sorted(user_id for user_id, _ in matches), ['V001', 'V003'])
+
+        # Cached rows follow the index when other users are removed and rows move
+        db.remove_face('V000')
+        db.remove_face('V002')
+        matches = db.search_embedding(samples[3], k=1, candidate_ids=roll, subset_key='voting-1')
+        self.assertEqual(matches[0][0], 'V003')
+        self.assertAlmostEqual(matches[0][1], 1.0, places=3)
@@ -0,0 +1,79 @@
+from django.test import SimpleTestCase
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from facial_recognition.embedding_index import normalize
+from facial_recognition.face_database import FaceDatabaseMixin
+
+class Worker(FaceDatabaseMixin):
+    def __init__(self, db_path, **kwargs):
+        self._init_face_db(db_path, sync_interval_ms=0, **kwargs)
+
+class FaceDatabaseSyncTest(SimpleTestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.faces = normalize(np.random.default_rng(0).normal(size=(4, 16)))
+
+    def tearDown(self):
+        shutil.rmtree(self.db_path)
+
+    def test_changes_from_another_worker_are_applied_before_lookups(self):
+        enrolling, verifying = Worker(self.db_path), Worker(self.db_path)
+
+        enrolling._store_embedding('V1', self.faces[0])
+        enrolling._store_embedding('V2', self.faces[1])
+        self.assertTrue(verifying._is_registered('V1'))
+        self.assertEqual(verifying.search_embedding(self.faces[1])[0][0], 'V2')
+
+        # Only the changed users are applied, without reloading the store
+        store = verifying.face_db
+        enrolling.remove_face('V1')
+        enrolling._store_embedding('V2', self.faces[2])
+        self.assertIsNone(verifying._claimed_similarity('V1', self.faces[0]))
+        self.assertIs(verifying.face_db, store)
+        self.assertGreater(verifying._claimed_similarity('V2', self.faces[2]), 0.99)
+
+        # A compaction elsewhere switches this worker to the new generation
+        enrolling.face_db.compact()
+        enrolling._store_embedding('V3', self.faces[3])
+        self.assertEqual(verifying.search_embedding(self.faces[3])[0][0], 'V3')
+        self.assertEqual(len(verifying.index), 2)
+
+    def test_an_index_rebuilt_elsewhere_replaces_the_loaded_one(self):
+        faces = normalize(np.random.default_rng(1).normal(size=(32, 16)))
+        building, searching = Worker(self.db_path, use_ann_index=True), Worker(self.db_path, use_ann_index=True)
+        for i, face in enumerate(faces):
+            building._store_embedding(f'V{i}', face)
+        self.assertEqual(searching.search_embedding(faces[5])[0][0], 'V5')
+        self.assertIsNone(searching.ann_index)
+
+        building.build_ann_index(n_lists=4)
+        self.assertEqual(searching.search_embedding(faces[7])[0][0], 'V7')
+        first = searching.ann_index
+        self.assertEqual(first.n_lists, 4)
+
+        building.build_ann_index(n_lists=2)
+        searching.search_embedding(faces[7])
+        self.assertIsNot(searching.ann_index, first)
+        self.assertEqual(searching.ann_index.n_lists, 2)
+        self.assertEqual(len(searching.ann_index), len(faces))
+
+        # A removed index (as after fitting a projection) is dropped
+        os.remove(building.ann_index_path)
+        self.assertEqual(searching.search_embedding(faces[9])[0][0], 'V9')
+        self.assertIsNone(searching.ann_index)
+
+    def test_enrolling_in_a_stale_worker_keeps_templates_stored_elsewhere(self):
+        first = Worker(self.db_path)
+        # Opened while the database is empty, so its index has no dimension yet
+        second = Worker(self.db_path)
+        second.sync_interval = 3600
+
+        first._store_embedding('V1', self.faces[0])
+        second._store_embedding('V1', self.faces[1])
+
+        templates = second._user_templates('V1')
+        self.assertEqual(len(templates), 2)
+        np.testing.assert_allclose(templates[0], self.faces[0], atol=1e-3)
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+import numpy as np
+
+from facial_recognition.face_roi import box_iou, check_face_crop, parse_box
+
+class FakeDetector:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def detect(self, img_array):
+        return [{'box': box, 'confidence': 1.0, 'keypoints': {}} for box in self.boxes]
+
+class FaceCropCheckTest(SimpleTestCase):
+    def test_tight_face_crops_pass_and_implausible_ones_fall_back(self):
+        crop = np.zeros((140, 120, 3), dtype=np.uint8)
+        box = parse_box('16,20,88,100')
+
+        self.assertEqual(check_face_crop(crop, box), (True, None))
+        self.assertEqual(check_face_crop(crop, [60, 20, 88, 100]).reason, 'box_outside_crop')
+        self.assertEqual(check_face_crop(crop, [16, 20, 30, 30]).reason, 'face_too_small')
+        self.assertEqual(check_face_crop(crop, [10, 10, 100, 45]).reason, 'bad_aspect_ratio')
+        self.assertEqual(check_face_crop(np.zeros((400, 400, 3), dtype=np.uint8), box).reason, 'crop_too_loose')
+
+        # A configured detector must find a face where the client says it is
+        self.assertTrue(check_face_crop(crop, box, detector=FakeDetector([[20, 24, 84, 90]])).ok)
+        self.assertEqual(check_face_crop(crop, box, detector=FakeDetector([])).reason, 'face_not_confirmed')
+
+        self.assertAlmostEqual(box_iou([0, 0, 10, 10], [5, 0, 10, 10]), 1 / 3)
+        with self.assertRaises(ValueError):
+            parse_box('1,2,3')
+
+    def test_degenerate_boxes_are_rejected_without_errors(self):
+        for value in ('inf,0,100,100', '0,nan,100,100', '0,0,1e400,100'):
+            with self.assertRaises(ValueError):
+                parse_box(value)
+
+        crop = np.zeros((140, 120, 3), dtype=np.uint8)
+        self.assertEqual(check_face_crop(crop, [10, 10, 0, 0], min_face_size=0).reason, 'empty_box')
+        self.assertEqual(check_face_crop(crop, [10, 10, 50, -60], min_face_size=0).reason, 'empty_box')
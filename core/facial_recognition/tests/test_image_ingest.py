@@ -0,0 +1,22 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+import base64
+import cv2
+import numpy as np
+
+from facial_recognition.image_ingest import decode_data_url, decode_upload
+
+class ImageIngestTest(SimpleTestCase):
+    def test_binary_uploads_and_data_urls_decode_to_the_same_rgb_frame(self):
+        frame = np.zeros((24, 32, 3), dtype=np.uint8)
+        frame[:, :, 0] = 200  # Red in RGB
+        _, png = cv2.imencode('.png', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+
+        upload = SimpleUploadedFile('frame.png', png.tobytes(), content_type='image/png')
+        data_url = 'data:image/png;base64,' + base64.b64encode(png.tobytes()).decode()
+
+        np.testing.assert_array_equal(decode_upload(upload), frame)
+        np.testing.assert_array_equal(decode_data_url(data_url), frame)
+
+        with self.assertRaises(ValueError):
+            decode_upload(SimpleUploadedFile('frame.jpg', b'not an image'))
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+import numpy as np
+
+from facial_recognition.pipeline import downscale_for_detection, detection_min_face_size, rescale_face
+
+class DownscaleForDetectionTest(SimpleTestCase):
+    def test_large_frames_are_downscaled_and_boxes_mapped_back(self):
+        frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+        small, scale = downscale_for_detection(frame, 640)
+
+        self.assertEqual(small.shape, (360, 640, 3))
+        self.assertAlmostEqual(scale, 1 / 3)
+        self.assertEqual(detection_min_face_size(60, scale), 20)
+
+        face = {'box': [100, 50, 40, 60], 'confidence': 0.99, 'keypoints': {'nose': (120, 80)}}
+        full = rescale_face(face, scale)
+        self.assertEqual(full['box'], [300, 150, 120, 180])
+        self.assertEqual(full['keypoints'], {'nose': (360, 240)})
+
+    def test_small_frames_are_left_alone(self):
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+        small, scale = downscale_for_detection(frame, 640)
+
+        self.assertIs(small, frame)
+        self.assertEqual(scale, 1.0)
+        self.assertEqual(detection_min_face_size(20, scale), 20)
@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase
+import numpy as np
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from facial_recognition.embedding_index import normalize
+from facial_recognition.embedding_store import EmbeddingStore
+from facial_recognition.face_database import fit_projection
+from facial_recognition.projection import EmbeddingProjection, PROJECTION_FILENAME
+from facial_recognition.tests.test_face_database import FaceDatabase
+
+class EmbeddingProjectionTest(SimpleTestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        # Embeddings that mostly vary in a 6-d subspace of a 64-d space
+        basis = rng.normal(size=(6, 64))
+        self.faces = normalize(rng.normal(size=(40, 6)) @ basis + 0.01 * rng.normal(size=(40, 64)))
+
+    def tearDown(self):
+        shutil.rmtree(self.db_path)
+
+    def test_fitted_projection_keeps_the_variance_and_roundtrips(self):
+        projection = EmbeddingProjection.fit(self.faces, 6)
+
+        self.assertEqual(projection.apply(self.faces).shape, (40, 6))
+        self.assertGreater(projection.explained_variance(self.faces), 0.99)
+
+        path = os.path.join(self.db_path, PROJECTION_FILENAME)
+        projection.save(path)
+        loaded = EmbeddingProjection.load(path)
+        self.assertEqual(loaded.version, projection.version)
+        np.testing.assert_allclose(loaded.apply(self.faces[0]), projection.apply(self.faces[0]), atol=1e-6)
+
+    def test_database_is_projected_and_versioned(self):
+        db = FaceDatabase(self.db_path)
+        for i, face in enumerate(self.faces):
+            db._store_embeddings(f'V{i}', [face, face])
+
+        projection, samples = fit_projection(self.db_path, 6)
+        self.assertEqual(samples, 80)
+
+        # A recognizer opened on the directory projects new queries the same way
+        db = FaceDatabase(self.db_path)
+        self.assertEqual(db.face_db.projection, projection.version)
+        self.assertEqual(db.index.dim, 6)
+        self.assertEqual(db.search_embedding(db._project(self.faces[3]))[0][0], 'V3')
+
+        with self.assertRaises(ValueError):
+            fit_projection(self.db_path, 6)
+
+        # Vectors from another projection are refused
+        os.remove(os.path.join(self.db_path, PROJECTION_FILENAME))
+        with self.assertRaises(ValueError):
+            FaceDatabase(self.db_path)
+
+    def test_interrupted_fit_leaves_a_consistent_database(self):
+        db = FaceDatabase(self.db_path)
+        for i, face in enumerate(self.faces):
+            db._store_embeddings(f'V{i}', [face, face])
+
+        # Crash right after the commit point: projection saved, stores not switched yet
+        with mock.patch.object(EmbeddingStore, 'commit_pending', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                fit_projection(self.db_path, 6)
+
+        db = FaceDatabase(self.db_path)
+        self.assertEqual(db.face_db.projection, db.projection.version)
+        self.assertEqual(db.templates.projection, db.projection.version)
+        self.assertEqual(db.search_embedding(db._project(self.faces[5]))[0][0], 'V5')
@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase, override_settings
+import cv2
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from facial_recognition.quality import (
+    FrameQualityGate, get_quality_gate, quality_stats_path, read_stats, shutdown_quality_gate
+)
+
+def checkerboard(brightness=1.0, square=40):
+    """A sharp, high-contrast 640x480 RGB frame."""
+    ys, xs = np.indices((480, 640))
+    board = ((ys // square + xs // square) % 2) * 200 + 30
+    gray = np.clip(board * brightness, 0, 255).astype(np.uint8)
+    return np.dstack([gray] * 3)
+
+class FrameQualityGateTest(SimpleTestCase):
+    def test_sharp_well_lit_frames_pass(self):
+        gate = FrameQualityGate()
+
+        result = gate.check(checkerboard())
+
+        self.assertTrue(result.ok)
+        self.assertIsNone(result.reason)
+        self.assertEqual(gate.stats()['rejected'], 0)
+
+    def test_unusable_frames_are_rejected_with_a_reason(self):
+        gate = FrameQualityGate()
+        frames = {
+            'too_dark': checkerboard(brightness=0.15),
+            'too_bright': np.full((480, 640, 3), 250, dtype=np.uint8),
+            'low_contrast': np.full((480, 640, 3), 128, dtype=np.uint8),
+            'blurry': cv2.GaussianBlur(checkerboard(square=160), (0, 0), 25),
+        }
+
+        for reason, frame in frames.items():
+            result = gate.check(frame)
+            self.assertFalse(result.ok, reason)
+            self.assertEqual(result.reason, reason)
+
+        stats = gate.stats()
+        self.assertEqual(stats['checked'], 4)
+        self.assertEqual(stats['rejections'], {reason: 1 for reason in frames})
+
+    def test_counters_of_several_gates_are_merged_into_the_stats_file(self):
+        db_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(db_path, 'quality_stats.json')
+            first = FrameQualityGate(stats_path=path, flush_every=2)
+            second = FrameQualityGate(stats_path=path, flush_every=2)
+
+            first.check(checkerboard())
+            first.check(checkerboard(brightness=0.15))
+            second.check(checkerboard(brightness=0.15))
+            second.flush_stats()
+
+            stats = read_stats(path)
+        finally:
+            shutil.rmtree(db_path)
+
+        self.assertEqual(stats['checked'], 3)
+        self.assertEqual(stats['rejections'], {'too_dark': 2})
+
+    def test_unrecorded_checks_are_left_out_of_the_stats(self):
+        gate = FrameQualityGate()
+
+        result = gate.check(checkerboard(brightness=0.15), record=False)
+
+        self.assertEqual(result.reason, 'too_dark')
+        self.assertEqual(gate.stats()['checked'], 0)
+
+    def test_shared_gate_keeps_its_stats_in_the_configured_face_database(self):
+        db_path = tempfile.mkdtemp()
+        try:
+            with override_settings(FACE_DB_PATH=db_path):
+                shutdown_quality_gate()
+                get_quality_gate().check(checkerboard(brightness=0.15))
+                shutdown_quality_gate()
+
+                stats = read_stats(quality_stats_path())
+                self.assertEqual(os.path.dirname(quality_stats_path()), db_path)
+        finally:
+            shutil.rmtree(db_path)
+
+        self.assertEqual(stats['rejections'], {'too_dark': 1})
@@ -0,0 +1,38 @@
+from django.test import SimpleTestCase
+import numpy as np
+
+from facial_recognition.embedding_index import EmbeddingIndex, normalize
+from facial_recognition.quantization import drift_report
+
+class QuantizedEmbeddingIndexTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.matrix = normalize(rng.normal(size=(300, 128)))
+        self.queries = normalize(self.matrix[:20] + 0.3 * normalize(rng.normal(size=(20, 128))))
+
+    def test_compact_indexes_match_float32_search(self):
+        indexes = {dtype: EmbeddingIndex(dtype=dtype, capacity=4) for dtype in ('float32', 'float16', 'int8')}
+        for dtype, index in indexes.items():
+            for i, vector in enumerate(self.matrix):
+                index.set(f'V{i}', vector)
+            index.remove('V299')
+
+        exact = indexes['float32']
+        self.assertEqual(indexes['float16'].nbytes * 2, exact.nbytes)
+        self.assertLess(indexes['int8'].nbytes, indexes['float16'].nbytes)
+
+        for dtype in ('float16', 'int8'):
+            index = indexes[dtype]
+            np.testing.assert_allclose(index.matrix, exact.matrix, atol=0.01)
+            for query in self.queries:
+                self.assertEqual(index.search(query)[0][0], exact.search(query)[0][0])
+                self.assertAlmostEqual(index.similarity('V5', query), exact.similarity('V5', query), delta=0.01)
+
+    def test_drift_report(self):
+        results = {result['dtype']: result for result in drift_report(self.matrix, self.queries, k=5)}
+
+        self.assertLess(results['float32']['max_error'], 1e-5)
+        self.assertEqual(results['int8']['bytes_per_vector'], 128 + 4)
+        for result in results.values():
+            self.assertLess(result['max_error'], 0.02)
+            self.assertEqual(result['top1_agreement'], 1.0)
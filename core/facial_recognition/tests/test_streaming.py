@@ -0,0 +1,34 @@
+from django.test import SimpleTestCase
+import json
+
+from facial_recognition.streaming import ACCEPT, REJECT, EvidenceAccumulator
+
+class StreamingVerificationTest(SimpleTestCase):
+    def test_evidence_decides_as_soon_as_it_is_conclusive(self):
+        # Two agreeing frames accept on the mean; one very strong frame accepts alone
+        evidence = EvidenceAccumulator(0.7, min_frames=2, max_frames=5, strong_margin=0.1)
+        self.assertIsNone(evidence.add(0.72))
+        self.assertEqual(evidence.add(0.74), ACCEPT)
+        self.assertEqual(EvidenceAccumulator(0.7).add(0.85), ACCEPT)
+
+        # Frames without a face only use up the budget
+        evidence = EvidenceAccumulator(0.7, min_frames=2, max_frames=3)
+        self.assertIsNone(evidence.add(None))
+        self.assertIsNone(evidence.add(0.75))
+        self.assertEqual(evidence.add(None), REJECT)
+
+        # Rejected early once the remaining frames cannot lift the mean enough
+        evidence = EvidenceAccumulator(0.7, min_frames=2, max_frames=3)
+        self.assertIsNone(evidence.add(0.2))
+        self.assertEqual(evidence.add(0.1), REJECT)
+        self.assertEqual(evidence.frames, 2)
+
+    def test_evidence_survives_a_roundtrip_between_uploads(self):
+        evidence = EvidenceAccumulator(0.7, min_frames=2, max_frames=5)
+        self.assertIsNone(evidence.add(None))
+        self.assertIsNone(evidence.add(0.72))
+
+        resumed = EvidenceAccumulator(0.7, min_frames=2, max_frames=5)
+        resumed.restore(json.loads(json.dumps(evidence.state())))
+        self.assertEqual(resumed.frames, 2)
+        self.assertEqual(resumed.add(0.74), ACCEPT)
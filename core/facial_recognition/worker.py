@@ -0,0 +1,113 @@
+"""
+Standalone face inference server.
+
+The server process owns the face detector, the embedding model and the face
+database. Web workers talk to it over a local Unix socket through
+RemoteFacialRecognition, so they never import torch or TensorFlow themselves,
+and inference concurrency is limited in one place for the whole host.
+
+The wire format and the methods clients may call are defined in protocol.py.
+"""
+
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from .pipeline import FaceAnalysis
+from .protocol import REMOTE_METHODS, LIGHT_METHODS
+
+
+def _to_portable(result):
+    """Convert framework tensors in a result to numpy so clients do not need torch."""
+    if isinstance(result, FaceAnalysis):
+        return result._replace(face_tensor=_to_portable(result.face_tensor))
+    if hasattr(result, 'detach') and hasattr(result, 'cpu'):
+        return result.detach().cpu().numpy()
+    return result
+
+
+class FaceWorkerServer:
+    """
+    Serves a recognizer's methods over a Unix socket.
+
+    Attributes:
+        recognizer: The local recognizer instance doing the actual work
+        address (str): Path of the Unix socket
+        concurrency (int): Maximum number of inference calls running at once
+    """
+
+    def __init__(self, recognizer, address, authkey, concurrency=1):
+        """
+        Initialize the server.
+
+        Args:
+            recognizer: Local recognizer instance
+            address (str): Path of the Unix socket
+            authkey (bytes): Shared key clients must authenticate with
+            concurrency (int): Maximum number of inference calls running at once
+        """
+        self.recognizer = recognizer
+        self.address = address
+        self.authkey = authkey
+        self.concurrency = concurrency
+
+        self._inference_slots = threading.BoundedSemaphore(concurrency)
+        self._listener = None
+        self._stopped = threading.Event()
+
+    def serve_forever(self):
+        """Accept connections until stop() is called, handling each one on its own thread."""
+        # A socket file left behind by a previous run would make bind() fail
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+
+        try:
+            while not self._stopped.is_set():
+                try:
+                    conn = self._listener.accept()
+                except Exception as e:
+                    if self._stopped.is_set():
+                        break
+                    print(f"Face worker: rejected connection: {e}")
+                    continue
+
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop accepting connections and remove the socket file."""
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _handle(self, conn):
+        """Serve requests from one client connection until it closes."""
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                conn.send(self._dispatch(method, args, kwargs))
+
+    def _dispatch(self, method, args, kwargs):
+        if method not in REMOTE_METHODS:
+            return ('error', 'AttributeError', f'Method not available: {method}')
+
+        try:
+            if method in LIGHT_METHODS:
+                result = getattr(self.recognizer, method)(*args, **kwargs)
+            else:
+                with self._inference_slots:
+                    result = getattr(self.recognizer, method)(*args, **kwargs)
+            return ('ok', _to_portable(result))
+        except Exception as e:
+            return ('error', type(e).__name__, str(e))
@@ -0,0 +1,50 @@
+// Camera frame capture shared by the facial recognition pages.
+// Frames are downscaled in the browser and uploaded as binary JPEG files (multipart/form-data)
+// instead of base64 data URLs, which are a third larger and are copied as text by the server.
+
+// Draw the current video frame, downscaled so its longest side is at most maxSide, and encode it as a JPEG blob
+function captureFrameBlob(video, maxSide, quality, canvas) {
+    return new Promise((resolve, reject) => {
+        const width = video.videoWidth || video.width;
+        const height = video.videoHeight || video.height;
+        const scale = Math.min(1, maxSide / Math.max(width, height));
+
+        canvas = canvas || document.createElement('canvas');
+        canvas.width = Math.round(width * scale);
+        canvas.height = Math.round(height * scale);
+        canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+
+        canvas.toBlob(blob => {
+            if (blob) {
+                resolve(blob);
+            } else {
+                reject(new Error('Could not encode the camera frame'));
+            }
+        }, 'image/jpeg', quality);
+    });
+}
+
+// Crop a face box [x, y, width, height], padded by a fraction of its size on each side, from a canvas.
+// Resolves to the JPEG blob and the box relative to the crop.
+function cropFaceBlob(sourceCanvas, box, padding, quality) {
+    return new Promise((resolve, reject) => {
+        const [x, y, width, height] = box;
+        const x1 = Math.max(0, Math.floor(x - width * padding));
+        const y1 = Math.max(0, Math.floor(y - height * padding));
+        const x2 = Math.min(sourceCanvas.width, Math.ceil(x + width * (1 + padding)));
+        const y2 = Math.min(sourceCanvas.height, Math.ceil(y + height * (1 + padding)));
+
+        const crop = document.createElement('canvas');
+        crop.width = x2 - x1;
+        crop.height = y2 - y1;
+        crop.getContext('2d').drawImage(sourceCanvas, x1, y1, crop.width, crop.height, 0, 0, crop.width, crop.height);
+
+        crop.toBlob(blob => {
+            if (blob) {
+                resolve({ blob: blob, box: [x - x1, y - y1, width, height] });
+            } else {
+                reject(new Error('Could not encode the face crop'));
+            }
+        }, 'image/jpeg', quality);
+    });
+}
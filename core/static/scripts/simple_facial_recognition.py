@@ -8,8 +8,14 @@ face embeddings.
 The embeddings are stored as .npy files in the specified database directory, with filenames
 corresponding to user IDs. This implementation is simpler than the advanced version but
 still provides good accuracy for basic use cases.
+
+If the database directory contains a projection.npz written by `manage.py fit_face_projection`,
+the 2048-d ResNet50 embeddings are reduced with it before they are stored or compared. The
+projection must be the one recorded in the embedding store's store.json, and raw .npy files
+left over from before the fit are skipped.
 """
 
+import json
 import os
 import numpy as np
 from PIL import Image
@@ -29,6 +35,7 @@ class SimpleFacialRecognition:
         db_path (str): Path to the directory containing face database
         face_db (dict): Dictionary containing face embeddings for registered users
         threshold (float): Similarity threshold for face matching
+        projection (dict): Fitted PCA projection ('mean', 'components', 'version'), or None
     """
 
     def __init__(self, db_path='facial_recognition/face_db', threshold=0.5):
@@ -52,10 +59,40 @@ class SimpleFacialRecognition:
         # Create database directory if it doesn't exist
         os.makedirs(db_path, exist_ok=True)
 
+        # Load the fitted projection, if any
+        self.projection = self._load_projection()
+
         # Load face database
         self.face_db = {}
         self._load_face_db()
 
+    def _load_projection(self):
+        """Load projection.npz and check it matches the stored embeddings."""
+        projection_path = os.path.join(self.db_path, 'projection.npz')
+        meta_path = os.path.join(self.db_path, 'store.json')
+
+        projection = None
+        if os.path.exists(projection_path):
+            with np.load(projection_path) as data:
+                projection = {
+                    'mean': data['mean'],
+                    'components': data['components'],
+                    'version': str(data['version']),
+                }
+
+        # Stored and query embeddings must use the same projection; the embedding store records
+        # which one its vectors were written with (null for raw embeddings)
+        version = projection['version'] if projection else None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored_version = json.load(f).get('projection')
+            if stored_version != version:
+                raise ValueError(
+                    f"Stored embeddings use projection '{stored_version or 'raw'}' but '{version or 'raw'}' is configured"
+                )
+
+        return projection
+
     def _load_face_db(self):
         """Load face embeddings from the database directory."""
         if not os.path.exists(self.db_path):
@@ -65,7 +102,12 @@ class SimpleFacialRecognition:
             if filename.endswith('.npy'):
                 user_id = filename.split('.')[0]
                 embedding_path = os.path.join(self.db_path, filename)
-                self.face_db[user_id] = np.load(embedding_path)
+                embedding = np.load(embedding_path)
+
+                # Raw embeddings the projection was fitted on cannot be compared with projected ones
+                if self.projection is not None and embedding.shape[-1] != self.projection['components'].shape[1]:
+                    continue
+                self.face_db[user_id] = embedding
 
     def detect_face(self, img_array):
         """
@@ -123,9 +165,13 @@ class SimpleFacialRecognition:
         face_array = preprocess_input(face_array)
 
         # Get embedding
-        embedding = self.model.predict(face_array)
+        embedding = self.model.predict(face_array)[0]
+
+        # Reduce to the fitted projection's dimension, if there is one
+        if self.projection is not None:
+            embedding = (embedding - self.projection['mean']) @ self.projection['components']
 
-        return embedding[0]
+        return embedding
 
     def register_face(self, user_id, img_path=None, img_array=None):
         """
@@ -0,0 +1,56 @@
+"""
+Per-voting candidate subsets for scoped face search.
+
+A face checked for a specific voting can only validly match a voter on that
+voting's roll (VotingVoter), usually a small fraction of everyone enrolled.
+voting_face_scope() builds the list of eligible voter IDs once per voting and
+caches it in the process; the recognizer in turn caches the matching rows of its
+embedding matrix under the scope's key.
+
+VotingVoterForm.save() invalidates the cache when it changes a roll. The key also
+contains the voting's updated_at, which that save bumps, so processes that did not
+see the invalidation stop using their stale copy as well.
+"""
+
+import threading
+
+from .models import VotingVoter
+
+_scope_lock = threading.Lock()
+_scopes = {}
+
+
+def voting_face_scope(voting):
+    """
+    Return the face search scope of a voting, building it on first use.
+
+    Args:
+        voting (Voting): The voting
+
+    Returns:
+        tuple: (subset_key, voter_ids) to pass as subset_key and candidate_ids to the recognizer
+    """
+    subset_key = f'voting-{voting.pk}-{voting.updated_at.timestamp():.6f}'
+
+    with _scope_lock:
+        scope = _scopes.get(voting.pk)
+        if scope is not None and scope[0] == subset_key:
+            return scope
+
+    # The face database is keyed by voter ID; voters without face data are skipped by the recognizer
+    voter_ids = list(
+        VotingVoter.objects.filter(voting=voting)
+        .exclude(voter__voter_id__isnull=True)
+        .values_list('voter__voter_id', flat=True)
+    )
+
+    scope = (subset_key, voter_ids)
+    with _scope_lock:
+        _scopes[voting.pk] = scope
+    return scope
+
+
+def invalidate_voting_face_scope(voting_pk):
+    """Forget the cached face search scope of a voting after its roll changed."""
+    with _scope_lock:
+        _scopes.pop(voting_pk, None)
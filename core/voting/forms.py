@@ -3,6 +3,7 @@ from django.utils import timezone
 import pytz
 from django.db import models
 from .models import Voting, Candidate, Vote, VotingVoter, Post
+from .eligibility import invalidate_voting_face_scope
 from accounts.models import User
 
 class VotingForm(forms.ModelForm):
@@ -204,6 +205,11 @@ class VotingVoterForm(forms.ModelForm):
             for voter in self.cleaned_data['voters']:
                 VotingVoter.objects.create(voting=voting, voter=voter)
 
+            # Bump updated_at so every process rebuilds its face search scope for this voting
+            voting.updated_at = timezone.now()
+            Voting.objects.filter(pk=voting.pk).update(updated_at=voting.updated_at)
+            invalidate_voting_face_scope(voting.pk)
+
         return voting
 
 class MultiPostVoteForm(forms.Form):
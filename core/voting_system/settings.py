@@ -84,6 +84,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.context_processors.face_capture',
             ],
         },
     },
@@ -170,3 +171,93 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'accounts.backends.VoterIdBackend',
 ]
+
+# Facial recognition settings
+# The recognizer is created once per process and shared by all views and commands
+FACE_DB_PATH = os.environ.get('FACE_DB_PATH', 'facial_recognition/face_db')
+FACE_RECOGNITION_THRESHOLD = float(os.environ.get('FACE_RECOGNITION_THRESHOLD', '0.6'))
+
+# Identify faces with the approximate IVF index built by `manage.py build_face_index`
+FACE_ANN_INDEX = os.environ.get('FACE_ANN_INDEX', 'False') == 'True'
+FACE_ANN_PROBE = int(os.environ.get('FACE_ANN_PROBE', '8'))
+
+# Collect concurrent face embeddings for up to this many milliseconds into one batch (0 disables batching)
+FACE_BATCH_WINDOW_MS = float(os.environ.get('FACE_BATCH_WINDOW_MS', '0'))
+FACE_BATCH_MAX_SIZE = int(os.environ.get('FACE_BATCH_MAX_SIZE', '16'))
+
+# Run face inference in a separate `manage.py run_face_worker` process listening on this Unix socket.
+# When unset, each web worker loads the models itself.
+FACE_WORKER_SOCKET = os.environ.get('FACE_WORKER_SOCKET', '')
+FACE_WORKER_TIMEOUT = float(os.environ.get('FACE_WORKER_TIMEOUT', '30'))
+
+# Face recognition backend: 'auto' (PyTorch if installed, else TensorFlow), 'advanced', 'simple' or 'onnx'.
+# The onnx backend runs the model exported by `manage.py export_face_onnx` in ONNX Runtime.
+FACE_BACKEND = os.environ.get('FACE_BACKEND', 'auto')
+FACE_ONNX_MODEL_PATH = os.environ.get('FACE_ONNX_MODEL_PATH', 'facial_recognition/models/inception_resnet_v1.onnx')
+FACE_ONNX_THREADS = int(os.environ['FACE_ONNX_THREADS']) if os.environ.get('FACE_ONNX_THREADS') else None
+
+# Run the PyTorch embedding model as a frozen TorchScript graph in channels-last format (advanced backend)
+FACE_TORCH_OPTIMIZE = os.environ.get('FACE_TORCH_OPTIMIZE', 'False') == 'True'
+# Number of torch intra-op threads (unset keeps torch's default of one per core)
+FACE_TORCH_THREADS = int(os.environ['FACE_TORCH_THREADS']) if os.environ.get('FACE_TORCH_THREADS') else None
+
+# Run face detection on a copy of each frame downscaled to this longest side (0 detects at full resolution)
+FACE_DETECTION_MAX_SIDE = int(os.environ.get('FACE_DETECTION_MAX_SIDE', '640'))
+
+# Reject blurry, dark or overexposed frames before face detection runs
+FACE_QUALITY_GATE = os.environ.get('FACE_QUALITY_GATE', 'True') == 'True'
+FACE_QUALITY_MIN_SHARPNESS = float(os.environ.get('FACE_QUALITY_MIN_SHARPNESS', '40'))  # Variance of the Laplacian
+FACE_QUALITY_MIN_BRIGHTNESS = float(os.environ.get('FACE_QUALITY_MIN_BRIGHTNESS', '40'))  # Mean luminance, 0-255
+FACE_QUALITY_MAX_BRIGHTNESS = float(os.environ.get('FACE_QUALITY_MAX_BRIGHTNESS', '220'))
+FACE_QUALITY_MIN_CONTRAST = float(os.environ.get('FACE_QUALITY_MIN_CONTRAST', '20'))  # Luminance standard deviation
+
+# Detector used by the validate (preview) actions: 'haar' (bundled with OpenCV), 'res10' (OpenCV DNN SSD,
+# needs deploy.prototxt and res10_300x300_ssd_iter_140000.caffemodel in FACE_FAST_DETECTOR_MODEL_DIR)
+# or '' to use the recognizer's MTCNN
+FACE_FAST_DETECTOR = os.environ.get('FACE_FAST_DETECTOR', 'haar')
+FACE_FAST_DETECTOR_MODEL_DIR = os.environ.get('FACE_FAST_DETECTOR_MODEL_DIR') or None
+FACE_FAST_DETECTOR_MAX_SIDE = int(os.environ.get('FACE_FAST_DETECTOR_MAX_SIDE', '320'))
+
+# Keep up to this many enrollment embeddings per voter (plus their centroid), stored as FACE_TEMPLATE_DTYPE
+FACE_MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', '5'))
+FACE_TEMPLATE_DTYPE = os.environ.get('FACE_TEMPLATE_DTYPE', 'float16')
+
+# Element type of the in-memory search matrix: 'float32', 'float16' or 'int8' (per-vector scaled).
+# Compare the formats on the enrolled faces with `manage.py face_quantization_report`.
+FACE_EMBEDDING_DTYPE = os.environ.get('FACE_EMBEDDING_DTYPE', 'float32')
+
+# Default output dimension of `manage.py fit_face_projection`, which reduces stored and query
+# embeddings (e.g. 2048-d ResNet50 features) with PCA fitted on the enrolled faces
+FACE_PROJECTION_DIM = int(os.environ.get('FACE_PROJECTION_DIM', '256'))
+
+# Each worker applies face enrollments and deletions made by other workers before its next lookup,
+# checking the shared face database for changes at most this often
+FACE_DB_SYNC_INTERVAL_MS = float(os.environ.get('FACE_DB_SYNC_INTERVAL_MS', '250'))
+
+# Face-only login accepts the best match only if it beats the runner-up voter by this cosine similarity
+# margin; weaker or ambiguous matches fall back to voter ID entry. The FACE_IDENTIFY_SHORTLIST best candidates and
+# their gaps to the best match are logged, not returned to the client, as they identify other voters.
+FACE_IDENTIFY_MARGIN = float(os.environ.get('FACE_IDENTIFY_MARGIN', '0.05'))
+# Face-only login searches every enrolled voter, so the best match must also reach this similarity (and at least
+# the single-frame verification gate). Different voters can score about 0.8 against each other.
+FACE_IDENTIFY_MIN_SIMILARITY = float(os.environ.get('FACE_IDENTIFY_MIN_SIMILARITY', '0.85'))
+FACE_IDENTIFY_SHORTLIST = int(os.environ.get('FACE_IDENTIFY_SHORTLIST', '5'))
+
+# Streaming face login: the browser uploads up to FACE_STREAM_MAX_FRAMES downscaled frames as it captures them and
+# the server decides as soon as FACE_STREAM_MIN_FRAMES frames agree (or one frame beats the match threshold
+# by FACE_STREAM_STRONG_MARGIN)
+FACE_STREAM_MAX_FRAMES = int(os.environ.get('FACE_STREAM_MAX_FRAMES', '5'))
+FACE_STREAM_MIN_FRAMES = int(os.environ.get('FACE_STREAM_MIN_FRAMES', '2'))
+FACE_STREAM_STRONG_MARGIN = float(os.environ.get('FACE_STREAM_STRONG_MARGIN', '0.1'))
+
+# Camera frames are downscaled in the browser to this longest side and uploaded as binary JPEG files
+# of this quality (0-1)
+FACE_UPLOAD_MAX_SIDE = int(os.environ.get('FACE_UPLOAD_MAX_SIDE', '640'))
+FACE_UPLOAD_JPEG_QUALITY = float(os.environ.get('FACE_UPLOAD_JPEG_QUALITY', '0.9'))
+
+# On verify, embed the face crop sent by the browser (around the box returned by the last validate call,
+# padded by FACE_ROI_PADDING of the box size on each side) without running MTCNN, if it passes cheap
+# sanity checks. Faces smaller than FACE_ROI_MIN_SIZE pixels go through full detection.
+FACE_ROI_FAST_PATH = os.environ.get('FACE_ROI_FAST_PATH', 'True') == 'True'
+FACE_ROI_MIN_SIZE = int(os.environ.get('FACE_ROI_MIN_SIZE', '40'))
+FACE_ROI_PADDING = float(os.environ.get('FACE_ROI_PADDING', '0.2'))